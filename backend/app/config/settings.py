@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import Any, Dict, List
 import os
 from dotenv import load_dotenv
 
@@ -24,7 +24,178 @@ class Settings(BaseSettings):
     
     # Gemini AI
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
-    
+
+    # "gemini" or "fake" (local stand-in for development and benchmarks, see app/utils/fakes.py)
+    LLM_BACKEND: str = "gemini"
+    FAKE_LLM_LATENCY_MS: float = 300
+    FAKE_LLM_JITTER_MS: float = 100
+    FAKE_LLM_ERROR_RATE: float = 0.0
+    FAKE_LLM_429_RATE: float = 0.0
+    FAKE_LLM_503_RATE: float = 0.0
+
+    # LLM usage accounting: USD per million tokens, and how often per-day usage is written to llm_usage
+    LLM_PRICING: Dict[str, Dict[str, float]] = {
+        "gemini-1.5-flash-8b": {"input": 0.0375, "output": 0.15},
+        "gemini-1.5-flash": {"input": 0.075, "output": 0.30},
+        "gemini-1.5-pro": {"input": 1.25, "output": 5.00},
+        "gemini-pro": {"input": 0.50, "output": 1.50},
+        "gemini-pro-vision": {"input": 0.50, "output": 1.50}
+    }
+    LLM_USAGE_FLUSH_SECONDS: int = 60
+    # Process-wide limit on model calls (requests per second, 0 for unlimited) and burst size
+    LLM_REQUESTS_PER_SECOND: float = 0
+    LLM_BURST: int = 5
+
+    # "firebase" or "fake" (accepts "Bearer fake:<uid>" tokens; never use in production)
+    AUTH_BACKEND: str = "firebase"
+
+    # Item categorization micro-batching
+    CATEGORIZE_BATCH_WINDOW_MS: int = 50
+    CATEGORIZE_BATCH_MAX_ITEMS: int = 200
+
+    # /metrics requires "Authorization: Bearer <METRICS_TOKEN>"; when unset it only answers local clients
+    METRICS_TOKEN: str = ""
+
+    # Local receipt text parser; below this confidence /api/scan/text falls back to the LLM
+    TEXT_PARSER_MIN_CONFIDENCE: float = 0.75
+    # Merchant templates are cached per process; misses expire sooner so templates
+    # learned by other workers are picked up quickly
+    MERCHANT_TEMPLATE_CACHE_TTL_SECONDS: int = 600
+    MERCHANT_TEMPLATE_MISS_TTL_SECONDS: int = 60
+
+    # OCR model tiers, cheapest first. A tier handles receipts up to max_lines estimated text lines.
+    OCR_MODEL_TIERS: List[Dict[str, Any]] = [
+        {"model": "gemini-1.5-flash-8b", "timeout": 15.0, "max_lines": 20},
+        {"model": "gemini-1.5-flash", "timeout": 30.0, "max_lines": 60},
+        {"model": "gemini-1.5-pro", "timeout": 60.0, "max_lines": None}
+    ]
+    # How far the total may exceed the item sum (tax, fees) before escalating to a stronger tier
+    OCR_MAX_TAX_RATIO: float = 0.2
+
+    # Largest receipt image accepted by the scan endpoints
+    UPLOAD_MAX_IMAGE_SIZE: int = 10 * 1024 * 1024  # 10MB
+
+    # How long an image staged by POST /api/scan/stream waits for its event stream to be opened
+    SCAN_STREAM_TTL_SECONDS: int = 300
+    # Staged images are held in memory until claimed, so cap them per user and in total
+    SCAN_STREAM_MAX_PENDING_PER_USER: int = 3
+    SCAN_STREAM_MAX_PENDING_BYTES: int = 64 * 1024 * 1024
+
+    # Batch receipt scanning
+    SCAN_BATCH_MAX_FILES: int = 50
+    SCAN_BATCH_MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
+    SCAN_BATCH_MAX_CONCURRENCY_PER_USER: int = 3
+    # Background jobs hold their images in memory until done, so cap how many a user can have running
+    SCAN_BATCH_MAX_JOBS_PER_USER: int = 2
+
+    # General tip pool, topped up in the background so the tips endpoint never waits on the LLM
+    TIP_POOL_TARGET_PER_CATEGORY: int = 15
+    TIP_POOL_GENERATE_BATCH: int = 10
+    TIP_POOL_REFILL_INTERVAL_SECONDS: int = 1800
+    # Custom category names only get a pool once this many users share them
+    TIP_POOL_MIN_CATEGORY_USERS: int = 5
+    TIP_POOL_MAX_GENERATIONS_PER_RUN: int = 20
+
+    # Nightly spending cohorts: users are clustered by spending mix and each cohort gets one tip set
+    TIP_COHORT_COUNT: int = 8
+    TIP_COHORT_TIPS_PER_COHORT: int = 10
+    TIP_COHORT_WINDOW_DAYS: int = 30
+    TIP_COHORT_RUN_HOUR_UTC: int = 3
+
+    # Tip relevance ranking: hashed feature space size, candidate pool size and cache lifetime
+    TIP_VECTOR_DIMENSIONS: int = 2 ** 18
+    TIP_RANKING_CANDIDATES: int = 500
+    TIP_RANKING_CACHE_TTL_SECONDS: int = 300
+
+    # Near-duplicate tips: estimated Jaccard similarity (over title and content words) at which a
+    # new tip counts as a paraphrase of an existing one, and how many LSH candidates to compare
+    TIP_DUPLICATE_THRESHOLD: float = 0.6
+    TIP_DUPLICATE_MAX_CANDIDATES: int = 200
+
+    # Tip effectiveness: how much a proven tip (score 0-1) is boosted in ranking, and how many
+    # pseudo-reports pull a tip's implementation rate toward its category's
+    TIP_EFFECTIVENESS_WEIGHT: float = 0.3
+    TIP_EFFECTIVENESS_PRIOR_REPORTS: int = 5
+
+    # Budget alerts: thresholds as fractions of a category's monthly limit, how far spend must fall
+    # back below a threshold before it can alert again, and how long budget limits are cached
+    BUDGET_ALERT_THRESHOLDS: List[float] = [0.9, 1.0]
+    BUDGET_ALERT_HYSTERESIS: float = 0.05
+    BUDGET_LIMITS_TTL_SECONDS: int = 300
+
+    # Unread notification counters: how long a count is cached per process and how often the
+    # counters are reconciled against the notifications collection
+    NOTIFICATION_COUNT_CACHE_TTL_SECONDS: int = 15
+    NOTIFICATION_COUNTER_RECONCILE_SECONDS: int = 3600
+
+    # Notification streams (SSE): "local" publishes from the creating process (single worker);
+    # "change_stream" fans out through a MongoDB change stream (multiple workers, needs a replica set)
+    NOTIFICATION_FANOUT: str = "local"
+    NOTIFICATION_STREAM_MAX_PER_USER: int = 5
+    NOTIFICATION_STREAM_QUEUE_SIZE: int = 100
+    NOTIFICATION_STREAM_HEARTBEAT_SECONDS: int = 20
+    NOTIFICATION_STREAM_MAX_SECONDS: int = 300
+    NOTIFICATION_STREAM_RETRY_MS: int = 3000
+
+    # Notification retention: read notifications expire after NOTIFICATION_READ_RETENTION_DAYS, optionally
+    # archived first. Same-type notifications within the digest window are folded into one digest.
+    NOTIFICATION_READ_RETENTION_DAYS: int = 30
+    NOTIFICATION_ARCHIVE_ENABLED: bool = False
+    NOTIFICATION_ARCHIVE_RETENTION_DAYS: int = 365
+    NOTIFICATION_PRUNE_INTERVAL_SECONDS: int = 3600
+    NOTIFICATION_DIGEST_TYPES: List[str] = ["receipt", "tip"]
+    NOTIFICATION_DIGEST_WINDOW_SECONDS: int = 600
+    NOTIFICATION_DIGEST_MAX_ITEMS: int = 10
+
+    # Scheduled budget tips: users active in the window get a tip each run; similar users share one
+    # generation. Users are processed (and checkpointed) in chunks, with bounded generation concurrency.
+    BUDGET_TIP_INTERVAL_SECONDS: int = 7 * 24 * 60 * 60
+    BUDGET_TIP_RUN_HOUR_UTC: int = 15
+    BUDGET_TIP_WINDOW_DAYS: int = 30
+    BUDGET_TIP_CHUNK_USERS: int = 500
+    BUDGET_TIP_CONCURRENCY: int = 4
+    BUDGET_TIP_INSERT_CHUNK: int = 1000
+    BUDGET_TIP_LEASE_SECONDS: int = 600
+
+    # Firebase UIDs allowed to use the admin endpoints
+    ADMIN_UIDS: List[str] = []
+    # System broadcasts: notifications per insert_many and target write rate (0 for unthrottled)
+    BROADCAST_CHUNK_SIZE: int = 1000
+    BROADCAST_WRITES_PER_SECOND: float = 5000
+    # Renewed with every chunk; a running broadcast whose lease lapses is resumed from its checkpoint
+    BROADCAST_LEASE_SECONDS: int = 300
+
+    # Directory served at /static (avatars are stored under its avatars/ subdirectory)
+    STATIC_DIR: str = "static"
+    # Avatar renditions: square WebP sizes in pixels (the largest is the profile's main avatar)
+    AVATAR_SIZES: List[int] = [64, 128, 256]
+    AVATAR_WEBP_QUALITY: int = 80
+    # Avatar URLs change with their content, so browsers and CDNs may cache them this long
+    AVATAR_CACHE_MAX_AGE_SECONDS: int = 31536000
+
+    # Receipt image blob store: content-addressed files under BLOB_DIR, referenced from receipts
+    BLOB_DIR: str = "uploads/blobs"
+    # Re-encode JPEG/PNG uploads as "webp" or "jpeg" when smaller; off by default, as re-encoding
+    # is lossy and the stored images are kept for re-processing
+    BLOB_TRANSCODE_FORMAT: str = ""
+    BLOB_TRANSCODE_QUALITY: int = 80
+    # Blobs no receipt references (e.g. scans never saved) are deleted after this long
+    BLOB_ORPHAN_GRACE_SECONDS: int = 24 * 60 * 60
+    BLOB_GC_INTERVAL_SECONDS: int = 60 * 60
+    BLOB_CACHE_MAX_AGE_SECONDS: int = 31536000
+    # If set (e.g. "/_blobs"), hand blob downloads to nginx with X-Accel-Redirect so it sends them with sendfile
+    BLOB_ACCEL_REDIRECT_PREFIX: str = ""
+    # Receipt image URLs are signed so <img> tags can load them without a Bearer header.
+    # Set URL_SIGNING_KEY when running several workers, or URLs only verify in the worker that signed them.
+    URL_SIGNING_KEY: str = ""
+    RECEIPT_IMAGE_URL_TTL_SECONDS: int = 60 * 60
+
+    # How long a user's merged category view is cached per process (it is also dropped on their category writes)
+    CATEGORY_VIEW_TTL_SECONDS: int = 300
+
+    # How long a user's cached spending profile lives (it is also dropped on any receipt write)
+    SPENDING_PROFILE_TTL_SECONDS: int = 600
+
     # CORS
     CORS_ORIGINS: List[str] = [
         "http://localhost:3000",
@@ -0,0 +1,50 @@
+# app/controllers/admin_controller.py
+from fastapi import APIRouter, Depends, HTTPException, status
+from app.config.settings import settings
+from app.models.notifications_model import BroadcastCreate, BroadcastResponse
+from app.services.broadcast_service import get_broadcast, start_broadcast
+from app.services.firebase_service import get_user_id_from_token
+
+router = APIRouter()
+
+async def require_admin(user_id: str = Depends(get_user_id_from_token)) -> str:
+    # Only users listed in ADMIN_UIDS may use the admin endpoints
+    if user_id not in settings.ADMIN_UIDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return user_id
+
+@router.post("/broadcasts", response_model=BroadcastResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_broadcast(
+    broadcast: BroadcastCreate,
+    admin_id: str = Depends(require_admin)
+):
+    """
+    Send a system notification to every user. Runs in the background; poll
+    GET /api/admin/broadcasts/{id} for progress.
+    """
+    try:
+        return await start_broadcast(admin_id, broadcast.title, broadcast.message, broadcast.link)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error starting broadcast: {str(e)}"
+        )
+
+@router.get("/broadcasts/{broadcast_id}", response_model=BroadcastResponse)
+async def get_broadcast_progress(
+    broadcast_id: str,
+    admin_id: str = Depends(require_admin)
+):
+    """
+    Get a broadcast's progress
+    """
+    broadcast = await get_broadcast(broadcast_id)
+    if broadcast is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Broadcast not found"
+        )
+    return broadcast
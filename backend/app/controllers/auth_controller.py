@@ -6,6 +6,7 @@ import firebase_admin
 from firebase_admin import auth, credentials
 from app.models.user_model import UserCreate, UserResponse
 from app.services.user_service import create_user_profile
+from app.services.firebase_service import verify_id_token, get_firebase_user
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -64,9 +65,9 @@ async def verify_token(token: str = Depends(oauth2_scheme)):
     Verify Firebase ID token and return user information
     """
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         uid = decoded_token['uid']
-        user = auth.get_user(uid)
+        user = get_firebase_user(uid)
         
         return {
             "uid": user.uid,
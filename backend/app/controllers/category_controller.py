@@ -1,21 +1,31 @@
 # app/controllers/category_controller.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from typing import List, Optional
 from app.models.category_model import Category, CategoryCreate
-from app.services.category_service import get_all_categories, create_category, update_category, delete_category
+from app.services.category_service import get_category_view, create_category, update_category, delete_category
 from app.controllers.auth_controller import verify_token
 
 router = APIRouter()
 
 @router.get("/", response_model=List[Category])
 async def get_categories(
+    request: Request,
+    response: Response,
     user_id: str = Depends(verify_token),
     system_categories: bool = True
 ):
 
     # Get all categories (system default + user custom)
     try:
-        categories = await get_all_categories(user_id["uid"], include_system=system_categories)
+        version, categories = await get_category_view(user_id["uid"], include_system=system_categories)
+        
+        # Clients revalidate with If-None-Match and get a 304 while their categories are unchanged
+        etag = f'"{version}"'
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        
+        response.headers.update(headers)
         return categories
     except Exception as e:
         raise HTTPException(
@@ -1,11 +1,13 @@
 # app/controllers/receipt_controller.py
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request, status
 from typing import List, Optional
 import os
 from datetime import datetime
 from bson import ObjectId
 from app.models.receipt_model import ReceiptCreate, ReceiptResponse, ReceiptItem
-from app.services.receipt_service import save_receipt, get_receipt, get_user_receipts, delete_receipt, update_receipt
+from app.services.receipt_service import save_receipt, get_receipt, get_user_receipts, delete_receipt, update_receipt, get_receipt_image, receipt_image_path
+from app.services.blob_store import blob_response
+from app.utils.signed_urls import verify_path
 from app.services.ai_service import extract_text_from_image, categorize_items
 from app.middleware.auth_middleware import get_current_user
 
@@ -94,6 +96,40 @@ async def get_receipt_detail(receipt_id: str, user_id: dict = Depends(get_curren
             detail=f"Error fetching receipt: {str(e)}"
         )
 
+@router.get("/{receipt_id}/image")
+async def get_receipt_image_file(
+    receipt_id: str,
+    request: Request,
+    expires: Optional[int] = None,
+    signature: Optional[str] = None
+):
+    """
+    Download a receipt's stored image through the signed URL returned as the
+    receipt's image_url, so it works from an <img> tag without a Bearer header.
+    Supports Range requests, and If-None-Match against the image's content hash.
+    """
+    if not verify_path(receipt_image_path(receipt_id), expires, signature):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired image link"
+        )
+    
+    try:
+        blob = await get_receipt_image(receipt_id)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error fetching receipt image: {str(e)}"
+        )
+    
+    if not blob:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Receipt image not found"
+        )
+    
+    return blob_response(blob, request.headers)
+
 @router.get("/", response_model=List[ReceiptResponse])
 async def list_receipts(
     user_id: dict = Depends(get_current_user),
@@ -1,12 +1,17 @@
 # app/controllers/scan_controller.py
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, status
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from typing import List
-import os
-import shutil
 from app.services.firebase_service import get_user_id_from_token
 from app.services.ocr_service import process_receipt_image
+from app.services.ocr_stream import TooManyPendingScans, stage_scan, claim_scan, stream_receipt_image
+from app.services.blob_store import put_bytes
+from app.services.scan_batch_service import TooManyBatchJobs, scan_batch, start_batch_job, get_batch_job
+from app.services.receipt_text_parser import parse_receipt_text_fast, learn_merchant_template
+from app.services.llm_service import generate, record_cache_hit, record_parse_failure
+from app.config.settings import settings
 from app.models.receipt_model import ProcessedReceiptResponse
-import uuid
+from app.utils.uploads import SCAN_IMAGE_TYPES, read_image_upload, read_image_body
 
 router = APIRouter()
 
@@ -18,45 +23,48 @@ async def scan_receipt(
     """
     Scan and process a receipt image
     """
+    # Read the upload straight into memory, rejecting oversized or non-image files early
+    image_bytes, mime_type = await read_image_upload(file, settings.UPLOAD_MAX_IMAGE_SIZE, SCAN_IMAGE_TYPES)
+    return await _process_uploaded_receipt(image_bytes, mime_type)
+
+@router.post("/receipt-binary", response_model=ProcessedReceiptResponse)
+async def scan_receipt_binary(
+    request: Request,
+    user_id: str = Depends(get_user_id_from_token)
+):
+    """
+    Scan and process a receipt sent as the raw request body (e.g. Content-Type: image/jpeg),
+    avoiding the multipart and base64 overhead
+    """
+    image_bytes, mime_type = await read_image_body(request, settings.UPLOAD_MAX_IMAGE_SIZE, SCAN_IMAGE_TYPES)
+    return await _process_uploaded_receipt(image_bytes, mime_type)
+
+async def _process_uploaded_receipt(image_bytes: memoryview, mime_type: str) -> ProcessedReceiptResponse:
     try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
+        # Process receipt image using OCR and AI
+        receipt_data = await process_receipt_image(image_bytes, mime_type=mime_type)
+        
+        if "error" in receipt_data:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="File must be an image"
+                detail=f"Could not process receipt: {receipt_data['error']}"
             )
         
-        # Generate unique filename
-        file_extension = os.path.splitext(file.filename)[1]
-        filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = f"uploads/{filename}"
-        
-        # Save uploaded file
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
+        # Keep the image so the saved receipt can reference it; unsaved scans are garbage collected
         try:
-            # Process receipt image using OCR and AI
-            receipt_data = await process_receipt_image(file_path, is_base64=False)
-            
-            if "error" in receipt_data:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Could not process receipt: {receipt_data['error']}"
-                )
-            
-            # Return the processed receipt data
-            return ProcessedReceiptResponse(
-                extracted_text=str(receipt_data),
-                processed_data=receipt_data,
-                image_path=file_path
-            )
-            
-        finally:
-            # Clean up uploaded file
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                
+            image_path = (await put_bytes(image_bytes))["id"]
+        except Exception as e:
+            print(f"Warning: could not store receipt image: {str(e)}")
+            image_path = ""
+        
+        # Return the processed receipt data
+        return ProcessedReceiptResponse(
+            extracted_text=str(receipt_data),
+            processed_data=receipt_data,
+            image_path=image_path
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -78,10 +86,17 @@ async def process_receipt_text_endpoint(
                 detail="Text cannot be empty"
             )
         
-        # Process the text with AI using Gemini text model
-        import google.generativeai as genai
-        text_model = genai.GenerativeModel('gemini-pro')
+        # Try the local parser first; well-structured receipts never reach the LLM
+        parsed_receipt, confidence = await parse_receipt_text_fast(text)
+        if confidence >= settings.TEXT_PARSER_MIN_CONFIDENCE:
+            record_cache_hit("scan_text")
+            return {
+                "processed_data": parsed_receipt,
+                "parser": "local",
+                "confidence": confidence
+            }
         
+        # Process the text with AI using Gemini text model
         prompt = f"""
         Analyze this receipt text and extract the following information:
         1. Store name
@@ -103,7 +118,7 @@ async def process_receipt_text_endpoint(
         }}
         """
         
-        response = text_model.generate_content(prompt)
+        response = await generate("scan_text", "gemini-pro", prompt)
         import json
         result_text = response.text
         if '```json' in result_text:
@@ -111,10 +126,22 @@ async def process_receipt_text_endpoint(
         elif '```' in result_text:
             result_text = result_text.split('```')[1].split('```')[0].strip()
         
-        processed_receipt = json.loads(result_text)
+        try:
+            processed_receipt = json.loads(result_text)
+        except ValueError:
+            record_parse_failure("scan_text", "gemini-pro")
+            raise
+        
+        # Remember this merchant's layout so its next receipt parses locally
+        try:
+            await learn_merchant_template(text, processed_receipt)
+        except Exception as e:
+            print(f"Warning: could not learn merchant template: {str(e)}")
         
         return {
-            "processed_data": processed_receipt
+            "processed_data": processed_receipt,
+            "parser": "llm",
+            "confidence": confidence
         }
         
     except Exception as e:
@@ -129,7 +156,8 @@ async def scan_receipt_base64(
     user_id: str = Depends(get_user_id_from_token)
 ):
     """
-    Scan and process a receipt from base64 image data
+    Scan and process a receipt from base64 image data.
+    Prefer /receipt-binary, which avoids the base64 and JSON overhead.
     """
     try:
         base64_image = image_data.get("image_data")
@@ -176,3 +204,107 @@ async def scan_receipt_base64(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An unexpected error occurred while processing the receipt. Please try again."
         )
+
+@router.post("/stream")
+async def stage_streaming_scan(
+    file: UploadFile = File(...),
+    user_id: str = Depends(get_user_id_from_token)
+):
+    """
+    Upload a receipt image for a streaming scan. Open the returned stream_url
+    (GET /api/scan/stream) to receive results as Server-Sent Events; it needs
+    no Authorization header, so an EventSource can open it.
+    """
+    image_bytes, mime_type = await read_image_upload(file, settings.UPLOAD_MAX_IMAGE_SIZE, SCAN_IMAGE_TYPES)
+    try:
+        scan_id = stage_scan(user_id, image_bytes, mime_type)
+    except TooManyPendingScans as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+    return {
+        "scan_id": scan_id,
+        "stream_url": f"/api/scan/stream?scan_id={scan_id}"
+    }
+
+@router.get("/stream")
+async def stream_scan(
+    request: Request,
+    scan_id: str = Query(...)
+):
+    """
+    Stream a staged receipt scan as Server-Sent Events: store name, date and
+    each item as soon as they are parsed, then a final validated result.
+    The single-use scan id from POST /api/scan/stream authorises the request.
+    """
+    scan = claim_scan(scan_id)
+    if scan is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Scan not found or expired"
+        )
+    
+    return StreamingResponse(
+        stream_receipt_image(*scan, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/batch")
+async def scan_receipt_batch(
+    files: List[UploadFile] = File(...),
+    auto_save: bool = Form(False),
+    background: bool = Form(False),
+    user_id: str = Depends(get_user_id_from_token)
+):
+    """
+    Scan several receipt images concurrently. Returns per-image results, or a
+    job id to poll when background is set. With auto_save, successfully scanned
+    receipts are saved in one batch.
+    """
+    if len(files) > settings.SCAN_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"A batch can contain at most {settings.SCAN_BATCH_MAX_FILES} images"
+        )
+    
+    images = []
+    for file in files:
+        image_bytes, mime_type = await read_image_upload(file, settings.SCAN_BATCH_MAX_FILE_SIZE, SCAN_IMAGE_TYPES)
+        images.append((file.filename, image_bytes, mime_type))
+    
+    try:
+        if background:
+            job_id = start_batch_job(user_id, images, auto_save)
+            return {"job_id": job_id, "status": "processing", "total": len(images)}
+        
+        results = await scan_batch(user_id, images, auto_save)
+        return {"status": "completed", "total": len(images), "results": results}
+    except TooManyBatchJobs as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing receipt batch: {str(e)}"
+        )
+
+@router.get("/batch/{job_id}")
+async def get_receipt_batch(
+    job_id: str,
+    user_id: str = Depends(get_user_id_from_token)
+):
+    """
+    Get the progress and results of a background batch scan
+    """
+    job = get_batch_job(job_id, user_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch job not found"
+        )
+    return job
+
@@ -2,7 +2,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import Optional
 from app.models.settings_model import UserSettings, NotificationSettings
-from app.services.settings_service import get_user_settings, update_user_settings
+from app.services.settings_service import get_or_create_user_settings, update_user_settings
 from app.controllers.auth_controller import verify_token
 
 router = APIRouter()
@@ -12,22 +12,8 @@ async def get_settings(user_id: str = Depends(verify_token)):
 
     # Get user settings
     try:
-        settings = await get_user_settings(user_id["uid"])
-        if not settings:
-            # Initialize default settings if not found
-            settings = {
-                "user_id": user_id["uid"],
-                "theme": "light",
-                "currency": "USD",
-                "budget_limits": {},
-                "notifications": {
-                    "email": True,
-                    "push": False,
-                    "budget_alerts": True
-                }
-            }
-            await update_user_settings(user_id["uid"], settings)
-        
+        # Stores the default settings on first use
+        settings = await get_or_create_user_settings(user_id["uid"])
         return settings
     except Exception as e:
         raise HTTPException(
@@ -44,12 +30,6 @@ async def update_settings(
     # Update user settings
     try:
         updated_settings = await update_user_settings(user_id["uid"], settings_update)
-        if not updated_settings:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Settings not found"
-            )
-        
         return updated_settings
     except Exception as e:
         raise HTTPException(
@@ -65,16 +45,10 @@ async def update_notification_settings(
 
     # Update notification settings
     try:
-        current_settings = await get_user_settings(user_id["uid"])
-        if not current_settings:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="User settings not found"
-            )
-        
-        # Update only notification settings
-        current_settings["notifications"] = notification_settings.dict()
-        updated_settings = await update_user_settings(user_id["uid"], current_settings)
+        # Update only the notification fields, leaving the rest of the settings untouched
+        updated_settings = await update_user_settings(user_id["uid"], {
+            f"notifications.{key}": value for key, value in notification_settings.dict().items()
+        })
         
         return updated_settings["notifications"]
     except Exception as e:
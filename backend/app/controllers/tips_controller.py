@@ -1,8 +1,9 @@
 # app/controllers/tips_controller.py
 from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
-from app.models.tip_model import TipResponse
+from app.models.tip_model import TipEffectivenessReport, TipEffectivenessResponse, TipResponse
 from app.services.tip_service import get_general_tips, get_personalized_tips
+from app.services.tip_effectiveness_service import record_tip_effectiveness
 from app.controllers.auth_controller import verify_token
 
 router = APIRouter()
@@ -12,21 +13,43 @@ async def get_tips(
     user_id: str = Depends(verify_token),
     category: Optional[str] = None,
     personalized: bool = False,
-    limit: int = 5
+    limit: int = 5,
+    refresh: bool = False
 ):
 
     # Get money-saving tips, either general or personalized based on spending patterns
     try:
         if personalized:
-            # Get personalized tips based on user's spending patterns
-            tips = await get_personalized_tips(user_id["uid"], category, limit)
+            # Get personalized tips based on user's spending patterns; refresh asks the LLM for new ones
+            tips = await get_personalized_tips(user_id["uid"], category, limit, refresh)
         else:
-            # Get general money-saving tips
-            tips = await get_general_tips(category, limit)
+            # Get general money-saving tips, ordered by relevance to the user's spending
+            tips = await get_general_tips(category, limit, user_id=user_id["uid"])
         
         return tips
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error fetching tips: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@router.post("/{tip_id}/effectiveness", response_model=TipEffectivenessResponse)
+async def report_tip_effectiveness(
+    tip_id: str,
+    report: TipEffectivenessReport,
+    user_id: str = Depends(verify_token)
+):
+
+    # Report whether a tip was put into practice and what it saved
+    try:
+        return await record_tip_effectiveness(user_id["uid"], tip_id, report.implemented, report.savings)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error recording tip effectiveness: {str(e)}"
+        )
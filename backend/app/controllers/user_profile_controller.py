@@ -1,11 +1,13 @@
 # app/controllers/profile_controller.py
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from typing import Optional
-import os
-import base64
+from PIL import Image
 from app.models.user_model import UserProfile, UserProfileUpdate
 from app.services.user_service import get_user_profile, update_user_profile, create_user_profile
+from pymongo.errors import DuplicateKeyError
+from app.services.avatar_service import store_avatar
 from app.services.firebase_service import get_user_id_from_token
+from app.utils.uploads import read_image_upload
 
 router = APIRouter()
 
@@ -42,23 +44,20 @@ async def create_profile(
 ):
     # Create a new user profile
     try:
-        # Check if profile already exists
-        existing_profile = await get_user_profile(user_id)
-        if existing_profile:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="User profile already exists"
-            )
-        
         # Prepare profile data
         profile_dict = profile_data.dict(exclude_unset=True)
         profile_dict["firebase_uid"] = user_id
         
-        # Create the profile
+        # Create the profile; the unique index on firebase_uid rejects a second one
         created_profile = await create_user_profile(profile_dict)
         
         return created_profile
         
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User profile already exists"
+        )
     except HTTPException:
         # Re-raise HTTP exceptions without modification
         raise
@@ -74,32 +73,14 @@ async def update_profile(
     user_id: str = Depends(get_user_id_from_token)
 ):
 
-    # Update user profile information
+    # Update user profile information, creating the profile if it doesn't exist yet
     try:
-        # Check if profile exists
-        existing_profile = await get_user_profile(user_id)
+        update_data = profile_update.dict(exclude_unset=True)
+        if "avatar" in update_data:
+            # A directly set avatar URL has no stored thumbnails
+            update_data["avatar_thumbnails"] = None
         
-        if not existing_profile:
-            # Profile doesn't exist, create it
-            profile_dict = profile_update.dict(exclude_unset=True)
-            profile_dict["firebase_uid"] = user_id
-            
-            created_profile = await create_user_profile(profile_dict)
-            return created_profile
-        else:
-            # Profile exists, update it
-            updated_profile = await update_user_profile(user_id, profile_update.dict(exclude_unset=True))
-            if not updated_profile:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="User profile not found"
-                )
-            
-            return updated_profile
-            
-    except HTTPException:
-        # Re-raise HTTP exceptions without modification
-        raise
+        return await update_user_profile(user_id, update_data, upsert=True)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -111,46 +92,26 @@ async def upload_avatar(
     file: UploadFile = File(...),
     user_id: str = Depends(get_user_id_from_token)
 ):
-    """Upload user avatar image and store as base64 in MongoDB"""
-    
-    # Validate image format
-    allowed_extensions = ["jpg", "jpeg", "png", "gif", "webp"]
-    file_ext = file.filename.split(".")[-1].lower() if file.filename else ""
-    
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Avatar must be one of {', '.join(allowed_extensions)}"
-        )
+    """Upload user avatar image to the avatar store and save its URLs on the profile"""
     
-    # Validate file size (limit to 5MB)
+    # Stream the upload, rejecting it as soon as it passes 5MB or isn't an image
     MAX_SIZE = 5 * 1024 * 1024  # 5MB
-    file_content = await file.read()
-    if len(file_content) > MAX_SIZE:
+    file_content, mime_type = await read_image_upload(
+        file, MAX_SIZE, allowed_types={"image/jpeg", "image/png", "image/gif", "image/webp"}
+    )
+    
+    try:
+        # Render WebP thumbnails keyed by content hash; the profile only keeps their URLs
+        avatar_fields = await store_avatar(file_content)
+    except (OSError, Image.DecompressionBombError) as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Avatar file size must be less than 5MB"
+            detail=f"Could not read avatar image: {str(e)}"
         )
     
     try:
-        # Convert image to base64
-        base64_encoded = base64.b64encode(file_content).decode('utf-8')
-        
-        # Get MIME type from file extension
-        mime_types = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'webp': 'image/webp'
-        }
-        mime_type = mime_types.get(file_ext, 'image/jpeg')
-        
-        # Create data URL for storage
-        avatar_data_url = f"data:{mime_type};base64,{base64_encoded}"
-        
-        # Update user profile with avatar data
-        updated_profile = await update_user_profile(user_id, {"avatar": avatar_data_url})
+        # Update user profile with avatar URLs
+        updated_profile = await update_user_profile(user_id, avatar_fields)
         if not updated_profile:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -158,6 +119,8 @@ async def upload_avatar(
             )
         
         return updated_profile
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -166,7 +129,7 @@ async def upload_avatar(
 
 @router.get("/avatar")
 async def get_avatar(user_id: str = Depends(get_user_id_from_token)):
-    """Get user avatar as base64 data URL"""
+    """Get the URLs of the user's avatar and its thumbnails"""
     
     try:
         profile = await get_user_profile(user_id)
@@ -176,13 +139,13 @@ async def get_avatar(user_id: str = Depends(get_user_id_from_token)):
                 detail="User profile not found"
             )
         
-        if not profile.avatar:
+        if not profile.get("avatar"):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User has no avatar"
             )
         
-        return {"avatar": profile.avatar}
+        return {"avatar": profile["avatar"], "avatar_thumbnails": profile.get("avatar_thumbnails")}
     except HTTPException:
         # Re-raise HTTP exceptions
         raise
@@ -1,11 +1,29 @@
 # app/main.py
-from fastapi import FastAPI, Request
+import hmac
+import os
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime
 from app.config.settings import settings
 from app.routes.api import api_router
 from app.config.mongodb import connect_to_mongo, close_mongo_connection
+from app.services.llm_service import flush_usage
+from app.services.notification_hub import notification_hub
+from app.services.notification_service import ensure_notification_indexes, prune_notifications, reconcile_unread_counts
+from app.services.blob_store import collect_garbage, ensure_blob_indexes
+from app.services.broadcast_service import resume_broadcasts
+from app.services.budget_alert_service import ensure_budget_state_indexes
+from app.services.budget_tip_service import ensure_budget_tip_indexes, send_budget_tips
+from app.services.receipt_service import ensure_receipt_indexes
+from app.services.settings_service import ensure_settings_indexes
+from app.services.tip_service import ensure_tip_indexes, refill_tip_pool
+from app.services.tip_cohort_service import ensure_tip_cohort_indexes, refresh_tip_cohorts
+from app.services.tip_effectiveness_service import ensure_tip_effectiveness_indexes
+from app.services.user_service import ensure_user_indexes
+from app.utils.metrics import metrics
+from app.utils.scheduler import scheduler, seconds_until_hour
+from app.utils.static_files import ImmutableStaticFiles
 
 # Create FastAPI app
 app = FastAPI(title="BudgetTracker API", version="1.0.0")
@@ -22,14 +40,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mount static files directory for avatars and other assets
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Avatars are content-addressed, so they can be cached forever; mounted before /static so it takes precedence
+os.makedirs(os.path.join(settings.STATIC_DIR, "avatars"), exist_ok=True)
+app.mount("/static/avatars", ImmutableStaticFiles(directory=os.path.join(settings.STATIC_DIR, "avatars"),
+                                                  max_age=settings.AVATAR_CACHE_MAX_AGE_SECONDS), name="avatars")
+# Mount static files directory for other assets
+app.mount("/static", StaticFiles(directory=settings.STATIC_DIR), name="static")
 
 # Include API routes
 app.include_router(api_router, prefix="/api")
 
+# Background jobs, started once the database is connected
+scheduler.add_job("tip_pool_refill", refill_tip_pool, settings.TIP_POOL_REFILL_INTERVAL_SECONDS)
+scheduler.add_job("tip_cohort_refresh", refresh_tip_cohorts, 24 * 60 * 60,
+                  initial_delay=seconds_until_hour(settings.TIP_COHORT_RUN_HOUR_UTC))
+scheduler.add_job("notification_counter_reconcile", reconcile_unread_counts,
+                  settings.NOTIFICATION_COUNTER_RECONCILE_SECONDS,
+                  initial_delay=settings.NOTIFICATION_COUNTER_RECONCILE_SECONDS)
+scheduler.add_job("notification_prune", prune_notifications, settings.NOTIFICATION_PRUNE_INTERVAL_SECONDS)
+scheduler.add_job("blob_gc", collect_garbage, settings.BLOB_GC_INTERVAL_SECONDS,
+                  initial_delay=settings.BLOB_GC_INTERVAL_SECONDS)
+# Runs at startup too, picking up broadcasts a restart interrupted
+scheduler.add_job("broadcast_resume", resume_broadcasts, settings.BROADCAST_LEASE_SECONDS)
+# Attempted daily so restarts don't delay it; send_budget_tips spaces the actual runs
+scheduler.add_job("budget_tips", send_budget_tips, 24 * 60 * 60,
+                  initial_delay=seconds_until_hour(settings.BUDGET_TIP_RUN_HOUR_UTC))
+
+async def start_background_jobs():
+    for ensure_indexes in (ensure_receipt_indexes, ensure_tip_indexes, ensure_tip_cohort_indexes,
+                           ensure_tip_effectiveness_indexes, ensure_budget_state_indexes, ensure_notification_indexes,
+                           ensure_budget_tip_indexes, ensure_blob_indexes, ensure_user_indexes, ensure_settings_indexes):
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            print(f"Warning: could not create indexes ({ensure_indexes.__name__}): {str(e)}")
+    scheduler.start()
+    notification_hub.start()
+
 # Add database connection event handlers
 app.add_event_handler("startup", connect_to_mongo)
+app.add_event_handler("startup", start_background_jobs)
+app.add_event_handler("shutdown", scheduler.stop)
+# Stop the change stream watcher and end any notification streams still open
+app.add_event_handler("shutdown", notification_hub.stop)
+# Write out buffered LLM usage before the connection closes
+app.add_event_handler("shutdown", flush_usage)
 app.add_event_handler("shutdown", close_mongo_connection)
 
 # Health check endpoint
@@ -44,4 +99,20 @@ async def cors_test():
         "message": "CORS is working", 
         "cors_origins": settings.CORS_ORIGINS,
         "timestamp": datetime.now().isoformat()
-    }
\ No newline at end of file
+    }
+
+# In-process metrics endpoint
+LOCAL_CLIENTS = {"127.0.0.1", "::1", "localhost"}
+
+def _metrics_allowed(request: Request) -> bool:
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        return hmac.compare_digest(authorization.encode(), f"Bearer {settings.METRICS_TOKEN}".encode())
+    # No token configured: only scrapers on the same host
+    return request.client is not None and request.client.host in LOCAL_CLIENTS
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    if not _metrics_allowed(request):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return metrics.snapshot()
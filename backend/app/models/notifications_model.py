@@ -47,4 +47,24 @@ class NotificationResponse(BaseModel):
     link: Optional[str] = None
     image_url: Optional[str] = None
     is_read: bool
-    created_at: datetime
\ No newline at end of file
+    created_at: datetime
+    digest_count: int = 1
+
+class BroadcastCreate(BaseModel):
+    title: str = Field(..., min_length=1, max_length=200)
+    message: str = Field(..., min_length=1, max_length=2000)
+    link: Optional[str] = None
+
+class BroadcastResponse(BaseModel):
+    id: str
+    title: str
+    message: str
+    link: Optional[str] = None
+    created_by: str
+    status: Literal["running", "completed", "failed"]
+    total: int
+    sent: int
+    progress: float
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
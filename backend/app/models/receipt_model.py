@@ -43,6 +43,8 @@ class ReceiptCreate(BaseModel):
     store_name: Optional[str] = None
     items: List[ReceiptItem]
     image_url: str
+    # Blob id of the scanned image (ProcessedReceiptResponse.image_path), stored with the receipt
+    image_blob: Optional[str] = None
     is_shared: bool = False
     shared_expenses: List[SharedExpense] = []
 
@@ -62,6 +64,8 @@ class ReceiptResponse(BaseModel):
     items: Optional[List[ReceiptItem]] = None
     total_amount: Optional[float] = None
     image_path: Optional[str] = None
+    # Inline data URL, or a short-lived signed link to the stored image
+    image_url: Optional[str] = None
     shared_with: Optional[List[str]] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
@@ -53,4 +53,16 @@ class TipInDB(TipBase):
         json_encoders = {
             ObjectId: lambda v: str(v)
         }
-        populate_by_name = True
\ No newline at end of file
+        populate_by_name = True
+
+class TipEffectivenessReport(BaseModel):
+    implemented: bool
+    savings: float = Field(default=0.0, ge=0)
+
+class TipEffectivenessResponse(BaseModel):
+    tip_id: str
+    reports: int
+    implemented: int
+    implementation_rate: float
+    total_savings: float
+    average_savings: float
@@ -22,6 +22,8 @@ class UserProfile(BaseModel):
     last_name: Optional[str] = None
     display_name: Optional[str] = None
     avatar: Optional[str] = None
+    # Avatar thumbnail URLs keyed by size in pixels
+    avatar_thumbnails: Optional[Dict[str, str]] = None
     monthly_budget: Optional[float] = None
     created_at: Optional[datetime] = None
     updated_at: Optional[datetime] = None
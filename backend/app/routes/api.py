@@ -9,7 +9,8 @@ from app.controllers import (
     tips_controller,
     settings_controller,
     scan_controller,
-    dashboard_controller
+    dashboard_controller,
+    admin_controller
 )
 from . import notifications
 
@@ -75,4 +76,10 @@ api_router.include_router(
     dashboard_controller.router,
     prefix="/dashboard",
     tags=["Dashboard"]
-)
\ No newline at end of file
+)
+
+api_router.include_router(
+    admin_controller.router,
+    prefix="/admin",
+    tags=["Admin"]
+)
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request
+from fastapi.responses import StreamingResponse
 from typing import List
 from ..services.notification_service import (
     get_user_notifications, 
@@ -6,6 +7,7 @@ from ..services.notification_service import (
     mark_all_notifications_read,
     get_notification_count
 )
+from ..services.notification_hub import TooManyStreams, notification_hub, open_notification_stream
 from ..models.notifications_model import NotificationResponse
 from ..services.firebase_service import get_user_id_from_token
 
@@ -48,6 +50,27 @@ async def get_unread_notification_count(
             detail=f"Failed to get notification count: {str(e)}"
         )
 
+@router.get("/stream")
+async def stream_user_notifications(
+    request: Request,
+    firebase_uid: str = Depends(get_user_id_from_token)
+):
+    # Push new notifications and the unread count as Server-Sent Events instead of polling
+    try:
+        notification_hub.check_capacity(firebase_uid)
+    except TooManyStreams as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e)
+        )
+    
+    # Subscribes when the body starts streaming, so a client gone before then can't leak a stream slot
+    return StreamingResponse(
+        open_notification_stream(firebase_uid, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.put("/{notification_id}/read")
 async def mark_notification_read(
     notification_id: str = Path(..., title="Notification ID"),
@@ -1,6 +1,5 @@
 # app/services/ai_service.py
 import os
-import google.generativeai as genai
 from PIL import Image
 import re
 from dotenv import load_dotenv
@@ -8,14 +7,16 @@ from typing import List, Dict, Optional
 from app.models.receipt_model import ReceiptItem
 from datetime import datetime, timedelta
 from app.config.mongodb import get_database
+from app.services.categorization_batcher import categorization_batcher
+from app.services.llm_service import generate, get_generative_model
+from app.services.spending_profile_service import get_spending_profile
+from app.services.tip_effectiveness_service import record_tip_effectiveness
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-pro-vision')
-text_model = genai.GenerativeModel('gemini-pro')
+model = get_generative_model('gemini-pro-vision')
+text_model = get_generative_model('gemini-pro')
 
 ALLOWED_IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/jpg'}
 MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
@@ -56,7 +57,7 @@ async def extract_text_from_image(image_path: str) -> str:
         """
         
         # Generate content with Gemini
-        response = model.generate_content([prompt, img])
+        response = await generate("extract_text", 'gemini-pro-vision', [prompt, img])
         return response.text
     except Exception as e:
         raise Exception(f"Error extracting text from image: {str(e)}")
@@ -86,31 +87,9 @@ async def categorize_items(items_text: str, user_id: str = None) -> List[Receipt
         if not extracted_items:
             raise Exception("Failed to extract any items from the receipt")
         
-        # Prepare items for categorization
-        items_for_categorization = "\n".join([f"{item[0]}" for item in extracted_items])
-        categories_list = "\n".join([f"- {cat}" for cat in available_categories])
-        
-        # Prepare prompt for categorization
-        categorize_prompt = f"""
-        Please categorize these items into the following available categories:
-        {categories_list}
-        
-        For each item, choose the most appropriate category from the list above.
-        If an item doesn't fit well into any category, use "Miscellaneous".
-        
-        Format the output as a list with each item on a new line in this format:
-        - Item name: Category
-        
-        Here are the items to categorize:
-        {items_for_categorization}
-        """
-        
-        # Generate categorization with Gemini
-        category_response = text_model.generate_content(categorize_prompt)
-        
-        # Extract categorizations
-        category_pattern = r"- (.*?): ([\w\s&]+)"
-        categorizations = dict(re.findall(category_pattern, category_response.text))
+        # Categorize through the shared batcher so concurrent scans share one LLM call
+        item_names = [item[0].strip() for item in extracted_items]
+        categorizations = await categorization_batcher.categorize(item_names, available_categories)
         
         # Create receipt items with categories
         receipt_items = []
@@ -134,23 +113,9 @@ async def categorize_items(items_text: str, user_id: str = None) -> List[Receipt
 async def generate_saving_tips(user_id: str) -> List[Dict]:
     # Generate personalized saving tips based on user's spending patterns.
     try:
-        db = await get_database()
-        
-        # Get user's recent spending data
-        thirty_days_ago = datetime.now() - timedelta(days=30)
-        receipts = await db.receipts.find({
-            "user_id": user_id,
-            "date": {"$gte": thirty_days_ago}
-        }).to_list(length=None)
-        
-        # Analyze spending patterns
-        category_spending = {}
-        for receipt in receipts:
-            for item in receipt["items"]:
-                category = item["category"]
-                if category not in category_spending:
-                    category_spending[category] = 0
-                category_spending[category] += item["price"]
+        # Get user's spending patterns over the last 30 days
+        profile = await get_spending_profile(user_id, days=30)
+        category_spending = profile["spending_by_category"]
         
         # Prepare data for AI analysis
         spending_analysis = "\n".join([
@@ -176,7 +141,7 @@ async def generate_saving_tips(user_id: str) -> List[Dict]:
         - action_items: list of specific actions to take
         """
         
-        response = text_model.generate_content(tips_prompt)
+        response = await generate("saving_tips", 'gemini-pro', tips_prompt)
         
         # Parse the response into structured tips
         tips = []
@@ -195,13 +160,6 @@ async def generate_saving_tips(user_id: str) -> List[Dict]:
 async def track_tip_effectiveness(user_id: str, tip_id: str, implemented: bool, savings: float):
     # Track the effectiveness of implemented tips.
     try:
-        db = await get_database()
-        await db.tip_effectiveness.insert_one({
-            "user_id": user_id,
-            "tip_id": tip_id,
-            "implemented": implemented,
-            "savings": savings,
-            "date": datetime.now()
-        })
+        await record_tip_effectiveness(user_id, tip_id, implemented, savings)
     except Exception as e:
         raise Exception(f"Error tracking tip effectiveness: {str(e)}")
\ No newline at end of file
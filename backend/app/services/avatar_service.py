@@ -0,0 +1,113 @@
+# app/services/avatar_service.py
+import asyncio
+import hashlib
+import io
+import os
+import tempfile
+from typing import Dict
+from PIL import Image, ImageOps
+from app.config.settings import settings
+from app.utils.uploads import decode_data_url
+
+def avatar_paths(content_hash: str) -> Dict[int, str]:
+    """
+    Relative paths (under the served static directory) of each avatar rendition.
+
+    Files are sharded by the first two hex digits of the hash so no single
+    directory grows unbounded.
+    """
+    return {
+        size: f"avatars/{content_hash[:2]}/{content_hash}_{size}.webp"
+        for size in settings.AVATAR_SIZES
+    }
+
+def avatar_urls(content_hash: str) -> Dict[str, str]:
+    # Same "static/..." form the frontend already resolves against the API base URL
+    return {str(size): f"static/{path}" for size, path in avatar_paths(content_hash).items()}
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _render(image: Image.Image, size: int) -> bytes:
+    # Centre-crop to a square so every rendition fills the round avatar frame
+    thumbnail = ImageOps.fit(image, (size, size), method=Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, format="WEBP", quality=settings.AVATAR_WEBP_QUALITY, method=4)
+    return buffer.getvalue()
+
+def _store(image_bytes: bytes) -> str:
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+    paths = {size: os.path.join(settings.STATIC_DIR, path) for size, path in avatar_paths(content_hash).items()}
+    missing = {size: path for size, path in paths.items() if not os.path.exists(path)}
+    if not missing:
+        # Same image uploaded before (by anyone): its renditions are already on disk
+        return content_hash
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for size, path in missing.items():
+            _write_atomic(path, _render(image, size))
+    return content_hash
+
+async def store_avatar(image_bytes: bytes) -> Dict[str, object]:
+    """
+    Store an avatar image in the content-addressed avatar store.
+
+    Each size in AVATAR_SIZES is rendered once to WebP and written under
+    static/avatars keyed by the SHA-256 of the uploaded bytes, so the files
+    never change and can be served with immutable cache headers.
+
+    Args:
+        image_bytes: Raw uploaded image
+
+    Returns:
+        Profile fields: "avatar" (largest rendition URL) and "avatar_thumbnails" (size -> URL)
+    """
+    # Decoding and resizing is CPU-bound; keep it off the event loop
+    content_hash = await asyncio.to_thread(_store, bytes(image_bytes))
+    urls = avatar_urls(content_hash)
+    return {"avatar": urls[str(max(settings.AVATAR_SIZES))], "avatar_thumbnails": urls}
+
+async def migrate_inline_avatars(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Move avatars stored inline on user_profiles as base64 data URLs into the
+    avatar store, leaving only URLs on the profile.
+
+    Returns:
+        Counts of scanned, migrated and failed profiles
+    """
+    from app.config.mongodb import get_database
+
+    db = get_database()
+    counts = {"scanned": 0, "migrated": 0, "failed": 0}
+    cursor = db.user_profiles.find({"avatar": {"$regex": "^data:"}}, {"firebase_uid": 1, "avatar": 1})
+    async for profile in cursor:
+        counts["scanned"] += 1
+        image_bytes = decode_data_url(profile.get("avatar"))
+        if image_bytes is None:
+            counts["failed"] += 1
+            continue
+        try:
+            fields = await store_avatar(image_bytes) if not dry_run else None
+        except (OSError, Image.DecompressionBombError) as e:
+            print(f"Could not migrate avatar for {profile.get('firebase_uid')}: {str(e)}")
+            counts["failed"] += 1
+            continue
+        if fields:
+            # Only replace the avatar if it wasn't changed while we were converting it
+            await db.user_profiles.update_one(
+                {"_id": profile["_id"], "avatar": profile["avatar"]},
+                {"$set": fields}
+            )
+        counts["migrated"] += 1
+    return counts
@@ -0,0 +1,323 @@
+# app/services/blob_store.py
+import asyncio
+import hashlib
+import io
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterable, Dict, Iterable, Mapping, Optional, Tuple, Union
+import aiofiles
+from fastapi import HTTPException, UploadFile, status
+from fastapi.responses import Response, StreamingResponse
+from PIL import Image, ImageOps
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.utils.metrics import metrics
+from app.utils.uploads import CHUNK_SIZE, IMAGE_TYPES, SNIFF_BYTES, sniff_image_type
+
+# Formats worth re-encoding; GIFs may be animated and WebP/HEIC are already compact
+TRANSCODABLE_TYPES = {"image/jpeg", "image/png"}
+TRANSCODE_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+def blob_path(blob_id: str) -> str:
+    """Path of a blob on disk; two levels of hash-prefix directories keep each one small."""
+    return os.path.join(settings.BLOB_DIR, blob_id[:2], blob_id[2:4], blob_id)
+
+def _temp_path() -> str:
+    temp_dir = os.path.join(settings.BLOB_DIR, "tmp")
+    os.makedirs(temp_dir, exist_ok=True)
+    return os.path.join(temp_dir, uuid.uuid4().hex)
+
+def _transcode(path: str, content_type: str) -> Optional[Tuple[bytes, str]]:
+    # Re-encode in the configured format, keeping the result only if it is smaller
+    target = TRANSCODE_TYPES.get(settings.BLOB_TRANSCODE_FORMAT)
+    if not target or content_type not in TRANSCODABLE_TYPES or content_type == target:
+        return None
+    try:
+        with Image.open(path) as image:
+            # Bake the EXIF orientation into the pixels (phone photos are often stored sideways),
+            # then keep the rest of the EXIF data, which exif_transpose has cleared the tag from
+            image = ImageOps.exif_transpose(image)
+            exif = image.getexif()
+            if target == "image/jpeg" and image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format=settings.BLOB_TRANSCODE_FORMAT.upper(), quality=settings.BLOB_TRANSCODE_QUALITY, exif=exif)
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Warning: could not transcode blob: {str(e)}")
+        return None
+    if buffer.tell() >= os.path.getsize(path):
+        return None
+    return buffer.getvalue(), target
+
+async def _record(blob_id: str, size: int, content_type: str) -> Dict:
+    # New blobs start unreferenced; collect_garbage removes them if nothing references them in time
+    db = get_database()
+    now = datetime.now()
+    await db.blobs.update_one(
+        {"_id": blob_id},
+        {
+            "$setOnInsert": {"size": size, "content_type": content_type, "ref_count": 0, "created_at": now},
+            "$set": {"updated_at": now}
+        },
+        upsert=True
+    )
+    return {"id": blob_id, "size": size, "content_type": content_type}
+
+async def put_chunks(chunks: AsyncIterable[Union[bytes, memoryview]], max_bytes: Optional[int] = None,
+                     allowed_types: Iterable[str] = IMAGE_TYPES) -> Dict:
+    """
+    Stream chunks into the blob store, hashing them as they are written.
+
+    The data is spooled to a temporary file and then renamed to its SHA-256
+    path, so identical uploads are stored once. With BLOB_TRANSCODE_FORMAT
+    set, JPEG and PNG images are re-encoded when that makes them smaller.
+
+    Args:
+        chunks: Async iterable of data chunks
+        max_bytes: Optional size limit; larger streams are rejected with 413
+        allowed_types: Accepted MIME types, checked against the magic bytes
+
+    Returns:
+        Blob record: "id" (hex SHA-256), "size" and "content_type"
+    """
+    digest = hashlib.sha256()
+    size = 0
+    header = bytearray()
+    temp_path = _temp_path()
+    try:
+        async with aiofiles.open(temp_path, "wb") as temp_file:
+            async for chunk in chunks:
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File size must be less than {max_bytes / (1024 * 1024):g}MB"
+                    )
+                if len(header) < SNIFF_BYTES:
+                    header.extend(chunk[:SNIFF_BYTES - len(header)])
+                digest.update(chunk)
+                await temp_file.write(chunk)
+
+        content_type = sniff_image_type(header)
+        if content_type not in allowed_types:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="File must be a JPEG, PNG, GIF, WebP or HEIC image"
+            )
+
+        transcoded = await asyncio.to_thread(_transcode, temp_path, content_type)
+        if transcoded:
+            data, content_type = transcoded
+            metrics.increment("blob_transcoded_total")
+            metrics.observe("blob_transcode_saved_bytes", size - len(data))
+            digest, size = hashlib.sha256(data), len(data)
+            async with aiofiles.open(temp_path, "wb") as temp_file:
+                await temp_file.write(data)
+
+        # Record before touching the file: bumping updated_at keeps garbage collection off an existing blob
+        blob = await _record(digest.hexdigest(), size, content_type)
+        path = blob_path(blob["id"])
+        if os.path.exists(path):
+            metrics.increment("blob_deduplicated_total")
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return blob
+
+async def put_bytes(data: Union[bytes, memoryview], allowed_types: Iterable[str] = IMAGE_TYPES) -> Dict:
+    """Store in-memory data (e.g. an upload already read for OCR). See put_chunks."""
+    async def chunks():
+        view = memoryview(data)
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield view[start:start + CHUNK_SIZE]
+
+    return await put_chunks(chunks(), allowed_types=allowed_types)
+
+async def put_upload(file: UploadFile, max_bytes: int, allowed_types: Iterable[str] = IMAGE_TYPES) -> Dict:
+    """Stream a multipart upload into the blob store without holding it in memory. See put_chunks."""
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File size must be less than {max_bytes / (1024 * 1024):g}MB"
+        )
+
+    async def chunks():
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    return await put_chunks(chunks(), max_bytes, allowed_types)
+
+async def add_reference(blob_id: str) -> bool:
+    """
+    Record one more document referencing a blob.
+
+    Returns:
+        False if the blob doesn't exist (never stored, or already collected)
+    """
+    db = get_database()
+    result = await db.blobs.update_one(
+        {"_id": blob_id},
+        {"$inc": {"ref_count": 1}, "$set": {"updated_at": datetime.now()}}
+    )
+    return result.matched_count > 0
+
+async def release_reference(blob_id: str):
+    """
+    Drop one reference to a blob. Unreferenced blobs are deleted by
+    collect_garbage once they have stayed unreferenced for the grace period.
+    """
+    db = get_database()
+    await db.blobs.update_one(
+        {"_id": blob_id, "ref_count": {"$gt": 0}},
+        {"$inc": {"ref_count": -1}, "$set": {"updated_at": datetime.now()}}
+    )
+
+async def get_blob(blob_id: str) -> Optional[Dict]:
+    db = get_database()
+    return await db.blobs.find_one({"_id": blob_id})
+
+async def collect_garbage():
+    """
+    Delete blobs nothing has referenced for BLOB_ORPHAN_GRACE_SECONDS, e.g.
+    scans that were never saved as receipts.
+
+    The grace period covers the window between storing a blob and saving the
+    document that references it.
+    """
+    db = get_database()
+    cutoff = datetime.now() - timedelta(seconds=settings.BLOB_ORPHAN_GRACE_SECONDS)
+    removed = 0
+    async for blob in db.blobs.find({"ref_count": {"$lte": 0}, "updated_at": {"$lt": cutoff}}, {"_id": 1}):
+        # Re-check the condition so a reference taken since the scan keeps the blob
+        result = await db.blobs.delete_one({"_id": blob["_id"], "ref_count": {"$lte": 0}, "updated_at": {"$lt": cutoff}})
+        if result.deleted_count:
+            try:
+                os.remove(blob_path(blob["_id"]))
+            except FileNotFoundError:
+                pass
+            removed += 1
+
+    # Temporary files left behind by interrupted uploads
+    temp_dir = os.path.join(settings.BLOB_DIR, "tmp")
+    if os.path.isdir(temp_dir):
+        for name in os.listdir(temp_dir):
+            path = os.path.join(temp_dir, name)
+            try:
+                if datetime.fromtimestamp(os.path.getmtime(path)) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    metrics.increment("blob_collected_total", removed)
+    print(f"Blob garbage collection removed {removed} blobs")
+
+def parse_range(value: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range "Range: bytes=..." header against a file of `size` bytes.
+
+    Returns:
+        Inclusive (start, end), or None when the header should be ignored and
+        the whole file served (absent, malformed, another unit, or several ranges)
+
+    Raises:
+        ValueError: If the range can't be satisfied (416)
+    """
+    if not value or not value.strip().startswith("bytes=") or "," in value:
+        return None
+    first, _, last = value.strip()[len("bytes="):].partition("-")
+    first, last = first.strip(), last.strip()
+    if not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+async def _read_file(path: str, start: int, end: int):
+    # Stream [start, end] from disk in CHUNK_SIZE pieces
+    async with aiofiles.open(path, "rb") as file:
+        await file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+def blob_response(blob: Dict, request_headers: Mapping[str, str]) -> Response:
+    """
+    Serve a blob with its hash as the ETag, answering If-None-Match with 304
+    and a single-range Range header with 206 (or 416 when unsatisfiable).
+    Ranges are parsed here rather than left to FileResponse, so behaviour
+    doesn't depend on the installed Starlette version.
+
+    With BLOB_ACCEL_REDIRECT_PREFIX set, the file is handed to a fronting
+    nginx via X-Accel-Redirect instead, so it is sent with sendfile.
+    """
+    etag = f'"{blob["_id"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={settings.BLOB_CACHE_MAX_AGE_SECONDS}, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    path = blob_path(blob["_id"])
+    if settings.BLOB_ACCEL_REDIRECT_PREFIX:
+        relative = os.path.relpath(path, settings.BLOB_DIR).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = f"{settings.BLOB_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative}"
+        return Response(media_type=blob["content_type"], headers=headers)
+
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+    # If-Range with a different validator means the client's partial copy is stale: send it all
+    if_range = request_headers.get("if-range")
+    try:
+        byte_range = parse_range(request_headers.get("range"), size) if not if_range or if_range == etag else None
+    except ValueError:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"}
+        )
+
+    if byte_range is None:
+        return StreamingResponse(
+            _read_file(path, 0, size - 1), media_type=blob["content_type"],
+            headers={**headers, "Content-Length": str(size)}
+        )
+
+    start, end = byte_range
+    return StreamingResponse(
+        _read_file(path, start, end), status_code=status.HTTP_206_PARTIAL_CONTENT, media_type=blob["content_type"],
+        headers={**headers, "Content-Length": str(end - start + 1), "Content-Range": f"bytes {start}-{end}/{size}"}
+    )
+
+async def ensure_blob_indexes():
+    db = get_database()
+    # Garbage collection looks up unreferenced blobs by age
+    await db.blobs.create_index([("ref_count", 1), ("updated_at", 1)])
@@ -0,0 +1,176 @@
+# app/services/broadcast_service.py
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.services.notification_service import create_notifications_in_db
+from app.utils.metrics import metrics
+
+# Running broadcast tasks, so they aren't garbage collected mid-run
+_tasks: Dict[str, asyncio.Task] = {}
+
+def _lease_until() -> datetime:
+    return datetime.now() + timedelta(seconds=settings.BROADCAST_LEASE_SECONDS)
+
+async def start_broadcast(created_by: str, title: str, message: str, link: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Start sending a system notification to every user in the background.
+
+    Returns:
+        The broadcast's progress document
+    """
+    db = get_database()
+    broadcast = {
+        "title": title,
+        "message": message,
+        "link": link,
+        "created_by": created_by,
+        "status": "running",
+        "total": await db.user_profiles.estimated_document_count(),
+        "sent": 0,
+        "last_profile_id": None,
+        "owner": uuid.uuid4().hex,
+        "lease_until": _lease_until(),
+        "started_at": datetime.now()
+    }
+    result = await db.broadcasts.insert_one(broadcast)
+    broadcast["_id"] = result.inserted_id
+    _start_task(broadcast)
+    return _format_broadcast(broadcast)
+
+def _start_task(broadcast: Dict[str, Any]):
+    broadcast_id = str(broadcast["_id"])
+    task = asyncio.create_task(_run_broadcast(broadcast))
+    _tasks[broadcast_id] = task
+    task.add_done_callback(lambda _: _tasks.pop(broadcast_id, None))
+
+async def resume_broadcasts() -> int:
+    """
+    Resume running broadcasts whose lease has lapsed, i.e. whose worker
+    stopped (typically a restart), from their last checkpointed profile.
+
+    Returns:
+        Number of broadcasts resumed
+    """
+    db = get_database()
+    now = datetime.now()
+    # Broadcasts from before checkpoints were kept can't be resumed without sending twice
+    await db.broadcasts.update_many(
+        {"status": "running", "lease_until": {"$exists": False}},
+        {"$set": {"status": "failed", "error": "Interrupted before it could be resumed", "finished_at": now}}
+    )
+
+    resumed = 0
+    async for broadcast in db.broadcasts.find({"status": "running", "lease_until": {"$lt": now}}):
+        if str(broadcast["_id"]) in _tasks:
+            continue
+        # Conditional on the lease it was read with, so only one worker takes it over
+        claimed = await db.broadcasts.find_one_and_update(
+            {"_id": broadcast["_id"], "status": "running", "lease_until": broadcast["lease_until"]},
+            {"$set": {"owner": uuid.uuid4().hex, "lease_until": _lease_until()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if claimed:
+            print(f"Resuming broadcast {claimed['_id']} after {claimed['sent']} notifications")
+            _start_task(claimed)
+            resumed += 1
+    return resumed
+
+async def _run_broadcast(broadcast: Dict[str, Any]):
+    # Stream user ids in _id order and insert one unordered chunk at a time, paced to
+    # BROADCAST_WRITES_PER_SECOND; each chunk checkpoints the last profile and renews the lease
+    db = get_database()
+    broadcast_id, owner = broadcast["_id"], broadcast["owner"]
+    started = time.monotonic()
+    sent = resumed_at = broadcast.get("sent", 0)
+    try:
+        query: Dict[str, Any] = {}
+        if broadcast.get("last_profile_id"):
+            query["_id"] = {"$gt": broadcast["last_profile_id"]}
+        cursor = db.user_profiles.find(query, {"firebase_uid": 1, "user_id": 1}).sort("_id", 1).batch_size(settings.BROADCAST_CHUNK_SIZE)
+        chunk: List[Dict[str, Any]] = []
+        last_profile_id = None
+        async for profile in cursor:
+            last_profile_id = profile["_id"]
+            user_id = profile.get("firebase_uid") or profile.get("user_id")
+            if not user_id:
+                continue
+            chunk.append({
+                "user_id": user_id,
+                "type": "system",
+                "title": broadcast["title"],
+                "message": broadcast["message"],
+                "link": broadcast["link"],
+                "image_url": "/icons/system.png",
+                "is_read": False,
+                "broadcast_id": str(broadcast_id),
+                # A chunk resent after an interruption skips the users it already reached
+                "dedupe_key": f"broadcast:{broadcast_id}:{user_id}"
+            })
+            if len(chunk) >= settings.BROADCAST_CHUNK_SIZE:
+                count = await _send_chunk(broadcast_id, owner, chunk, last_profile_id)
+                if count is None:
+                    print(f"Broadcast {broadcast_id} lost its lease; stopping")
+                    return
+                sent += count
+                await _pace(sent - resumed_at, started)
+                chunk = []
+        if chunk:
+            count = await _send_chunk(broadcast_id, owner, chunk, last_profile_id)
+            if count is None:
+                print(f"Broadcast {broadcast_id} lost its lease; stopping")
+                return
+            sent += count
+
+        await db.broadcasts.update_one(
+            {"_id": broadcast_id, "owner": owner},
+            {"$set": {"status": "completed", "finished_at": datetime.now()}}
+        )
+        print(f"Broadcast {broadcast_id} sent to {sent} users")
+    except Exception as e:
+        print(f"Error in broadcast {broadcast_id}: {str(e)}")
+        await db.broadcasts.update_one(
+            {"_id": broadcast_id, "owner": owner},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.now()}}
+        )
+
+async def _send_chunk(broadcast_id: ObjectId, owner: str, chunk: List[Dict[str, Any]], last_profile_id: ObjectId) -> Optional[int]:
+    # Returns how many were sent, or None if another worker has taken the broadcast over
+    db = get_database()
+    # Counters are upserted in one bulk write rather than seeded user by user
+    inserted = await create_notifications_in_db(chunk, seed_counters=False)
+    metrics.increment("broadcast_notifications_total", len(inserted))
+    # Users skipped as already sent were reached before an interruption, so the whole chunk counts
+    result = await db.broadcasts.update_one(
+        {"_id": broadcast_id, "owner": owner},
+        {"$set": {"last_profile_id": last_profile_id, "lease_until": _lease_until()}, "$inc": {"sent": len(chunk)}}
+    )
+    return len(chunk) if result.matched_count else None
+
+async def _pace(sent: int, started: float):
+    # Sleep off any lead over the target rate, so a broadcast doesn't crowd out other writes
+    if settings.BROADCAST_WRITES_PER_SECOND > 0:
+        ahead = sent / settings.BROADCAST_WRITES_PER_SECOND - (time.monotonic() - started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+async def get_broadcast(broadcast_id: str) -> Optional[Dict[str, Any]]:
+    """Get a broadcast's progress."""
+    if not ObjectId.is_valid(broadcast_id):
+        return None
+    db = get_database()
+    broadcast = await db.broadcasts.find_one({"_id": ObjectId(broadcast_id)})
+    return _format_broadcast(broadcast) if broadcast else None
+
+def _format_broadcast(broadcast: Dict[str, Any]) -> Dict[str, Any]:
+    total = broadcast.get("total") or 0
+    formatted = {key: value for key, value in broadcast.items() if key != "_id"}
+    formatted["id"] = str(broadcast["_id"])
+    # total is an estimate taken at the start, so progress is capped at 100%
+    formatted["progress"] = 1.0 if broadcast["status"] == "completed" else min(broadcast["sent"] / total, 1.0) if total else 0.0
+    return formatted
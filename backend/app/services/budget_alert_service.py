@@ -0,0 +1,281 @@
+# app/services/budget_alert_service.py
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from pymongo import ReturnDocument
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.services.notification_service import build_budget_notification, create_notifications_in_db
+from app.utils.metrics import metrics
+
+# Budget limits keyed by user_id: (expires_at, {category: limit}, alerts enabled)
+_limits: Dict[str, Tuple[float, Dict[str, float], bool]] = {}
+MAX_CACHED_LIMITS = 10000
+
+def month_key(date: Any) -> Optional[str]:
+    if isinstance(date, str):
+        try:
+            date = datetime.fromisoformat(date.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    return date.strftime("%Y-%m") if isinstance(date, datetime) else None
+
+def _field(category: str) -> str:
+    # Category names become field names in budget_state, where "." and a leading "$" aren't allowed
+    return category.replace(".", "．").lstrip("$") or "Uncategorized"
+
+def receipt_category_totals(receipt: Optional[Dict[str, Any]]) -> Dict[Tuple[str, str], float]:
+    """
+    Sum a receipt's items by (month, category), using item prices as the
+    spending aggregations do.
+    """
+    totals: Dict[Tuple[str, str], float] = defaultdict(float)
+    if not receipt:
+        return totals
+    month = month_key(receipt.get("date"))
+    if not month:
+        return totals
+    for item in receipt.get("items") or []:
+        if hasattr(item, "dict"):
+            item = item.dict()
+        totals[(month, item.get("category") or "Uncategorized")] += float(item.get("price") or 0)
+    return totals
+
+def receipt_deltas(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Dict[Tuple[str, str], float]:
+    """Per (month, category) change in spending from replacing `before` with `after`."""
+    deltas = receipt_category_totals(after)
+    for key, amount in receipt_category_totals(before).items():
+        deltas[key] -= amount
+    return {key: round(amount, 2) for key, amount in deltas.items() if round(amount, 2)}
+
+def evaluate_threshold(spend: float, limit: float, alerted: float) -> Tuple[float, bool]:
+    """
+    Apply one category's spend to its alert state.
+
+    `alerted` is the highest threshold (a fraction of the limit) already
+    alerted on. A higher threshold being crossed fires an alert. Falling back
+    re-arms a threshold only once spend drops BUDGET_ALERT_HYSTERESIS below it,
+    so hovering around a threshold doesn't alert repeatedly.
+
+    Returns:
+        Tuple of (new alerted threshold, whether to send an alert)
+    """
+    ratio = spend / limit if limit > 0 else 0.0
+    crossed = max((threshold for threshold in settings.BUDGET_ALERT_THRESHOLDS if ratio >= threshold), default=0.0)
+    if crossed > alerted:
+        return crossed, True
+    rearm_below = 1 - settings.BUDGET_ALERT_HYSTERESIS
+    still_armed = max(
+        (threshold for threshold in settings.BUDGET_ALERT_THRESHOLDS
+         if threshold <= alerted and ratio >= threshold * rearm_below),
+        default=0.0
+    )
+    return still_armed, False
+
+def invalidate_budget_limits(user_id: str):
+    """Drop a user's cached budget limits. Called when their settings change."""
+    _limits.pop(user_id, None)
+
+async def get_budget_limits(user_id: str) -> Tuple[Dict[str, float], bool]:
+    """
+    Get a user's monthly budget limits by category: the profile's
+    budget_targets, overridden by user_settings.budget_limits.
+
+    Returns:
+        Tuple of ({category: limit}, whether budget alerts are enabled)
+    """
+    cached = _limits.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], cached[2]
+
+    db = get_database()
+    profile = await db.user_profiles.find_one(
+        {"$or": [{"user_id": user_id}, {"firebase_uid": user_id}]},
+        {"budget_targets": 1}
+    )
+    user_settings = await db.user_settings.find_one({"user_id": user_id}, {"budget_limits": 1, "notifications": 1})
+
+    limits = dict((profile or {}).get("budget_targets") or {})
+    limits.update((user_settings or {}).get("budget_limits") or {})
+    limits = {category: float(limit) for category, limit in limits.items() if limit and float(limit) > 0}
+    enabled = ((user_settings or {}).get("notifications") or {}).get("budget_alerts", True)
+
+    if len(_limits) >= MAX_CACHED_LIMITS and user_id not in _limits:
+        _limits.pop(next(iter(_limits)))
+    _limits[user_id] = (time.monotonic() + settings.BUDGET_LIMITS_TTL_SECONDS, limits, enabled)
+    return limits, enabled
+
+# Attempts at applying a change while other writes to the same state race it
+MAX_STATE_ATTEMPTS = 5
+
+def _contribution(receipt: Optional[Dict[str, Any]], month: str) -> Dict[str, float]:
+    # What a receipt adds to the month's spend, by state field
+    spend: Dict[str, float] = defaultdict(float)
+    for (receipt_month, category), amount in receipt_category_totals(receipt).items():
+        if receipt_month == month:
+            spend[_field(category)] += amount
+    return {field: round(amount, 2) for field, amount in spend.items() if round(amount, 2)}
+
+async def _seed_state(user_id: str, month: str):
+    # First write of the month (or first since deployment): total the month once from receipts.
+    # Each receipt's share is kept in the state's "receipts" ledger, so a change whose receipt
+    # was already written when the seed read it is recognised and not added a second time.
+    # Only $setOnInsert is used, so when two writers seed at once the loser changes nothing.
+    db = get_database()
+    start = datetime.strptime(month, "%Y-%m")
+    end = datetime(start.year + (start.month == 12), start.month % 12 + 1, 1)
+    rows = await db.receipts.aggregate([
+        {"$match": {"user_id": user_id, "date": {"$gte": start, "$lt": end}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"receipt": "$_id", "category": {"$ifNull": ["$items.category", "Uncategorized"]}},
+            "amount": {"$sum": {"$ifNull": ["$items.price", 0]}}
+        }}
+    ]).to_list(length=None)
+
+    spend: Dict[str, float] = defaultdict(float)
+    ledger: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for row in rows:
+        field = _field(row["_id"]["category"])
+        spend[field] += row["amount"]
+        ledger[str(row["_id"]["receipt"])][field] += row["amount"]
+    receipts = {receipt_id: {field: round(amount, 2) for field, amount in shares.items() if round(amount, 2)}
+                for receipt_id, shares in ledger.items()}
+    result = await db.budget_state.update_one(
+        {"user_id": user_id, "month": month},
+        {"$setOnInsert": {
+            "spend": {category: round(amount, 2) for category, amount in spend.items()},
+            "receipts": {receipt_id: shares for receipt_id, shares in receipts.items() if shares},
+            "alerted": {},
+            "created_at": datetime.now()
+        }},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        metrics.increment("budget_state_seeded_total")
+
+async def apply_receipt_change(user_id: Optional[str], before: Optional[Dict[str, Any]] = None,
+                               after: Optional[Dict[str, Any]] = None):
+    """
+    Apply a receipt write to the user's month-to-date budget state and send
+    alerts for newly crossed thresholds.
+
+    Called after a receipt is saved (before=None), updated or deleted
+    (after=None). Only the current month is tracked. Failures are logged
+    rather than raised, so they never fail the receipt write.
+
+    Args:
+        user_id: Owner of the receipt
+        before: The receipt as it was, if it existed
+        after: The receipt as it is now, if it still exists
+    """
+    await apply_receipt_changes(user_id, [(before, after)])
+
+async def apply_receipt_changes(user_id: Optional[str], changes: Iterable[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]]):
+    """
+    Batch form of apply_receipt_change for several receipts of one user.
+
+    The state records each receipt's share of the month's spend, and a change
+    moves spend by the difference between the receipt's new share and the
+    recorded one. Applying a change is therefore idempotent, and a receipt
+    already counted by a concurrent seed isn't counted again.
+    """
+    if not user_id:
+        return
+    try:
+        month = datetime.now().strftime("%Y-%m")
+        shares: Dict[str, Dict[str, float]] = {}
+        previous: Dict[str, Dict[str, float]] = {}
+        for before, after in changes:
+            receipt = after or before
+            if receipt and receipt.get("_id") is not None and _contribution(before, month) != _contribution(after, month):
+                shares[str(receipt["_id"])] = _contribution(after, month)
+                previous[str(receipt["_id"])] = _contribution(before, month)
+        if not shares:
+            return
+
+        db = get_database()
+        for _ in range(MAX_STATE_ATTEMPTS):
+            state = await db.budget_state.find_one({"user_id": user_id, "month": month}, {"receipts": 1})
+            if state is None:
+                await _seed_state(user_id, month)
+                continue
+            if "receipts" not in state:
+                # Seeded before states kept a ledger: apply the difference from before to after
+                ledger = dict(previous)
+                legacy = True
+            else:
+                ledger, legacy = state["receipts"], False
+
+            deltas: Dict[str, float] = defaultdict(float)
+            for receipt_id, share in shares.items():
+                for field, amount in share.items():
+                    deltas[field] += amount
+                for field, amount in ledger.get(receipt_id, {}).items():
+                    deltas[field] -= amount
+            deltas = {field: round(amount, 2) for field, amount in deltas.items() if round(amount, 2)}
+            if not deltas:
+                # Already counted, e.g. by the seed that read this receipt
+                return
+
+            # Conditional on the shares read above, so a concurrent change to one of these
+            # receipts makes this attempt miss and re-read rather than apply a stale difference
+            query: Dict[str, Any] = {"_id": state["_id"]}
+            update: Dict[str, Any] = {
+                "$inc": {f"spend.{field}": amount for field, amount in deltas.items()},
+                "$set": {"updated_at": datetime.now()}
+            }
+            if not legacy:
+                for receipt_id, share in shares.items():
+                    query[f"receipts.{receipt_id}"] = ledger[receipt_id] if receipt_id in ledger else {"$exists": False}
+                    if share:
+                        update["$set"][f"receipts.{receipt_id}"] = share
+                    elif receipt_id in ledger:
+                        update.setdefault("$unset", {})[f"receipts.{receipt_id}"] = ""
+            state = await db.budget_state.find_one_and_update(
+                query, update, projection={"receipts": 0}, return_document=ReturnDocument.AFTER
+            )
+            if state is not None:
+                await _evaluate_alerts(user_id, state, deltas.keys())
+                return
+            metrics.increment("budget_state_retries_total")
+        print(f"Budget state for {user_id} kept changing; change not applied")
+    except Exception as e:
+        print(f"Error updating budget state for {user_id}: {str(e)}")
+
+async def _evaluate_alerts(user_id: str, state: Dict[str, Any], categories: Iterable[str]):
+    limits, enabled = await get_budget_limits(user_id)
+    limits = {_field(category): (category, limit) for category, limit in limits.items()}
+
+    db = get_database()
+    notifications: List[Dict[str, Any]] = []
+    rearmed: Dict[str, float] = {}
+    for field in categories:
+        if field not in limits:
+            continue
+        category, limit = limits[field]
+        spend = state["spend"].get(field, 0.0)
+        alerted = state.get("alerted", {}).get(field, 0.0)
+        level, fire = evaluate_threshold(spend, limit, alerted)
+        if fire:
+            # Conditional, so concurrent writes crossing the same threshold alert only once
+            claimed = await db.budget_state.update_one(
+                {"_id": state["_id"], f"alerted.{field}": {"$not": {"$gte": level}}},
+                {"$set": {f"alerted.{field}": level}}
+            )
+            if claimed.modified_count and enabled:
+                notifications.append(build_budget_notification(user_id, category, spend, limit))
+        elif level != alerted:
+            rearmed[f"alerted.{field}"] = level
+
+    if rearmed:
+        await db.budget_state.update_one({"_id": state["_id"]}, {"$set": rearmed})
+    if notifications:
+        await create_notifications_in_db(notifications)
+        metrics.increment("budget_alerts_sent_total", len(notifications))
+
+async def ensure_budget_state_indexes():
+    db = get_database()
+    # Unique, so concurrent first receipts of a month can't seed two state documents
+    await db.budget_state.create_index([("user_id", 1), ("month", 1)], unique=True)
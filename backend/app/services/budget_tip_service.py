@@ -0,0 +1,203 @@
+# app/services/budget_tip_service.py
+import asyncio
+import math
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.services.notification_service import (
+    build_budget_tip_notification, create_notifications_in_db, generate_budget_tip_text
+)
+from app.utils.metrics import metrics
+
+CHECKPOINT_ID = "budget_tips"
+
+def expense_signature(categories: List[Dict[str, Any]]) -> Tuple:
+    """
+    Key users whose spending looks alike: their top three categories in order,
+    and total spending rounded to a power of two.
+    """
+    ranked = sorted((row for row in categories if row["amount"] > 0), key=lambda row: row["amount"], reverse=True)
+    total = sum(row["amount"] for row in ranked)
+    spend_band = int(math.log2(total)) if total >= 1 else 0
+    return tuple(row["category"] for row in ranked[:3]), spend_band
+
+def group_by_signature(summaries: List[Dict[str, Any]]) -> Dict[Tuple, List[Dict[str, Any]]]:
+    groups: Dict[Tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for summary in summaries:
+        groups[expense_signature(summary["categories"])].append(summary)
+    return groups
+
+def group_expenses(members: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Average spend per category across the group, largest first, as the prompt's expense list
+    totals: Dict[str, float] = defaultdict(float)
+    for member in members:
+        for row in member["categories"]:
+            totals[row["category"]] += row["amount"]
+    return [
+        {"category": category, "amount": amount / len(members)}
+        for category, amount in sorted(totals.items(), key=lambda entry: entry[1], reverse=True)
+    ]
+
+async def _claim_run(owner: str) -> Optional[Dict[str, Any]]:
+    # Take the job's lease, starting a new run unless the last one is unfinished or recent
+    db = get_database()
+    now = datetime.now()
+    checkpoint = await db.job_checkpoints.find_one({"_id": CHECKPOINT_ID})
+    if checkpoint and checkpoint.get("lease_until", now) > now and checkpoint.get("owner") != owner:
+        return None
+
+    update: Dict[str, Any] = {"owner": owner, "lease_until": now + timedelta(seconds=settings.BUDGET_TIP_LEASE_SECONDS)}
+    if not checkpoint or checkpoint.get("status") == "done":
+        # The job is attempted daily; runs themselves are BUDGET_TIP_INTERVAL_SECONDS apart
+        min_gap = timedelta(seconds=settings.BUDGET_TIP_INTERVAL_SECONDS - 60 * 60)
+        if checkpoint and now - checkpoint["started_at"] < min_gap:
+            return None
+        update.update({
+            "run_id": uuid.uuid4().hex,
+            "status": "running",
+            "started_at": now,
+            "last_user_id": None,
+            "processed": 0,
+            "sent": 0
+        })
+
+    # Conditional on the lease the checkpoint was read with, so two workers can't both claim it
+    query = {"_id": CHECKPOINT_ID}
+    if checkpoint:
+        query["lease_until"] = checkpoint.get("lease_until")
+    try:
+        return await db.job_checkpoints.find_one_and_update(
+            query, {"$set": update}, upsert=not checkpoint, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        return None
+
+async def _save_checkpoint(owner: str, last_user_id: str, processed: int, sent: int) -> bool:
+    db = get_database()
+    result = await db.job_checkpoints.update_one(
+        {"_id": CHECKPOINT_ID, "owner": owner},
+        {
+            "$set": {
+                "last_user_id": last_user_id,
+                "lease_until": datetime.now() + timedelta(seconds=settings.BUDGET_TIP_LEASE_SECONDS)
+            },
+            "$inc": {"processed": processed, "sent": sent}
+        }
+    )
+    return result.modified_count > 0
+
+async def _send_chunk(run_id: str, summaries: List[Dict[str, Any]], semaphore: asyncio.Semaphore) -> int:
+    # One tip per group of similar users, then one insert per chunk
+    db = get_database()
+    keys = {summary["_id"]: f"budget_tip:{run_id}:{summary['_id']}" for summary in summaries}
+    # A chunk may be retried after a crash between inserting and checkpointing
+    already_sent = {
+        notification["dedupe_key"]
+        for notification in await db.notifications.find(
+            {"dedupe_key": {"$in": list(keys.values())}}, {"dedupe_key": 1}
+        ).to_list(length=None)
+    }
+    summaries = [summary for summary in summaries if keys[summary["_id"]] not in already_sent]
+
+    async def tip_for(members: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        async with semaphore:
+            try:
+                return members, await generate_budget_tip_text(group_expenses(members), feature="budget_tip_batch")
+            except Exception as e:
+                print(f"Error generating budget tip for {len(members)} users: {str(e)}")
+                metrics.increment("budget_tip_errors_total")
+                return members, None
+
+    results = await asyncio.gather(*[tip_for(members) for members in group_by_signature(summaries).values()])
+    notifications = []
+    for members, tip in results:
+        if not tip:
+            continue
+        for member in members:
+            notification = build_budget_tip_notification(member["_id"], tip)
+            notification["dedupe_key"] = keys[member["_id"]]
+            notifications.append(notification)
+
+    sent = 0
+    for start in range(0, len(notifications), settings.BUDGET_TIP_INSERT_CHUNK):
+        # Tips another worker already inserted (same dedupe_key) are skipped, not counted
+        sent += len(await create_notifications_in_db(notifications[start:start + settings.BUDGET_TIP_INSERT_CHUNK]))
+    metrics.increment("budget_tip_groups_total", len(results))
+    return sent
+
+async def send_budget_tips():
+    """
+    Send every recently active user a budgeting tip.
+
+    Active users are streamed in user_id order from one aggregation over
+    recent receipts and handled in chunks. Within a chunk, users with similar
+    spending share one generated tip, and generation runs at most
+    BUDGET_TIP_CONCURRENCY at a time through the shared LLM rate limit. After
+    each chunk the last user_id is checkpointed, so an interrupted run resumes
+    where it stopped, and a lease keeps other workers from running it at the
+    same time.
+    """
+    owner = uuid.uuid4().hex
+    checkpoint = await _claim_run(owner)
+    if checkpoint is None:
+        return
+    run_id = checkpoint["run_id"]
+    print(f"Budget tips run {run_id} {'resuming after ' + checkpoint['last_user_id'] if checkpoint.get('last_user_id') else 'starting'}")
+
+    db = get_database()
+    match: Dict[str, Any] = {
+        "user_id": {"$ne": None},
+        "date": {"$gte": datetime.now() - timedelta(days=settings.BUDGET_TIP_WINDOW_DAYS)}
+    }
+    if checkpoint.get("last_user_id"):
+        match["user_id"]["$gt"] = checkpoint["last_user_id"]
+    cursor = db.receipts.aggregate([
+        {"$match": match},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "category": {"$ifNull": ["$items.category", "Uncategorized"]}},
+            "amount": {"$sum": {"$ifNull": ["$items.price", 0]}}
+        }},
+        {"$group": {
+            "_id": "$_id.user_id",
+            "categories": {"$push": {"category": "$_id.category", "amount": "$amount"}}
+        }},
+        {"$sort": {"_id": 1}}
+    ], allowDiskUse=True, batchSize=settings.BUDGET_TIP_CHUNK_USERS)
+
+    semaphore = asyncio.Semaphore(settings.BUDGET_TIP_CONCURRENCY)
+    total_sent = 0
+    chunk: List[Dict[str, Any]] = []
+
+    async def flush() -> bool:
+        nonlocal total_sent
+        sent = await _send_chunk(run_id, chunk, semaphore)
+        total_sent += sent
+        if not await _save_checkpoint(owner, chunk[-1]["_id"], len(chunk), sent):
+            print(f"Budget tips run {run_id} lost its lease; stopping")
+            return False
+        chunk.clear()
+        return True
+
+    async for summary in cursor:
+        chunk.append(summary)
+        if len(chunk) >= settings.BUDGET_TIP_CHUNK_USERS and not await flush():
+            return
+    if chunk and not await flush():
+        return
+
+    await db.job_checkpoints.update_one(
+        {"_id": CHECKPOINT_ID, "owner": owner},
+        {"$set": {"status": "done", "finished_at": datetime.now(), "lease_until": datetime.now()}}
+    )
+    print(f"Budget tips run {run_id} finished: {total_sent} tips sent")
+
+async def ensure_budget_tip_indexes():
+    db = get_database()
+    # A retried chunk can't send a user the same run's tip twice
+    await db.notifications.create_index("dedupe_key", unique=True, partialFilterExpression={"dedupe_key": {"$exists": True}})
@@ -0,0 +1,171 @@
+# app/services/categorization_batcher.py
+import asyncio
+import re
+import time
+from typing import Dict, List, Set, Tuple
+from app.config.settings import settings
+from app.services.llm_service import generate, record_parse_failure
+from app.utils.metrics import metrics
+
+FALLBACK_CATEGORY = "Miscellaneous"
+
+class _PendingBatch:
+    def __init__(self, categories: Tuple[str, ...]):
+        self.categories = categories
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.waiters: List[Tuple[asyncio.Future, List[str]]] = []
+        self.timer: asyncio.TimerHandle = None
+        self.opened_at = time.perf_counter()
+
+    def add(self, names: List[str]) -> asyncio.Future:
+        # Identical item names from different requests share one prompt slot
+        for name in names:
+            if name not in self.index:
+                self.index[name] = len(self.names)
+                self.names.append(name)
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append((future, names))
+        return future
+
+class CategorizationBatcher:
+    """
+    Collects item names from concurrent categorization requests and sends them
+    to the LLM as a single indexed prompt, then fans the results back out.
+
+    A batch is flushed when the window elapses or when it reaches max_items,
+    whichever comes first. Requests offering different category lists are
+    batched separately since they need different prompts.
+    """
+
+    def __init__(self, model=None, window_ms: int = None, max_items: int = None, model_name: str = "gemini-pro"):
+        self._model = model
+        self.model_name = model_name
+        self.window_ms = window_ms if window_ms is not None else settings.CATEGORIZE_BATCH_WINDOW_MS
+        self.max_items = max_items if max_items is not None else settings.CATEGORIZE_BATCH_MAX_ITEMS
+        if self.max_items <= 0:
+            raise ValueError("max_items must be positive")
+        if self.window_ms < 0:
+            raise ValueError("window_ms must not be negative")
+        self._pending: Dict[Tuple[str, ...], _PendingBatch] = {}
+        # The loop only keeps weak references to tasks, so in-flight batches are held here
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def model(self):
+        if self._model is None:
+            from app.services.ai_service import text_model
+            self._model = text_model
+        return self._model
+
+    async def categorize(self, names: List[str], categories: List[str]) -> Dict[str, str]:
+        """
+        Categorize item names, sharing the LLM call with any concurrent callers.
+
+        Args:
+            names: Item names to categorize
+            categories: Allowed category names
+
+        Returns:
+            Mapping of item name to category
+        """
+        if not names:
+            return {}
+
+        key = tuple(categories)
+        futures = []
+        remaining = list(dict.fromkeys(names))
+        while remaining:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._open_batch(key)
+            room = self.max_items - len(batch.names)
+            chunk, remaining = remaining[:room], remaining[room:]
+            futures.append(batch.add(chunk))
+            if len(batch.names) >= self.max_items:
+                self._flush(key, reason="size")
+
+        results: Dict[str, str] = {}
+        for partial in await asyncio.gather(*futures):
+            results.update(partial)
+        return results
+
+    def _open_batch(self, key: Tuple[str, ...]) -> _PendingBatch:
+        batch = _PendingBatch(key)
+        self._pending[key] = batch
+        loop = asyncio.get_running_loop()
+        batch.timer = loop.call_later(self.window_ms / 1000, self._flush, key, "window")
+        return batch
+
+    def _flush(self, key: Tuple[str, ...], reason: str):
+        batch = self._pending.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+
+        metrics.increment("categorize_batches_total", reason=reason)
+        metrics.observe("categorize_batch_items", len(batch.names))
+        metrics.observe("categorize_batch_fill_ratio", len(batch.names) / self.max_items)
+        metrics.observe("categorize_batch_requests", len(batch.waiters))
+        metrics.observe("categorize_batch_wait_ms", (time.perf_counter() - batch.opened_at) * 1000)
+        task = asyncio.create_task(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _PendingBatch):
+        try:
+            categorizations = await self._categorize_batch(batch.names, list(batch.categories))
+        except Exception as e:
+            print(f"Error categorizing batch of {len(batch.names)} items: {str(e)}")
+            metrics.increment("categorize_batch_errors_total")
+            for future, _ in batch.waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, names in batch.waiters:
+            if not future.done():
+                future.set_result({name: categorizations.get(name, FALLBACK_CATEGORY) for name in names})
+
+    async def _categorize_batch(self, names: List[str], categories: List[str]) -> Dict[str, str]:
+        categories_list = "\n".join([f"- {cat}" for cat in categories])
+        items_list = "\n".join([f"{index}. {name}" for index, name in enumerate(names, start=1)])
+
+        prompt = f"""
+        Please categorize these numbered items into the following available categories:
+        {categories_list}
+
+        For each item, choose the most appropriate category from the list above.
+        If an item doesn't fit well into any category, use "{FALLBACK_CATEGORY}".
+
+        Format the output as one line per item, using the item number only:
+        1: Category
+
+        Here are the items to categorize:
+        {items_list}
+        """
+
+        started = time.perf_counter()
+        response = await generate("categorize", self.model_name, prompt, model=self.model)
+        metrics.observe("categorize_batch_latency_ms", (time.perf_counter() - started) * 1000)
+
+        results = parse_indexed_categories(response.text, names, categories)
+        if len(results) < len(names):
+            record_parse_failure("categorize", self.model_name)
+        return results
+
+def parse_indexed_categories(text: str, names: List[str], categories: List[str]) -> Dict[str, str]:
+    # Map "N: Category" lines back onto the item names, ignoring unknown categories
+    allowed = {cat.lower(): cat for cat in categories}
+    results = {}
+    for index, category in re.findall(r"^\s*-?\s*(\d+)[.:)]\s*:?\s*(.+?)\s*$", text, re.MULTILINE):
+        position = int(index) - 1
+        if 0 <= position < len(names):
+            # Tolerate the model echoing the item name as "N. Name: Category"
+            category = category.rsplit(":", 1)[-1].strip(" *\"'")
+            results[names[position]] = allowed.get(category.lower(), FALLBACK_CATEGORY)
+    return results
+
+# Global instance
+categorization_batcher = CategorizationBatcher()
@@ -1,20 +1,28 @@
+import hashlib
+import json
+import time
 from datetime import datetime
+from types import MappingProxyType
 from bson import ObjectId
-from typing import List, Optional
+from bson.errors import InvalidId
+from typing import Dict, List, Optional, Tuple
+from pymongo import ReturnDocument
 from app.config.mongodb import get_database
+from app.config.settings import settings
+
+def _object_id(category_id) -> Optional[ObjectId]:
+    try:
+        return ObjectId(category_id)
+    except (InvalidId, TypeError):
+        return None
 
 class CategoryService:
-    def __init__(self):
-        self.db = None
-        self.categories_collection = None
-    
-    async def initialize(self):
-        if self.db is None:
-            self.db = get_database()
-            self.categories_collection = self.db.categories
-    
+    @property
+    def categories_collection(self):
+        # Resolved per call, so the service works across database reconnects
+        return get_database().categories
+
     async def create_category(self, category_data):
-        await self.initialize()
         # category_data is already a dictionary
         category_dict = category_data.copy()
         category_dict["created_at"] = datetime.now()
@@ -22,89 +30,149 @@ class CategoryService:
         result = await self.categories_collection.insert_one(category_dict)
         category_dict["_id"] = str(result.inserted_id)
         return category_dict
-    
+
     async def get_categories_by_user_id(self, user_id):
-        await self.initialize()
         cursor = self.categories_collection.find({"user_id": user_id})
         categories = []
         async for category in cursor:
             category["_id"] = str(category["_id"])
             categories.append(category)
         return categories
-    
+
     async def get_category_by_id(self, category_id):
-        await self.initialize()
-        try:
-            category = await self.categories_collection.find_one({"_id": ObjectId(category_id)})
-            if category:
-                category["_id"] = str(category["_id"])
-            return category
-        except:
+        object_id = _object_id(category_id)
+        if object_id is None:
             return None
-    
-    async def update_category(self, category_id, category_update):
-        await self.initialize()
-        # Make sure _id is not in the update
-        if "_id" in category_update:
-            del category_update["_id"]
-        
+        category = await self.categories_collection.find_one({"_id": object_id})
+        if category:
+            category["_id"] = str(category["_id"])
+        return category
+
+    async def update_category(self, category_id, user_id, category_update):
+        # Update the user's category in one round trip; None if it isn't theirs or doesn't exist
+        object_id = _object_id(category_id)
+        if object_id is None:
+            return None
+
+        # Make sure _id and ownership are not in the update
+        category_update = {key: value for key, value in category_update.items() if key not in ("_id", "user_id")}
         category_update["updated_at"] = datetime.now()
-        
-        await self.categories_collection.update_one(
-            {"_id": ObjectId(category_id)},
-            {"$set": category_update}
+
+        updated_category = await self.categories_collection.find_one_and_update(
+            {"_id": object_id, "user_id": user_id},
+            {"$set": category_update},
+            return_document=ReturnDocument.AFTER
         )
-        
-        updated_category = await self.get_category_by_id(category_id)
+        if updated_category:
+            updated_category["_id"] = str(updated_category["_id"])
         return updated_category
-    
-    async def delete_category(self, category_id):
-        await self.initialize()
-        result = await self.categories_collection.delete_one({"_id": ObjectId(category_id)})
+
+    async def delete_category(self, category_id, user_id):
+        object_id = _object_id(category_id)
+        if object_id is None:
+            return False
+        result = await self.categories_collection.delete_one({"_id": object_id, "user_id": user_id})
         return result.deleted_count > 0
 
 # Create a singleton instance
 category_service = CategoryService()
 
+# System categories every user gets unless they have a custom category of the same name.
+# Built once and read-only; get_all_categories hands out copies.
+DEFAULT_CATEGORIES: Tuple[MappingProxyType, ...] = tuple(MappingProxyType(category) for category in [
+    {"_id": "system_food", "name": "Food & Dining", "icon": "🍽️", "color": "#FF6B6B", "user_id": None},
+    {"_id": "system_transport", "name": "Transportation", "icon": "🚗", "color": "#4ECDC4", "user_id": None},
+    {"_id": "system_shopping", "name": "Shopping", "icon": "🛍️", "color": "#45B7D1", "user_id": None},
+    {"_id": "system_bills", "name": "Bills & Utilities", "icon": "💡", "color": "#FFA726", "user_id": None},
+    {"_id": "system_healthcare", "name": "Healthcare", "icon": "🏥", "color": "#EF5350", "user_id": None},
+    {"_id": "system_entertainment", "name": "Entertainment", "icon": "🎬", "color": "#AB47BC", "user_id": None},
+    {"_id": "system_education", "name": "Education", "icon": "📚", "color": "#66BB6A", "user_id": None},
+    {"_id": "system_misc", "name": "Miscellaneous", "icon": "📦", "color": "#8D6E63", "user_id": None}
+])
+DEFAULT_CATEGORY_NAMES = frozenset(category["name"] for category in DEFAULT_CATEGORIES)
+
+# Category views keyed by (user_id, include_system): (expires_at, version, categories).
+# Dropped on the user's own category writes; the TTL bounds staleness in other processes.
+_views: Dict[Tuple[str, bool], Tuple[float, str, Tuple[dict, ...]]] = {}
+MAX_CACHED_VIEWS = 10000
+
+def _merge(user_categories: List[dict], include_system: bool) -> Tuple[dict, ...]:
+    if not include_system:
+        return tuple(user_categories)
+    # Default categories the user doesn't have custom versions of
+    user_category_names = {category.get("name", "").lower() for category in user_categories}
+    return tuple(user_categories) + tuple(
+        dict(category) for category in DEFAULT_CATEGORIES if category["name"].lower() not in user_category_names
+    )
+
+def _view_version(categories: Tuple[dict, ...]) -> str:
+    # Derived from the content, so every process computes the same version for the same view
+    encoded = json.dumps(categories, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+def invalidate_category_view(user_id: str):
+    """Drop a user's cached category views. Called on any write to their categories."""
+    _views.pop((user_id, True), None)
+    _views.pop((user_id, False), None)
+
+async def get_category_view(user_id: str, include_system: bool = True) -> Tuple[str, List[dict]]:
+    """
+    Get a user's categories (their custom categories, plus the system defaults
+    they haven't overridden by name), cached per user.
+
+    Returns:
+        Tuple of (view version, categories); the version changes whenever the
+        categories do, so it can be used as an ETag
+    """
+    key = (user_id, include_system)
+    cached = _views.get(key)
+    if cached is None or cached[0] <= time.monotonic():
+        categories = _merge(await category_service.get_categories_by_user_id(user_id), include_system)
+        if len(_views) >= MAX_CACHED_VIEWS and key not in _views:
+            _views.pop(next(iter(_views)))
+        cached = _views[key] = (time.monotonic() + settings.CATEGORY_VIEW_TTL_SECONDS, _view_version(categories), categories)
+
+    # Copies, so callers can't change the cached view
+    return cached[1], [dict(category) for category in cached[2]]
+
 # Expose standalone functions that use the singleton instance
 async def get_all_categories(user_id: str, include_system: bool = True):
-    categories = await category_service.get_categories_by_user_id(user_id)
-    
-    # Add default system categories if include_system is True
-    if include_system:
-        default_categories = [
-            {"_id": "system_food", "name": "Food & Dining", "icon": "🍽️", "color": "#FF6B6B", "user_id": None},
-            {"_id": "system_transport", "name": "Transportation", "icon": "🚗", "color": "#4ECDC4", "user_id": None},
-            {"_id": "system_shopping", "name": "Shopping", "icon": "🛍️", "color": "#45B7D1", "user_id": None},
-            {"_id": "system_bills", "name": "Bills & Utilities", "icon": "💡", "color": "#FFA726", "user_id": None},
-            {"_id": "system_healthcare", "name": "Healthcare", "icon": "🏥", "color": "#EF5350", "user_id": None},
-            {"_id": "system_entertainment", "name": "Entertainment", "icon": "🎬", "color": "#AB47BC", "user_id": None},
-            {"_id": "system_education", "name": "Education", "icon": "📚", "color": "#66BB6A", "user_id": None},
-            {"_id": "system_misc", "name": "Miscellaneous", "icon": "📦", "color": "#8D6E63", "user_id": None}
-        ]
-        
-        # Add default categories that user doesn't have custom versions of
-        user_category_names = {cat.get("name", "").lower() for cat in categories}
-        for default_cat in default_categories:
-            if default_cat["name"].lower() not in user_category_names:
-                categories.append(default_cat)
-    
+    _, categories = await get_category_view(user_id, include_system)
     return categories
 
 async def create_category(user_id: str, category_data: dict):
     category_data["user_id"] = user_id
-    return await category_service.create_category(category_data)
+    created_category = await category_service.create_category(category_data)
+    invalidate_category_view(user_id)
+    return created_category
 
 async def update_category(category_id: str, user_id: str, category_data: dict):
-    # Verify the category belongs to the user
-    category = await category_service.get_category_by_id(category_id)
-    if not category or category.get("user_id") != user_id:
-        return None
-    return await category_service.update_category(category_id, category_data)
+    # Only updates the category if it belongs to the user
+    updated_category = await category_service.update_category(category_id, user_id, category_data)
+    if updated_category:
+        invalidate_category_view(user_id)
+    return updated_category
 
 async def delete_category(category_id: str, user_id: str):
-    # Verify the category belongs to the user
-    category = await category_service.get_category_by_id(category_id)
-    if not category or category.get("user_id") != user_id:
-        return False
-    return await category_service.delete_category(category_id)
\ No newline at end of file
+    # Only deletes the category if it belongs to the user
+    deleted = await category_service.delete_category(category_id, user_id)
+    if deleted:
+        invalidate_category_view(user_id)
+    return deleted
+
+async def get_known_category_names(min_users: int = 1) -> List[str]:
+    """
+    Get the names of the categories in use: the system defaults, then the
+    user-created names shared by at least min_users users, most used first.
+    """
+    names = sorted(DEFAULT_CATEGORY_NAMES)
+    cursor = category_service.categories_collection.aggregate([
+        {"$match": {"name": {"$type": "string"}, "user_id": {"$ne": None}}},
+        {"$group": {"_id": {"name": {"$trim": {"input": "$name"}}, "user_id": "$user_id"}}},
+        {"$group": {"_id": "$_id.name", "users": {"$sum": 1}}},
+        {"$match": {"_id": {"$nin": ["", *names]}, "users": {"$gte": min_users}}},
+        {"$sort": {"users": -1, "_id": 1}}
+    ])
+    async for row in cursor:
+        names.append(row["_id"])
+    return names
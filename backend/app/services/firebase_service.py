@@ -16,16 +16,34 @@ cred_dict = {
     "token_uri": "https://oauth2.googleapis.com/token",
 }
 
-try:
-    cred = credentials.Certificate(cred_dict)
-    firebase_app = firebase_admin.initialize_app(cred)
-except ValueError:
-    # App already exists
-    firebase_app = firebase_admin.get_app()
+if settings.AUTH_BACKEND == "fake":
+    # Local token verifier for development and benchmarks; no Firebase project needed
+    firebase_app = None
+else:
+    try:
+        cred = credentials.Certificate(cred_dict)
+        firebase_app = firebase_admin.initialize_app(cred)
+    except ValueError:
+        # App already exists
+        firebase_app = firebase_admin.get_app()
 
 # Security scheme for bearer token
 security = HTTPBearer()
 
+def verify_id_token(token: str) -> dict:
+    # Decode an ID token with Firebase, or with the local fake when AUTH_BACKEND=fake
+    if settings.AUTH_BACKEND == "fake":
+        from ..utils.fakes import fake_verify_id_token
+        return fake_verify_id_token(token)
+    return auth.verify_id_token(token)
+
+def get_firebase_user(uid: str):
+    # Look up a Firebase user record, or a fake one when AUTH_BACKEND=fake
+    if settings.AUTH_BACKEND == "fake":
+        from ..utils.fakes import fake_get_user
+        return fake_get_user(uid)
+    return auth.get_user(uid)
+
 async def verify_firebase_token(token: str) -> dict:
     """
     Verify Firebase ID token and return user information
@@ -40,14 +58,14 @@ async def verify_firebase_token(token: str) -> dict:
         HTTPException: If token is invalid
     """
     try:
-        decoded_token = auth.verify_id_token(token)
+        decoded_token = verify_id_token(token)
         return {
             "uid": decoded_token["uid"],
             "email": decoded_token.get("email"),
             "name": decoded_token.get("name"),
             "firebase_uid": decoded_token["uid"]
         }
-    except FirebaseError as e:
+    except (FirebaseError, ValueError) as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Invalid authentication token: {str(e)}"
@@ -0,0 +1,261 @@
+# app/services/llm_service.py
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+import google.generativeai as genai
+from pymongo import UpdateOne
+from app.config.settings import settings
+from app.utils.metrics import metrics
+from app.utils.rate_limiter import RateLimiter
+
+# Configure Gemini API with your API key - load from environment variable
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+_models: Dict[str, object] = {}
+
+# Shared by every model call in this process, so background jobs and requests draw from one quota
+rate_limiter = RateLimiter(settings.LLM_REQUESTS_PER_SECOND, settings.LLM_BURST)
+
+# Per-day usage counters waiting to be written to the llm_usage collection,
+# keyed by (day, feature, model)
+_usage_buffer: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+_usage_lock = threading.Lock()
+_last_flush = time.monotonic()
+# The background flush in flight, if any; held here since the loop only keeps weak references to tasks
+_flush_tasks: Set[asyncio.Task] = set()
+
+def get_generative_model(model_name: str):
+    """
+    Get a generative model by name, honouring LLM_BACKEND.
+
+    With LLM_BACKEND=fake a local FakeGenerativeModel is returned, so the app
+    can run and be benchmarked without Gemini.
+    """
+    model = _models.get(model_name)
+    if model is None:
+        if settings.LLM_BACKEND == "fake":
+            from app.utils.fakes import FakeGenerativeModel
+            model = FakeGenerativeModel(
+                model_name,
+                latency_ms=settings.FAKE_LLM_LATENCY_MS,
+                jitter_ms=settings.FAKE_LLM_JITTER_MS,
+                error_rate=settings.FAKE_LLM_ERROR_RATE,
+                rate_limit_rate=settings.FAKE_LLM_429_RATE,
+                overloaded_rate=settings.FAKE_LLM_503_RATE
+            )
+        else:
+            model = genai.GenerativeModel(model_name)
+        _models[model_name] = model
+    return model
+
+def estimate_cost(model_name: str, prompt_tokens: int, response_tokens: int) -> float:
+    # Estimated USD cost from the per-million-token prices in LLM_PRICING
+    pricing = settings.LLM_PRICING.get(model_name)
+    if not pricing:
+        return 0.0
+    return (prompt_tokens * pricing.get("input", 0) + response_tokens * pricing.get("output", 0)) / 1_000_000
+
+def _buffer_usage(feature: str, model_name: str, **counts: float):
+    key = (datetime.utcnow().strftime("%Y-%m-%d"), feature, model_name)
+    with _usage_lock:
+        entry = _usage_buffer.setdefault(key, {})
+        for name, value in counts.items():
+            entry[name] = entry.get(name, 0) + value
+
+def record_call(feature: str, model_name: str, latency_ms: float, usage: Any = None,
+                outcome: str = "ok", retries: int = 0):
+    """
+    Record one LLM request attempt.
+
+    Safe to call from worker threads (e.g. streaming generation).
+
+    Args:
+        feature: Calling feature, e.g. "ocr", "tips", "categorize"
+        model_name: Model the request went to
+        latency_ms: Wall time of the request
+        usage: The response's usage_metadata, if any
+        outcome: "ok", "error", "timeout" or "cancelled"
+        retries: Number of earlier failed attempts for the same logical call
+    """
+    prompt_tokens = int(getattr(usage, "prompt_token_count", 0) or 0)
+    response_tokens = int(getattr(usage, "candidates_token_count", 0) or 0)
+    cost = estimate_cost(model_name, prompt_tokens, response_tokens)
+
+    metrics.increment("llm_requests_total", feature=feature, model=model_name, outcome=outcome)
+    metrics.observe("llm_latency_ms", latency_ms, feature=feature, model=model_name)
+    if usage is not None:
+        metrics.observe("llm_prompt_tokens", prompt_tokens, feature=feature, model=model_name)
+        metrics.observe("llm_response_tokens", response_tokens, feature=feature, model=model_name)
+        metrics.increment("llm_cost_usd_total", cost, feature=feature, model=model_name)
+    if retries:
+        metrics.increment("llm_retries_total", feature=feature, model=model_name)
+
+    _buffer_usage(
+        feature, model_name,
+        calls=1,
+        errors=0 if outcome == "ok" else 1,
+        retries=1 if retries else 0,
+        prompt_tokens=prompt_tokens,
+        response_tokens=response_tokens,
+        latency_ms=latency_ms,
+        cost_usd=cost
+    )
+
+def record_cache_hit(feature: str, model_name: str = "none"):
+    # A request that was answered without calling the model
+    metrics.increment("llm_cache_hits_total", feature=feature)
+    _buffer_usage(feature, model_name, cache_hits=1)
+
+def record_parse_failure(feature: str, model_name: str):
+    # The model answered but its output could not be parsed
+    metrics.increment("llm_parse_failures_total", feature=feature, model=model_name)
+    _buffer_usage(feature, model_name, parse_failures=1)
+
+async def flush_usage():
+    """Write buffered per-day usage counters to the llm_usage collection."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    with _usage_lock:
+        pending = dict(_usage_buffer)
+        _usage_buffer.clear()
+    if not pending:
+        return
+
+    operations = [
+        UpdateOne(
+            {"date": day, "feature": feature, "model": model_name},
+            {"$inc": counts, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        for (day, feature, model_name), counts in pending.items()
+    ]
+    try:
+        from app.config.mongodb import get_database
+        db = get_database()
+        await db.llm_usage.bulk_write(operations, ordered=False)
+    except Exception as e:
+        print(f"Error flushing LLM usage: {str(e)}")
+        # Put the counts back so they go out with the next flush
+        for (day, feature, model_name), counts in pending.items():
+            with _usage_lock:
+                entry = _usage_buffer.setdefault((day, feature, model_name), {})
+                for name, value in counts.items():
+                    entry[name] = entry.get(name, 0) + value
+
+def _maybe_flush():
+    global _last_flush
+    if _flush_tasks or time.monotonic() - _last_flush < settings.LLM_USAGE_FLUSH_SECONDS:
+        return
+    # Set before the flush runs, so the calls made until then don't schedule more of them
+    _last_flush = time.monotonic()
+    task = asyncio.create_task(flush_usage())
+    _flush_tasks.add(task)
+    task.add_done_callback(_flush_tasks.discard)
+
+async def generate(feature: str, model_name: str, contents: Any, timeout: Optional[float] = None,
+                   retries: int = 0, model: Any = None, **kwargs):
+    """
+    Call generate_content off the event loop and record latency, tokens and cost.
+
+    Args:
+        feature: Calling feature, used to attribute usage
+        model_name: Model to call
+        contents: Prompt or list of prompt parts
+        timeout: Optional timeout in seconds; raises asyncio.TimeoutError when exceeded
+        retries: Number of earlier failed attempts for the same logical call
+        model: Model instance to use instead of get_generative_model(model_name)
+
+    Returns:
+        The model's response
+    """
+    model = model or get_generative_model(model_name)
+    await rate_limiter.acquire()
+    started = time.perf_counter()
+    outcome = "error"
+    response = None
+    try:
+        call = asyncio.to_thread(model.generate_content, contents, **kwargs)
+        response = await (asyncio.wait_for(call, timeout=timeout) if timeout else call)
+        outcome = "ok"
+        return response
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    finally:
+        record_call(
+            feature, model_name, (time.perf_counter() - started) * 1000,
+            usage=getattr(response, "usage_metadata", None), outcome=outcome, retries=retries
+        )
+        _maybe_flush()
+
+async def generate_stream(feature: str, model_name: str, contents: Any, timeout: Optional[float] = None,
+                          retries: int = 0, model: Any = None) -> AsyncIterator[str]:
+    """
+    Streaming form of generate: yields the response text as it arrives.
+
+    The SDK's blocking stream is read in a worker thread, which stops reading
+    as soon as this generator is closed, e.g. because the client went away.
+
+    Args:
+        feature: Calling feature, used to attribute usage
+        model_name: Model to call
+        contents: Prompt or list of prompt parts
+        timeout: Optional limit in seconds on the wait for each chunk; raises asyncio.TimeoutError
+        retries: Number of earlier failed attempts for the same logical call
+        model: Model instance to use instead of get_generative_model(model_name)
+    """
+    model = model or get_generative_model(model_name)
+    await rate_limiter.acquire()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    # Why the worker was stopped, when it was: "cancelled" or "timeout"
+    stop_reason = ["cancelled"]
+
+    def put(item):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # The loop has closed; nobody is waiting for the rest
+
+    def worker():
+        started = time.perf_counter()
+        usage = None
+        outcome = "error"
+        try:
+            for chunk in model.generate_content(contents, stream=True):
+                # Token counts arrive with the chunks; the last one has the totals
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                if stop.is_set():
+                    outcome = stop_reason[0]
+                    break
+                put(("chunk", chunk.text))
+            else:
+                outcome = "ok"
+            put(("done", None))
+        except Exception as e:
+            put(("error", e))
+        finally:
+            record_call(feature, model_name, (time.perf_counter() - started) * 1000,
+                        usage=usage, outcome=outcome, retries=retries)
+
+    loop.run_in_executor(None, worker)
+    try:
+        while True:
+            try:
+                kind, value = await asyncio.wait_for(queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                stop_reason[0] = "timeout"
+                raise
+            if kind == "chunk":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        stop.set()
+        _maybe_flush()
@@ -0,0 +1,223 @@
+# app/services/notification_hub.py
+import asyncio
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set
+from fastapi import Request
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.utils.metrics import metrics
+from app.utils.sse import format_sse
+
+class TooManyStreams(Exception):
+    """Raised when a user already has the maximum number of notification streams open."""
+
+class Subscription:
+    """One open notification stream: a bounded queue of events for one connection."""
+
+    def __init__(self, user_id: str, queue_size: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # Set when events were dropped because the client wasn't keeping up
+        self.lagged = False
+        self.closed = False
+
+    def offer(self, event: str, data: Any):
+        # Never blocks the publisher: a slow connection loses events and is told to resync instead
+        try:
+            self.queue.put_nowait((event, data))
+        except asyncio.QueueFull:
+            if not self.lagged:
+                metrics.increment("notification_stream_lagged_total")
+            self.lagged = True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+class NotificationHub:
+    """
+    In-process pub/sub of new notifications to open SSE streams.
+
+    With NOTIFICATION_FANOUT="local", notifications are published by the
+    process that creates them, which is enough for a single worker. With
+    "change_stream", every worker instead tails a MongoDB change stream on
+    the notifications collection (requires a replica set), so a notification
+    created by any worker reaches streams held by all of them.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._watcher: Optional[asyncio.Task] = None
+
+    @property
+    def publishes_locally(self) -> bool:
+        return settings.NOTIFICATION_FANOUT != "change_stream"
+
+    def connection_count(self, user_id: Optional[str] = None) -> int:
+        if user_id is not None:
+            return len(self._subscribers.get(user_id, ()))
+        return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def check_capacity(self, user_id: str):
+        """
+        Raises:
+            TooManyStreams: If the user is at NOTIFICATION_STREAM_MAX_PER_USER
+        """
+        if self.connection_count(user_id) >= settings.NOTIFICATION_STREAM_MAX_PER_USER:
+            metrics.increment("notification_stream_rejected_total")
+            raise TooManyStreams(f"At most {settings.NOTIFICATION_STREAM_MAX_PER_USER} notification streams per user")
+
+    def subscribe(self, user_id: str) -> Subscription:
+        """
+        Open a stream for a user.
+
+        Raises:
+            TooManyStreams: If the user is at NOTIFICATION_STREAM_MAX_PER_USER
+        """
+        self.check_capacity(user_id)
+        subscription = Subscription(user_id, settings.NOTIFICATION_STREAM_QUEUE_SIZE)
+        self._subscribers[user_id].add(subscription)
+        metrics.increment("notification_stream_connections_total")
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscribers.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscribers.pop(subscription.user_id, None)
+
+    def publish(self, notification: Dict[str, Any], event: str = "notification"):
+        """
+        Deliver a notification to the user's open streams in this process:
+        "notification" for a new one, "notification_updated" when a digest grew.
+        """
+        for subscription in list(self._subscribers.get(notification.get("user_id"), ())):
+            subscription.offer(event, notification)
+
+    def start(self):
+        if not self.publishes_locally and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_notifications())
+
+    async def stop(self):
+        """Stop the change stream watcher and end every open stream."""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        for subscriptions in list(self._subscribers.values()):
+            for subscription in list(subscriptions):
+                subscription.close()
+
+    async def _watch_notifications(self):
+        # Resume from the last seen event after errors, so nothing is missed across reconnects
+        resume_token = None
+        while True:
+            try:
+                db = get_database()
+                async with db.notifications.watch(
+                    [{"$match": {"$or": [
+                        {"operationType": "insert"},
+                        {"operationType": "update", "updateDescription.updatedFields.digest_count": {"$exists": True}}
+                    ]}}],
+                    full_document="updateLookup",
+                    resume_after=resume_token
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        if change.get("fullDocument"):
+                            event = "notification" if change["operationType"] == "insert" else "notification_updated"
+                            self.publish(serialize_notification(change["fullDocument"]), event=event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Notification change stream error: {str(e)}")
+                metrics.increment("notification_change_stream_errors_total")
+                await asyncio.sleep(settings.NOTIFICATION_STREAM_HEARTBEAT_SECONDS)
+
+def serialize_notification(notification: Dict[str, Any]) -> Dict[str, Any]:
+    # Same shape as the notifications list endpoint
+    payload = {key: value for key, value in notification.items() if key != "_id"}
+    if "_id" in notification:
+        payload["id"] = str(notification["_id"])
+    return payload
+
+async def stream_notifications(subscription: Subscription, request: Optional[Request] = None) -> AsyncIterator[str]:
+    """
+    Yield a connection's events as Server-Sent Events until it disconnects.
+
+    Events: "unread_count" on connect, "notification" for each new
+    notification, "notification_updated" when a digest absorbs another, and "resync" (with a fresh unread count) after events were
+    dropped because the connection fell behind; the client should then refetch
+    its notification list. A comment line is sent every
+    NOTIFICATION_STREAM_HEARTBEAT_SECONDS to keep proxies from closing the
+    connection, and the stream stops at a heartbeat if the request's client
+    has gone away.
+
+    Streams end after NOTIFICATION_STREAM_MAX_SECONDS and the client reopens
+    them after the "retry:" delay (the frontend reads the stream with fetch,
+    since it has to send a Bearer token), which spreads connections across
+    workers and keeps a graceful server shutdown from waiting on open streams.
+    """
+    from app.services.notification_service import get_notification_count
+
+    ends_at = time.monotonic() + settings.NOTIFICATION_STREAM_MAX_SECONDS
+    try:
+        yield f"retry: {settings.NOTIFICATION_STREAM_RETRY_MS}\n\n"
+        yield format_sse("unread_count", {"count": await get_notification_count(subscription.user_id)})
+        while not subscription.closed:
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(
+                    subscription.queue.get(),
+                    timeout=min(settings.NOTIFICATION_STREAM_HEARTBEAT_SECONDS, remaining)
+                )
+            except asyncio.TimeoutError:
+                # Quiet streams only notice a closed connection when a write fails, so check
+                if request is not None and await request.is_disconnected():
+                    break
+                yield ": heartbeat\n\n"
+                continue
+            if item is None:
+                break
+            yield format_sse(*item)
+
+            if subscription.lagged and subscription.queue.empty():
+                subscription.lagged = False
+                yield format_sse("resync", {"count": await get_notification_count(subscription.user_id)})
+    finally:
+        notification_hub.unsubscribe(subscription)
+
+async def open_notification_stream(user_id: str, request: Optional[Request] = None) -> AsyncIterator[str]:
+    """
+    Subscribe and stream a user's notifications, for use as a response body.
+
+    The subscription is only taken once the response starts iterating, so a
+    client that disconnects before then never holds one of the user's stream
+    slots. Callers check capacity first (check_capacity) to answer with a 429;
+    a stream that loses a race for the last slot just ends and is retried.
+    """
+    try:
+        subscription = notification_hub.subscribe(user_id)
+    except TooManyStreams:
+        return
+    stream = stream_notifications(subscription, request)
+    try:
+        async for event in stream:
+            yield event
+    finally:
+        # Closing the inner stream unsubscribes; unsubscribing again is a no-op
+        await stream.aclose()
+        notification_hub.unsubscribe(subscription)
+
+# Global instance
+notification_hub = NotificationHub()
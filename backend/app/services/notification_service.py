@@ -1,22 +1,86 @@
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import os
-import google.generativeai as genai
-from datetime import datetime
+import time
+from collections import Counter
+from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.services.llm_service import generate
+from app.services.notification_hub import notification_hub, serialize_notification
+from app.services.spending_profile_service import get_spending_profile
+from app.utils.metrics import metrics
 
-# Configure Gemini API
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
+# Unread counts keyed by user_id: (expires_at, count). The notification_counters
+# collection is the shared source; this only saves a read per poll.
+_unread_counts: Dict[str, Tuple[float, int]] = {}
+MAX_CACHED_COUNTS = 10000
+
+# Titles of digest notifications, by type
+DIGEST_TITLES = {
+    "receipt": "{count} Receipts Added",
+    "tip": "{count} New Tips"
+}
+
+# Fields kept for archived notifications
+ARCHIVE_FIELDS = ("user_id", "type", "title", "created_at", "read_at")
+ARCHIVE_BATCH_SIZE = 1000
+RECONCILE_BATCH_SIZE = 1000
 
 # Database Operations
 async def create_notification_in_db(notification_data: Dict[str, Any]) -> str:
-    # Create a new notification in the database
+    # Create a new notification in the database, or fold it into a recent unread digest of the same type
     db = get_database()
     notification_data["created_at"] = datetime.now()
+    if notification_data.get("type") in settings.NOTIFICATION_DIGEST_TYPES and not notification_data.get("is_read"):
+        digest = await _merge_into_digest(notification_data)
+        if digest:
+            if notification_hub.publishes_locally:
+                notification_hub.publish(serialize_notification(digest), event="notification_updated")
+            return str(digest["_id"])
+        notification_data["digest_until"] = notification_data["created_at"] + timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW_SECONDS)
+    
     result = await db.notifications.insert_one(notification_data)
+    if not notification_data.get("is_read"):
+        await _adjust_unread_counts({notification_data["user_id"]: 1})
+    if notification_hub.publishes_locally:
+        notification_hub.publish(serialize_notification(notification_data))
     return str(result.inserted_id)
 
+async def create_notifications_in_db(notifications: List[Dict[str, Any]], seed_counters: bool = True) -> List[str]:
+    # Create several notifications with a single insert. Notifications whose dedupe_key
+    # already exists are skipped; the ids of those actually inserted are returned.
+    # seed_counters=False upserts missing unread counters from the delta instead (see _adjust_unread_counts).
+    if not notifications:
+        return []
+    db = get_database()
+    now = datetime.now()
+    for notification_data in notifications:
+        notification_data["created_at"] = now
+    error = None
+    try:
+        await db.notifications.insert_many(notifications, ordered=False)
+        inserted = notifications
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        failed = {write_error["index"] for write_error in write_errors}
+        inserted = [notification_data for index, notification_data in enumerate(notifications) if index not in failed]
+        if any(write_error.get("code") != 11000 for write_error in write_errors):
+            error = e
+    
+    # Only count and publish what was written, even when the insert partly failed
+    await _adjust_unread_counts(Counter(
+        notification_data["user_id"] for notification_data in inserted if not notification_data.get("is_read")
+    ), seed=seed_counters)
+    if notification_hub.publishes_locally:
+        for notification_data in inserted:
+            notification_hub.publish(serialize_notification(notification_data))
+    if error:
+        raise error
+    return [str(notification_data["_id"]) for notification_data in inserted]
+
 async def get_notifications_from_db(user_id: str, limit: int = 50, skip: int = 0, include_read: bool = False) -> List[Dict[str, Any]]:
     # Get user's notifications from database
     db = get_database()
@@ -37,9 +101,11 @@ async def mark_notification_read_in_db(notification_id: str, user_id: str) -> bo
     # Mark a notification as read in the database
     db = get_database()
     result = await db.notifications.update_one(
-        {"_id": ObjectId(notification_id), "user_id": user_id},
-        {"$set": {"is_read": True}}
+        {"_id": ObjectId(notification_id), "user_id": user_id, "is_read": False},
+        {"$set": {"is_read": True, "read_at": datetime.now()}}
     )
+    if result.modified_count:
+        await _adjust_unread_counts({user_id: -1})
     return result.modified_count > 0
 
 async def mark_all_read_in_db(user_id: str) -> int:
@@ -47,14 +113,220 @@ async def mark_all_read_in_db(user_id: str) -> int:
     db = get_database()
     result = await db.notifications.update_many(
         {"user_id": user_id, "is_read": False},
-        {"$set": {"is_read": True}}
+        {"$set": {"is_read": True, "read_at": datetime.now()}}
     )
+    # Decrement rather than zero, so notifications created meanwhile still count
+    if result.modified_count:
+        await _adjust_unread_counts({user_id: -result.modified_count})
     return result.modified_count
 
+async def _merge_into_digest(notification_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Fold a notification into the user's open digest of the same type, if there is one.
+    # The digest keeps the latest message and link, a count and the most recent items.
+    db = get_database()
+    now = notification_data["created_at"]
+    item = {field: {"$literal": notification_data.get(field)} for field in ("title", "message", "link")}
+    title = DIGEST_TITLES.get(notification_data["type"], "{count} New Notifications")
+    prefix, suffix = title.split("{count}", 1)
+    return await db.notifications.find_one_and_update(
+        {
+            "user_id": notification_data["user_id"],
+            "type": notification_data["type"],
+            "is_read": False,
+            "digest_until": {"$gt": now}
+        },
+        [
+            {"$set": {
+                "digest_count": {"$add": [{"$ifNull": ["$digest_count", 1]}, 1]},
+                "digest_items": {"$slice": [
+                    {"$concatArrays": [
+                        {"$ifNull": ["$digest_items", [{"title": "$title", "message": "$message", "link": "$link"}]]},
+                        [item]
+                    ]},
+                    -settings.NOTIFICATION_DIGEST_MAX_ITEMS
+                ]},
+                "message": item["message"],
+                "link": item["link"],
+                # Sort the digest as the newest notification
+                "created_at": {"$literal": now}
+            }},
+            {"$set": {"title": {"$concat": [{"$literal": prefix}, {"$toString": "$digest_count"}, {"$literal": suffix}]}}}
+        ],
+        sort=[("created_at", -1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def _adjust_unread_counts(deltas: Dict[str, int], seed: bool = True):
+    # Apply changes to the stored unread counters and drop the cached copies. Without seed,
+    # as for broadcasts to every user, missing counters are upserted from the delta in the
+    # same bulk write, and reconcile_unread_counts adds any unread notifications they predate.
+    deltas = {user_id: delta for user_id, delta in deltas.items() if user_id and delta}
+    if not deltas:
+        return
+    db = get_database()
+    result = await db.notification_counters.bulk_write([
+        UpdateOne({"user_id": user_id}, {"$inc": {"unread": delta}}, upsert=not seed)
+        for user_id, delta in deltas.items()
+    ], ordered=False)
+    if seed and result.matched_count < len(deltas):
+        await _seed_unread_counts(db, deltas)
+    for user_id in deltas:
+        _unread_counts.pop(user_id, None)
+
+async def _seed_unread_counts(db, deltas: Dict[str, int]):
+    # Users without a counter may already have unread notifications, so a new counter
+    # starts from a count of the collection (which includes the write being applied)
+    # rather than from the delta. A counter created meanwhile just gets the delta.
+    existing = {
+        counter["user_id"]
+        async for counter in db.notification_counters.find({"user_id": {"$in": list(deltas)}}, {"user_id": 1})
+    }
+    operations = []
+    for user_id, delta in deltas.items():
+        if user_id in existing:
+            continue
+        unread = await db.notifications.count_documents({"user_id": user_id, "is_read": False})
+        operations.append(UpdateOne(
+            {"user_id": user_id},
+            [{"$set": {"unread": {"$ifNull": [{"$add": ["$unread", delta]}, unread]}}}],
+            upsert=True
+        ))
+    if operations:
+        await db.notification_counters.bulk_write(operations, ordered=False)
+
 async def get_unread_count_from_db(user_id: str) -> int:
-    # Get count of unread notifications from database
+    # Get count of unread notifications from the user's counter, cached briefly in-process
+    cached = _unread_counts.get(user_id)
+    if cached and cached[0] > time.monotonic():
+        metrics.increment("notification_count_cache_total", outcome="hit")
+        return cached[1]
+    
+    metrics.increment("notification_count_cache_total", outcome="miss")
+    db = get_database()
+    counter = await db.notification_counters.find_one({"user_id": user_id})
+    if counter is None:
+        # First poll for this user: seed the counter from the collection once
+        unread = await db.notifications.count_documents({"user_id": user_id, "is_read": False})
+        await db.notification_counters.update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": {"unread": unread}},
+            upsert=True
+        )
+        counter = await db.notification_counters.find_one({"user_id": user_id})
+    count = max(int(counter.get("unread", 0)), 0)
+    
+    if len(_unread_counts) >= MAX_CACHED_COUNTS and user_id not in _unread_counts:
+        _unread_counts.pop(next(iter(_unread_counts)))
+    _unread_counts[user_id] = (time.monotonic() + settings.NOTIFICATION_COUNT_CACHE_TTL_SECONDS, count)
+    return count
+
+async def reconcile_unread_counts():
+    """
+    Correct any drift in the unread counters by recounting unread
+    notifications per user.
+    """
+    db = get_database()
+    # Only users with unread notifications are held in memory; counters are streamed past them
+    actual = {}
+    async for row in db.notifications.aggregate([
+        {"$match": {"is_read": False}},
+        {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        if row["_id"]:
+            actual[row["_id"]] = row["unread"]
+    
+    # Counts are only rewritten where they disagree, keeping the window for racing writes small
+    fixes = {}
+    corrected = 0
+    async for counter in db.notification_counters.find({}, {"user_id": 1, "unread": 1}):
+        unread = actual.pop(counter["user_id"], 0)
+        if counter.get("unread") != unread:
+            fixes[counter["user_id"]] = unread
+        if len(fixes) >= RECONCILE_BATCH_SIZE:
+            corrected += await _write_unread_fixes(db, fixes)
+            fixes = {}
+    # Users with unread notifications but no counter yet
+    fixes.update(actual)
+    corrected += await _write_unread_fixes(db, fixes)
+    if corrected:
+        metrics.increment("notification_counters_corrected_total", corrected)
+
+async def _write_unread_fixes(db, fixes: Dict[str, int]) -> int:
+    if not fixes:
+        return 0
+    await db.notification_counters.bulk_write([
+        UpdateOne({"user_id": user_id}, {"$set": {"unread": unread}}, upsert=True)
+        for user_id, unread in fixes.items()
+    ], ordered=False)
+    for user_id in fixes:
+        _unread_counts.pop(user_id, None)
+    return len(fixes)
+    
+async def prune_notifications():
+    """
+    Prepare read notifications for expiry and, if NOTIFICATION_ARCHIVE_ENABLED,
+    move those past NOTIFICATION_READ_RETENTION_DAYS into notifications_archive
+    before the TTL index removes them.
+    """
+    db = get_database()
+    now = datetime.now()
+    # Notifications read before read_at existed start their retention period now
+    await db.notifications.update_many(
+        {"is_read": True, "read_at": {"$exists": False}},
+        {"$set": {"read_at": now}}
+    )
+    if not settings.NOTIFICATION_ARCHIVE_ENABLED:
+        return
+    
+    cutoff = now - timedelta(days=settings.NOTIFICATION_READ_RETENTION_DAYS)
+    archived = 0
+    while True:
+        expired = await db.notifications.find(
+            {"is_read": True, "read_at": {"$lt": cutoff}},
+            {field: 1 for field in ARCHIVE_FIELDS}
+        ).limit(ARCHIVE_BATCH_SIZE).to_list(length=ARCHIVE_BATCH_SIZE)
+        if not expired:
+            break
+        try:
+            await db.notifications_archive.insert_many(expired, ordered=False)
+        except BulkWriteError as e:
+            # Already archived by an earlier run that stopped before deleting
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        await db.notifications.delete_many({"_id": {"$in": [notification["_id"] for notification in expired]}})
+        archived += len(expired)
+        if len(expired) < ARCHIVE_BATCH_SIZE:
+            break
+    if archived:
+        metrics.increment("notifications_archived_total", archived)
+        print(f"Archived {archived} read notifications")
+
+async def _ensure_ttl_index(collection, field: str, seconds: int):
+    # create_index refuses to change an existing index's expiry, so update it in place instead
+    try:
+        await collection.create_index(field, expireAfterSeconds=seconds)
+    except OperationFailure as e:
+        if e.code not in (85, 86):  # IndexOptionsConflict, IndexKeySpecsConflict
+            raise
+        await collection.database.command({
+            "collMod": collection.name,
+            "index": {"keyPattern": {field: 1}, "expireAfterSeconds": seconds}
+        })
+
+async def ensure_notification_indexes():
+    """Create the notification indexes, moving the read_at TTL in place when the retention settings change."""
     db = get_database()
-    return await db.notifications.count_documents({"user_id": user_id, "is_read": False})
+    await db.notifications.create_index([("user_id", 1), ("is_read", 1), ("created_at", -1)])
+    await db.notifications.create_index([("user_id", 1), ("created_at", -1)])
+    await db.notifications.create_index([("user_id", 1), ("type", 1), ("is_read", 1), ("digest_until", -1)])
+    await db.notification_counters.create_index("user_id", unique=True)
+    
+    # Read notifications expire; when archiving, a day later than the archive job picks them up
+    retention = settings.NOTIFICATION_READ_RETENTION_DAYS * 24 * 60 * 60
+    if settings.NOTIFICATION_ARCHIVE_ENABLED:
+        retention += 24 * 60 * 60
+        await _ensure_ttl_index(db.notifications_archive, "read_at", settings.NOTIFICATION_ARCHIVE_RETENTION_DAYS * 24 * 60 * 60)
+    await _ensure_ttl_index(db.notifications, "read_at", retention)
 
 # Service Operations
 async def create_receipt_notification(user_id: str, receipt_data: Dict[str, Any]) -> str:
@@ -94,67 +366,73 @@ async def get_notification_count(user_id: str):
     # Get count of unread notifications
     return await get_unread_count_from_db(user_id)
 
+def build_budget_notification(user_id: str, category: str, current: float, limit: float) -> Dict[str, Any]:
+    # Build the notification for a budget limit being approached/exceeded
+    status = "exceeded" if current > limit else "approaching"
+    return {
+        "user_id": user_id,
+        "type": "budget",
+        "title": f"Budget Alert: {category}",
+        "message": f"You've {status} your budget for {category}. Current: ${current:.2f}, Limit: ${limit:.2f}",
+        "link": "/dashboard",
+        "image_url": "/icons/alert.png",
+        "is_read": False
+    }
+
 async def create_budget_notification(user_id: str, category: str, current: float, limit: float) -> str:
     # Create notification when budget limit is approached/exceeded
     percentage = (current / limit) * 100
     
     if percentage >= 90:
-        status = "exceeded" if percentage > 100 else "approaching"
-        title = f"Budget Alert: {category}"
-        message = f"You've {status} your budget for {category}. Current: ${current:.2f}, Limit: ${limit:.2f}"
-        
-        notification = {
-            "user_id": user_id,
-            "type": "budget",
-            "title": title,
-            "message": message,
-            "link": "/dashboard",
-            "image_url": "/icons/alert.png",
-            "is_read": False
-        }
-        
-        return await create_notification_in_db(notification)
+        return await create_notification_in_db(build_budget_notification(user_id, category, current, limit))
     
     return None
 
-async def generate_budget_tip(user_id: str, expenses: List[Dict[str, Any]]) -> Optional[str]:
-    # Generate a personalized budget tip using Gemini
+async def generate_budget_tip_text(expenses: List[Dict[str, Any]], feature: str = "budget_tip") -> str:
+    # Ask Gemini for one budgeting tip based on a list of {"category", "amount"} expenses
+    expense_summary = "\n".join([
+        f"- {expense.get('category', 'Misc')}: ${expense.get('amount', 0):.2f}"
+        for expense in expenses[:10]  # Limit to 10 expenses for prompt size
+    ])
+    
+    prompt = f"""
+    Based on these recent expenses:
+    
+    {expense_summary}
+    
+    Provide one concise, specific, and actionable budgeting tip (no more than 2 sentences) 
+    to help save money or manage finances better.
+    
+    Format your response as a single tip without any prefixes or explanations.
+    """
+    
+    response = await generate(feature, 'gemini-pro', prompt)
+    return response.text.strip()
+
+def build_budget_tip_notification(user_id: str, tip: str) -> Dict[str, Any]:
+    return {
+        "user_id": user_id,
+        "type": "tip",
+        "title": "Budget Tip",
+        "message": tip,
+        "is_read": False
+    }
+
+async def generate_budget_tip(user_id: str, expenses: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+    # Generate a personalized budget tip using Gemini, from the user's cached spending profile by default
+    if expenses is None:
+        profile = await get_spending_profile(user_id, days=30)
+        expenses = [
+            {"category": category, "amount": amount}
+            for category, amount in profile["top_spending_categories"]
+        ]
     if not expenses:
         return None
         
     try:
-        # Format expenses data for Gemini
-        expense_summary = "\n".join([
-            f"- {expense.get('category', 'Misc')}: ${expense.get('amount', 0):.2f}"
-            for expense in expenses[:10]  # Limit to 10 expenses for prompt size
-        ])
-        
-        prompt = f"""
-        Based on these recent expenses:
-        
-        {expense_summary}
-        
-        Provide one concise, specific, and actionable budgeting tip (no more than 2 sentences) 
-        to help save money or manage finances better.
-        
-        Format your response as a single tip without any prefixes or explanations.
-        """
-        
-        model = genai.GenerativeModel('gemini-pro')
-        response = model.generate_content(prompt)
-        
-        tip = response.text.strip()
-        
-        notification = {
-            "user_id": user_id,
-            "type": "tip",
-            "title": "Budget Tip",
-            "message": tip,
-            "is_read": False
-        }
-        
-        return await create_notification_in_db(notification)
+        tip = await generate_budget_tip_text(expenses)
+        return await create_notification_in_db(build_budget_tip_notification(user_id, tip))
         
     except Exception as e:
         print(f"Error generating budget tip: {str(e)}")
-        return None
\ No newline at end of file
+        return None
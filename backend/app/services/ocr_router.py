@@ -0,0 +1,103 @@
+# app/services/ocr_router.py
+import io
+from typing import Any, Dict, List, Optional, Union
+import numpy as np
+from PIL import Image, ImageOps
+from app.config.settings import settings
+
+ANALYSIS_WIDTH = 256
+INK_ROW_THRESHOLD = 0.02  # A row with more than 2% dark pixels is part of a text line
+NOISY_INK_DENSITY = 0.25  # Photos with lots of background clutter are harder to read
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "HEIC": "image/heic",
+    "HEIF": "image/heif",
+    "GIF": "image/gif"
+}
+
+def estimate_complexity(image_bytes: Union[bytes, memoryview], mime_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Estimate how hard a receipt image is to read.
+
+    The image is normalised (EXIF orientation, grayscale, fixed width) and a
+    row projection of dark pixels is used to count text lines. CPU-bound:
+    call it from a worker thread.
+
+    Args:
+        image_bytes: Raw image bytes
+        mime_type: Type already sniffed from the upload; detected by Pillow if not given
+
+    Returns:
+        Dictionary with image size, MIME type, ink density and estimated text lines
+    """
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        mime_type = mime_type or MIME_TYPES.get(img.format, "image/jpeg")
+        img = ImageOps.exif_transpose(img)
+        width, height = img.size
+        analysis_height = max(1, int(height * ANALYSIS_WIDTH / max(width, 1)))
+        gray = img.convert("L").resize((ANALYSIS_WIDTH, analysis_height))
+
+    pixels = np.asarray(gray, dtype=np.float32)
+    ink = pixels < pixels.mean() - 40
+    row_ink = ink.sum(axis=1)
+    has_ink = row_ink > ANALYSIS_WIDTH * INK_ROW_THRESHOLD
+    # A text line starts wherever an inked row follows a blank one
+    text_lines = int(has_ink[0]) + int(np.count_nonzero(has_ink[1:] & ~has_ink[:-1]))
+
+    return {
+        "width": width,
+        "height": height,
+        "megapixels": round(width * height / 1_000_000, 2),
+        "mime_type": mime_type,
+        "ink_density": round(float(ink.mean()), 4),
+        "text_lines": text_lines
+    }
+
+def get_tiers() -> List[Dict[str, Any]]:
+    return settings.OCR_MODEL_TIERS
+
+def select_tier(complexity: Dict[str, Any]) -> int:
+    """
+    Pick the cheapest model tier that can handle the estimated complexity.
+    Results that fail validation are escalated by the caller.
+
+    Args:
+        complexity: Output of estimate_complexity
+
+    Returns:
+        Index into the configured OCR model tiers
+    """
+    tiers = get_tiers()
+    tier = len(tiers) - 1
+    for index, candidate in enumerate(tiers):
+        max_lines = candidate.get("max_lines")
+        if max_lines is None or complexity.get("text_lines", 0) <= max_lines:
+            tier = index
+            break
+
+    if complexity.get("ink_density", 0) > NOISY_INK_DENSITY:
+        tier += 1
+    return min(tier, len(tiers) - 1)
+
+def totals_consistent(result: Dict[str, Any]) -> bool:
+    """
+    Check the parsed total against the sum of the parsed items.
+
+    The total may exceed the item sum by a bounded amount to allow for tax and fees.
+    """
+    items = result.get("items") or []
+    try:
+        total = float(result.get("total_amount") or 0)
+        items_sum = sum(float(item.get("price") or 0) * float(item.get("quantity") or 1) for item in items)
+    except (TypeError, ValueError):
+        return False
+
+    if not items or total <= 0:
+        return False
+
+    difference = total - items_sum
+    tolerance = max(0.05, total * 0.01)
+    return abs(difference) <= tolerance or 0 <= difference <= total * settings.OCR_MAX_TAX_RATIO
@@ -2,140 +2,205 @@ import base64
 import os
 import time
 import asyncio
-from typing import Dict, Any
-import google.generativeai as genai
+from typing import Dict, Any, Optional, Union
 from datetime import datetime
+from app.services.ocr_router import estimate_complexity, select_tier, get_tiers, totals_consistent
+from app.services.llm_service import generate, record_parse_failure
+from app.utils.metrics import metrics
+from app.utils.uploads import SCAN_IMAGE_TYPES, sniff_image_type
 
-# Configure Gemini API with your API key - load from environment variable
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
 
-async def process_receipt_image(image_data: str, is_base64: bool = False) -> Dict[str, Any]:
+# Create prompt for receipt extraction
+RECEIPT_PROMPT = """
+Analyze this receipt image and extract the following information:
+- Store name
+- Date (in YYYY-MM-DD format)
+- Total amount
+- List of items with their names, prices, and if possible categories
+
+Format your response as a JSON object with these keys:
+{
+  "store_name": "Store Name",
+  "date": "YYYY-MM-DD",
+  "total_amount": 123.45,
+  "items": [
+    {
+      "name": "Item name",
+      "price": 12.34,
+      "quantity": 1,
+      "category": "groceries"
+    },
+    ...
+  ]
+}
+Return only the JSON object, nothing else.
+"""
+
+def _fallback_receipt(error: str) -> Dict[str, Any]:
+    return {
+        "error": error,
+        "store_name": "Unknown Store",
+        "date": datetime.now(),
+        "total_amount": 0,
+        "items": [
+            {
+                "name": "Please add items manually",
+                "price": 0.0,
+                "quantity": 1,
+                "category": "other"
+            }
+        ],
+        "manual_entry_required": True
+    }
+
+def _decode_image(image_data: Union[str, bytes, memoryview], is_base64: bool) -> Union[bytes, memoryview]:
+    if isinstance(image_data, (bytes, bytearray, memoryview)):
+        # Raw image bytes already in memory (e.g. from the upload pipeline), used without copying
+        return image_data
+
+    if is_base64:
+        # Handle base64 image data
+        if ',' in image_data:
+            return base64.b64decode(image_data.split(',')[1])
+        return base64.b64decode(image_data)
+
+    # Handle file path
+    with open(image_data, 'rb') as image_file:
+        return image_file.read()
+
+def parse_receipt_json(result_text: str) -> Dict[str, Any]:
+    # Parse the model's response text as JSON, converting the date to a datetime
+    import json
+    # Clean the response to handle potential formatting issues
+    if '```json' in result_text:
+        result_text = result_text.split('```json')[1].split('```')[0].strip()
+    elif '```' in result_text:
+        result_text = result_text.split('```')[1].split('```')[0].strip()
+
+    result = json.loads(result_text)
+
+    # Convert date string to datetime
+    if 'date' in result and result['date']:
+        try:
+            result['date'] = datetime.fromisoformat(result['date'])
+        except ValueError:
+            # Handle different date formats
+            from dateutil import parser
+            result['date'] = parser.parse(result['date'])
+
+    return result
+
+def is_transient_error(error: Exception) -> bool:
+    # Overload, timeout and rate limit errors are worth retrying after a backoff
+    error_msg = str(error).lower()
+    return isinstance(error, asyncio.TimeoutError) or any(
+        keyword in error_msg for keyword in ['overloaded', '503', 'deadline', 'timeout', 'timed out', 'rate limit']
+    )
+
+async def _extract_receipt(image_bytes: bytes, mime_type: str, model_name: str, timeout: float) -> Dict[str, Any]:
     """
-    Process receipt image using Gemini Vision API with retry logic
-    
-    Args:
-        image_data: Base64 encoded image string or file path
-        is_base64: If True, treat image_data as base64, otherwise as file path
-        
+    Run one model tier over the image with retry logic for transient errors.
+
     Returns:
-        Extracted receipt data
+        Extracted receipt data, or fallback data containing an "error" key
     """
     max_retries = 3
     base_delay = 1  # Start with 1 second delay
-    
+
     for attempt in range(max_retries):
         try:
-            if is_base64:
-                # Handle base64 image data
-                if ',' in image_data:
-                    image_bytes = base64.b64decode(image_data.split(',')[1])
-                else:
-                    image_bytes = base64.b64decode(image_data)
-            else:
-                # Handle file path
-                with open(image_data, 'rb') as image_file:
-                    image_bytes = image_file.read()
-            
-            # Initialize Gemini Pro Flash model (faster than pro-vision)
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            # Create prompt for receipt extraction
-            prompt = """
-            Analyze this receipt image and extract the following information:
-            - Store name
-            - Date (in YYYY-MM-DD format)
-            - Total amount
-            - List of items with their names, prices, and if possible categories
-            
-            Format your response as a JSON object with these keys:
-            {
-              "store_name": "Store Name",
-              "date": "YYYY-MM-DD",
-              "total_amount": 123.45,
-              "items": [
-                {
-                  "name": "Item name",
-                  "price": 12.34,
-                  "quantity": 1,
-                  "category": "groceries"
-                },
-                ...
-              ]
-            }
-            Return only the JSON object, nothing else.
-            """
-            
-            # Generate content with the image (shorter timeout)
+            # Generate content with the image
             try:
-                response = await asyncio.wait_for(
-                    asyncio.to_thread(
-                        model.generate_content,
-                        [prompt, {"mime_type": "image/jpeg", "data": image_bytes}]
-                    ),
-                    timeout=30.0  # Reduced timeout to 30 seconds
+                response = await generate(
+                    "ocr", model_name,
+                    [RECEIPT_PROMPT, {"mime_type": mime_type, "data": image_bytes}],
+                    timeout=timeout, retries=attempt
                 )
             except asyncio.TimeoutError:
-                raise Exception("Request timed out after 30 seconds")
-            
-            # Parse the response text as JSON
-            import json
-            result_text = response.text
-            # Clean the response to handle potential formatting issues
-            if '```json' in result_text:
-                result_text = result_text.split('```json')[1].split('```')[0].strip()
-            elif '```' in result_text:
-                result_text = result_text.split('```')[1].split('```')[0].strip()
-            
-            result = json.loads(result_text)
-            
-            # Convert date string to datetime
-            if 'date' in result and result['date']:
-                try:
-                    result['date'] = datetime.fromisoformat(result['date'])
-                except ValueError:
-                    # Handle different date formats
-                    from dateutil import parser
-                    result['date'] = parser.parse(result['date'])
-            
-            return result
-            
+                raise Exception(f"Request timed out after {timeout:g} seconds")
+
+            try:
+                return parse_receipt_json(response.text)
+            except ValueError:
+                record_parse_failure("ocr", model_name)
+                raise
+
         except Exception as e:
-            error_msg = str(e).lower()
-            print(f"Error processing receipt with Gemini (attempt {attempt + 1}/{max_retries}): {str(e)}")
-            
+            print(f"Error processing receipt with {model_name} (attempt {attempt + 1}/{max_retries}): {str(e)}")
+
             # Check if it's a retryable error
-            if any(keyword in error_msg for keyword in ['overloaded', '503', 'deadline', 'timeout', 'rate limit']):
+            if is_transient_error(e):
                 if attempt < max_retries - 1:  # Don't wait after the last attempt
                     delay = base_delay * (2 ** attempt)  # Exponential backoff
                     print(f"Retrying in {delay} seconds...")
                     await asyncio.sleep(delay)
                     continue
-            
+
             # For non-retryable errors or after max retries, return fallback data
             print(f"Providing fallback data due to persistent errors")
-            return {
-                "error": f"AI service temporarily unavailable. Please enter receipt details manually.",
-                "store_name": "Unknown Store",
-                "date": datetime.now(),
-                "total_amount": 0,
-                "items": [
-                    {
-                        "name": "Please add items manually",
-                        "price": 0.0,
-                        "quantity": 1,
-                        "category": "other"
-                    }
-                ],
-                "manual_entry_required": True
-            }
-    
+            return _fallback_receipt("AI service temporarily unavailable. Please enter receipt details manually.")
+
     # If we somehow exit the loop without returning, provide fallback
-    return {
-        "error": "Unexpected error occurred",
-        "store_name": "Unknown Store", 
-        "date": datetime.now(),
-        "total_amount": 0,
-        "items": [],
-        "manual_entry_required": True
-    }
\ No newline at end of file
+    return _fallback_receipt("Unexpected error occurred")
+
+async def process_receipt_image(image_data: Union[str, bytes, memoryview], is_base64: bool = False,
+                                mime_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Process receipt image using Gemini Vision API, routing it to a model tier
+    based on the image's estimated complexity
+
+    Args:
+        image_data: Raw image bytes, base64 encoded image string or file path
+        is_base64: If True, treat image_data as base64, otherwise as file path
+        mime_type: Type sniffed from the upload; sniffed here if not given
+
+    Returns:
+        Extracted receipt data
+    """
+    try:
+        image_bytes = _decode_image(image_data, is_base64)
+    except Exception as e:
+        print(f"Error reading receipt image: {str(e)}")
+        return _fallback_receipt("Could not read the receipt image. Please enter receipt details manually.")
+
+    mime_type = mime_type or sniff_image_type(image_bytes)
+    if mime_type is not None and mime_type not in SCAN_IMAGE_TYPES:
+        return _fallback_receipt("Unsupported image format. Please upload a JPEG, PNG, WebP or HEIC image.")
+
+    try:
+        complexity = await asyncio.to_thread(estimate_complexity, image_bytes, mime_type)
+    except Exception as e:
+        # Unreadable by Pillow (e.g. HEIC without a plugin); let the default tier try anyway
+        print(f"Could not estimate receipt complexity: {str(e)}")
+        complexity = {"mime_type": mime_type or "image/jpeg", "text_lines": 0, "ink_density": 0}
+
+    tiers = get_tiers()
+    tier_index = select_tier(complexity)
+    metrics.observe("ocr_estimated_text_lines", complexity.get("text_lines", 0))
+
+    # The Gemini SDK only accepts bytes, so materialise the buffer once for all attempts
+    if not isinstance(image_bytes, bytes):
+        image_bytes = bytes(image_bytes)
+
+    while True:
+        tier = tiers[tier_index]
+        started = time.perf_counter()
+        result = await _extract_receipt(image_bytes, complexity["mime_type"], tier["model"], tier["timeout"])
+        metrics.observe("ocr_tier_latency_ms", (time.perf_counter() - started) * 1000, model=tier["model"])
+
+        if "error" in result:
+            metrics.increment("ocr_tier_requests_total", model=tier["model"], outcome="error")
+            return result
+
+        # Escalate to a stronger tier only when the totals don't add up
+        if totals_consistent(result):
+            metrics.increment("ocr_tier_requests_total", model=tier["model"], outcome="consistent")
+            return result
+
+        metrics.increment("ocr_tier_requests_total", model=tier["model"], outcome="inconsistent")
+        if tier_index >= len(tiers) - 1:
+            return result
+
+        print(f"Receipt totals inconsistent with {tier['model']}, escalating to {tiers[tier_index + 1]['model']}")
+        metrics.increment("ocr_tier_escalations_total", from_model=tier["model"], to_model=tiers[tier_index + 1]["model"])
+        tier_index += 1
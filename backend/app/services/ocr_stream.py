@@ -0,0 +1,205 @@
+# app/services/ocr_stream.py
+import asyncio
+import json
+import re
+import time
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Union
+from fastapi import Request
+from app.config.settings import settings
+from app.services.ocr_router import estimate_complexity, select_tier, get_tiers, totals_consistent
+from app.services.llm_service import generate_stream, record_parse_failure
+from app.services.ocr_service import RECEIPT_PROMPT, is_transient_error, parse_receipt_json
+from app.utils.metrics import metrics
+from app.utils.sse import format_sse
+
+SCALAR_FIELDS = ("store_name", "date", "total_amount")
+JSON_SCALAR = r'("(?:[^"\\]|\\.)*"|-?\d+(?:\.\d+)?|null)'
+
+# Attempts at a streaming scan; only retried while nothing has been sent to the client
+MAX_STREAM_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 1
+
+class IncrementalReceiptParser:
+    """
+    Parses the receipt JSON as it streams in from the model.
+
+    Top-level scalar fields are emitted once their value is complete, and each
+    object in the "items" array is emitted as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.emitted_fields = set()
+        self.items_emitted = 0
+        self._items_pos: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_start: Optional[int] = None
+        self._items_closed = False
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self.buffer += chunk
+        events = []
+
+        for field in SCALAR_FIELDS:
+            if field in self.emitted_fields:
+                continue
+            # A terminator after the value proves the value itself is complete
+            match = re.search(r'"' + field + r'"\s*:\s*' + JSON_SCALAR + r'\s*[,}\n]', self.buffer)
+            if match:
+                self.emitted_fields.add(field)
+                events.append((field, json.loads(match.group(1))))
+
+        if self._items_pos is None:
+            match = re.search(r'"items"\s*:\s*\[', self.buffer)
+            if match:
+                self._items_pos = match.end()
+
+        if self._items_pos is not None and not self._items_closed:
+            events.extend(self._scan_items())
+
+        return events
+
+    def _scan_items(self) -> List[Tuple[str, Any]]:
+        events = []
+        position = self._items_pos
+        while position < len(self.buffer):
+            char = self.buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._item_start = position
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0 and self._item_start is not None:
+                    try:
+                        item = json.loads(self.buffer[self._item_start:position + 1])
+                        self.items_emitted += 1
+                        events.append(("item", item))
+                    except json.JSONDecodeError:
+                        pass
+                    self._item_start = None
+            elif char == "]" and self._depth == 0:
+                self._items_closed = True
+                position += 1
+                break
+            position += 1
+        self._items_pos = position
+        return events
+
+class TooManyPendingScans(Exception):
+    """Raised when a scan can't be staged without exceeding the per-user or total limits."""
+
+# Images staged by POST /api/scan/stream, waiting for the client to open the event stream.
+# The scan id is random and single use, so it authorises the GET on its own: EventSource
+# can't send an Authorization header.
+_pending_scans: Dict[str, Dict[str, Any]] = {}
+_pending_bytes = 0
+
+def _drop_pending_scan(scan_id: str) -> Optional[Dict[str, Any]]:
+    global _pending_bytes
+    scan = _pending_scans.pop(scan_id, None)
+    if scan:
+        _pending_bytes -= len(scan["image_bytes"])
+    return scan
+
+def stage_scan(user_id: str, image_bytes: Union[bytes, memoryview], mime_type: str) -> str:
+    global _pending_bytes
+    # Drop expired staged scans before adding a new one
+    now = time.monotonic()
+    for scan_id in [key for key, scan in _pending_scans.items() if scan["expires_at"] < now]:
+        _drop_pending_scan(scan_id)
+
+    if sum(1 for scan in _pending_scans.values() if scan["user_id"] == user_id) >= settings.SCAN_STREAM_MAX_PENDING_PER_USER:
+        metrics.increment("ocr_stream_rejected_total", reason="per_user")
+        raise TooManyPendingScans("Too many scans waiting to be streamed; open or let the earlier ones expire first")
+    if _pending_bytes + len(image_bytes) > settings.SCAN_STREAM_MAX_PENDING_BYTES:
+        metrics.increment("ocr_stream_rejected_total", reason="memory")
+        raise TooManyPendingScans("The scanner is busy; please try again shortly")
+
+    scan_id = uuid.uuid4().hex
+    _pending_scans[scan_id] = {
+        "user_id": user_id,
+        "image_bytes": image_bytes,
+        "mime_type": mime_type,
+        "expires_at": now + settings.SCAN_STREAM_TTL_SECONDS
+    }
+    _pending_bytes += len(image_bytes)
+    return scan_id
+
+def claim_scan(scan_id: str) -> Optional[Tuple[Union[bytes, memoryview], str]]:
+    # Staged scans are single use and expire if their stream isn't opened in time
+    scan = _pending_scans.get(scan_id)
+    if not scan or scan["expires_at"] < time.monotonic():
+        return None
+    _drop_pending_scan(scan_id)
+    return scan["image_bytes"], scan["mime_type"]
+
+async def stream_receipt_image(image_bytes: Union[bytes, memoryview], mime_type: str,
+                               request: Optional[Request] = None) -> AsyncIterator[str]:
+    """
+    Scan a receipt with Gemini's streaming generation, yielding Server-Sent Events.
+
+    Events: store_name, date, total_amount, item (one per item), then a final
+    "result" with the validated receipt, or "error". The scan stops reading
+    the model's stream once the request's client has disconnected.
+    """
+    started = time.perf_counter()
+    try:
+        complexity = await asyncio.to_thread(estimate_complexity, image_bytes, mime_type)
+    except Exception:
+        complexity = {"mime_type": mime_type, "text_lines": 0, "ink_density": 0}
+    tier = get_tiers()[select_tier(complexity)]
+    yield format_sse("started", {"model": tier["model"]})
+
+    contents = [RECEIPT_PROMPT, {"mime_type": complexity["mime_type"], "data": bytes(image_bytes)}]
+    try:
+        for attempt in range(MAX_STREAM_ATTEMPTS):
+            parser = IncrementalReceiptParser()
+            try:
+                async with aclosing(generate_stream("ocr_stream", tier["model"], contents,
+                                                    timeout=tier["timeout"], retries=attempt)) as stream:
+                    async for text in stream:
+                        if request is not None and await request.is_disconnected():
+                            # Closing the stream stops the worker reading the rest of the response
+                            metrics.increment("ocr_stream_disconnects_total")
+                            return
+                        for event, value in parser.feed(text):
+                            if event == "item" and parser.items_emitted == 1:
+                                metrics.observe("ocr_stream_first_item_ms", (time.perf_counter() - started) * 1000)
+                            yield format_sse(event, {event: value} if event != "item" else value)
+                break
+            except Exception as e:
+                # Partial results have already gone out, so only a scan that sent nothing is retried
+                if parser.emitted_fields or parser.items_emitted or attempt == MAX_STREAM_ATTEMPTS - 1 or not is_transient_error(e):
+                    raise
+                print(f"Retrying streaming scan after error (attempt {attempt + 1}/{MAX_STREAM_ATTEMPTS}): {str(e)}")
+                await asyncio.sleep(RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+
+        try:
+            result = parse_receipt_json(parser.buffer)
+        except ValueError:
+            record_parse_failure("ocr_stream", tier["model"])
+            raise
+        result["totals_consistent"] = totals_consistent(result)
+        metrics.observe("ocr_stream_total_ms", (time.perf_counter() - started) * 1000, model=tier["model"])
+        yield format_sse("result", result)
+    except asyncio.TimeoutError:
+        metrics.increment("ocr_stream_errors_total", reason="timeout")
+        yield format_sse("error", {"error": f"Request timed out after {tier['timeout']:g} seconds"})
+    except Exception as e:
+        print(f"Error streaming receipt scan: {str(e)}")
+        metrics.increment("ocr_stream_errors_total", reason="error")
+        yield format_sse("error", {"error": "AI service temporarily unavailable. Please enter receipt details manually."})
@@ -2,8 +2,45 @@
 from datetime import datetime
 from app.config.mongodb import get_database
 from bson import ObjectId
-from typing import List, Dict
+from bson.errors import InvalidId
+from collections import defaultdict
+from typing import List, Dict, Optional
+from fastapi import HTTPException
+from pymongo import ReturnDocument
 from app.models.receipt_model import Receipt, ReceiptItem, SharedExpense
+from app.services.blob_store import add_reference, get_blob, put_bytes, release_reference
+from app.services.budget_alert_service import apply_receipt_change, apply_receipt_changes
+from app.services.spending_profile_service import invalidate_spending_profile
+from app.config.settings import settings
+from app.utils.signed_urls import sign_path
+from app.utils.uploads import decode_data_url
+
+async def _attach_image(receipt_data: dict):
+    # Keep the image in the blob store and reference it from the receipt, rather than
+    # storing it inline: either a blob from a scan, or a base64 data URL sent as image_url
+    blob_id = receipt_data.pop("image_blob", None)
+    image_bytes = decode_data_url(receipt_data.get("image_url"))
+    if image_bytes is not None:
+        try:
+            blob_id = (await put_bytes(image_bytes))["id"]
+        except HTTPException as e:
+            print(f"Warning: keeping receipt image inline: {e.detail}")
+            return
+    
+    if blob_id and await add_reference(blob_id):
+        receipt_data["image_blob"] = blob_id
+        # Responses carry a signed URL instead (see _image_url); don't keep the inline copy
+        receipt_data["image_url"] = ""
+
+def receipt_image_path(receipt_id) -> str:
+    return f"/api/receipts/{receipt_id}/image"
+
+def _image_url(receipt: dict) -> str:
+    # The image endpoint is loaded from <img src>, which can't send a Bearer header,
+    # so stored images are linked with a short-lived signed URL
+    if receipt.get("image_blob"):
+        return sign_path(receipt_image_path(receipt["_id"]), settings.RECEIPT_IMAGE_URL_TTL_SECONDS)
+    return receipt.get("image_url")
 
 async def save_receipt(receipt_data: dict):
     """Save a new receipt to the database and return the complete receipt object."""
@@ -16,8 +53,12 @@ async def save_receipt(receipt_data: dict):
         if receipt_data.get("is_shared"):
             receipt_data["shared_expenses"] = await _calculate_shared_expenses(receipt_data["items"])
         
+        await _attach_image(receipt_data)
+        
         # Insert receipt
         result = await db.receipts.insert_one(receipt_data)
+        invalidate_spending_profile(receipt_data.get("user_id"))
+        await apply_receipt_change(receipt_data.get("user_id"), after=receipt_data)
         
         # Retrieve the inserted receipt
         inserted_receipt = await db.receipts.find_one({"_id": result.inserted_id})
@@ -36,7 +77,7 @@ async def save_receipt(receipt_data: dict):
             "items": inserted_receipt.get("items", []),
             "store_name": inserted_receipt.get("store_name"),
             "total_amount": inserted_receipt.get("total_amount", 0),
-            "image_url": inserted_receipt.get("image_url")
+            "image_url": _image_url(inserted_receipt)
         }
         
         return formatted_receipt
@@ -45,6 +86,27 @@ async def save_receipt(receipt_data: dict):
         print(f"Error saving receipt: {str(e)}")
         raise e
 
+async def save_receipts(receipts: List[dict]) -> List[str]:
+    """Save several receipts with a single insert_many and return their ids."""
+    db = get_database()
+    now = datetime.now()
+    for receipt_data in receipts:
+        receipt_data["created_at"] = now
+        receipt_data["updated_at"] = now
+        await _attach_image(receipt_data)
+    
+    if not receipts:
+        return []
+    
+    result = await db.receipts.insert_many(receipts)
+    by_user = defaultdict(list)
+    for receipt_data in receipts:
+        by_user[receipt_data.get("user_id")].append((None, receipt_data))
+    for user_id, changes in by_user.items():
+        invalidate_spending_profile(user_id)
+        await apply_receipt_changes(user_id, changes)
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
 async def _calculate_shared_expenses(items: List[ReceiptItem]) -> List[SharedExpense]:
     # Calculate shared expenses based on item assignments.
     shared_expenses: Dict[str, SharedExpense] = {}
@@ -90,6 +152,7 @@ async def assign_items_to_user(receipt_id: str, user_id: str, item_ids: List[str
         {"_id": ObjectId(receipt_id)},
         {"$set": receipt}
     )
+    invalidate_spending_profile(user_id)
     
     return await get_receipt(receipt_id, user_id)
 
@@ -126,7 +189,7 @@ async def get_receipt(receipt_id: str, user_id: str):
             "items": receipt.get("items", []),
             "store_name": receipt.get("store_name"),
             "total_amount": total_amount,
-            "image_url": receipt.get("image_url"),
+            "image_url": _image_url(receipt),
             "shared_expenses": receipt.get("shared_expenses", [])
         }
         return formatted_receipt
@@ -208,20 +271,27 @@ async def update_receipt(receipt_id: str, user_id: str, updates: dict):
     # Update a receipt.
     db = get_database()
     updates["updated_at"] = datetime.now()
+    # The image reference is owned by the blob store's reference count
+    updates.pop("image_blob", None)
     
     # If items are updated, recalculate shared expenses
     if "items" in updates:
         updates["shared_expenses"] = await _calculate_shared_expenses(updates["items"])
     
-    # Update receipt
-    result = await db.receipts.update_one(
+    # Update receipt, keeping the previous version so budget state can apply the difference
+    previous = await db.receipts.find_one_and_update(
         {"_id": ObjectId(receipt_id), "user_id": user_id},
-        {"$set": updates}
+        {"$set": updates},
+        return_document=ReturnDocument.BEFORE
     )
     
-    if result.modified_count:
-        # Get and return updated receipt
-        receipt = await db.receipts.find_one({"_id": ObjectId(receipt_id)})
+    if previous:
+        invalidate_spending_profile(user_id)
+        receipt = {**previous, **updates}
+        await apply_receipt_change(user_id, before=previous, after=receipt)
+        
+        # Return updated receipt
+        receipt["image_url"] = _image_url(receipt)
         receipt["id"] = str(receipt["_id"])
         del receipt["_id"]
         return receipt
@@ -231,9 +301,32 @@ async def update_receipt(receipt_id: str, user_id: str, updates: dict):
 async def delete_receipt(receipt_id: str, user_id: str):
     # Delete a receipt.
     db = get_database()
-    result = await db.receipts.delete_one({
+    deleted = await db.receipts.find_one_and_delete({
         "_id": ObjectId(receipt_id),
         "user_id": user_id
     })
     
-    return result.deleted_count > 0
\ No newline at end of file
+    if deleted:
+        invalidate_spending_profile(user_id)
+        await apply_receipt_change(user_id, before=deleted)
+        if deleted.get("image_blob"):
+            await release_reference(deleted["image_blob"])
+    return deleted is not None
+
+async def get_receipt_image(receipt_id: str) -> Optional[dict]:
+    """
+    Get the blob record of a receipt's stored image, or None if it has none.
+    Callers check access first, via the signed URL from _image_url.
+    """
+    db = get_database()
+    try:
+        receipt = await db.receipts.find_one({"_id": ObjectId(receipt_id)}, {"image_blob": 1})
+    except InvalidId:
+        return None
+    if not receipt or not receipt.get("image_blob"):
+        return None
+    return await get_blob(receipt["image_blob"])
+
+async def ensure_receipt_indexes():
+    db = get_database()
+    await db.receipts.create_index([("user_id", 1), ("date", -1)])
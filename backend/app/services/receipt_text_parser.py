@@ -0,0 +1,315 @@
+# app/services/receipt_text_parser.py
+import hashlib
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from app.config.mongodb import get_database
+from app.config.settings import settings
+
+DEFAULT_CATEGORY = "other"
+
+PRICE = r"\$?(?P<price>-?\d{1,6}[.,]\d{2})-?"
+TAX_FLAG = r"(?:\s+[A-Z*]{1,2})?"
+
+# Item line layouts, tried in order (a merchant template may promote one of them)
+ITEM_PATTERNS = {
+    "qty_prefix": re.compile(
+        r"^(?P<qty>\d{1,3}(?:\.\d+)?)\s*[xX@*]\s+(?P<name>.*?[A-Za-z].*?)\s+" + PRICE + TAX_FLAG + r"$"
+    ),
+    "qty_unit_total": re.compile(
+        r"^(?P<name>.*?[A-Za-z].*?)\s+(?P<qty>\d{1,3}(?:\.\d+)?)\s*[xX@]\s*\$?(?P<unit>\d+[.,]\d{2})\s+"
+        + PRICE + TAX_FLAG + r"$"
+    ),
+    "name_price": re.compile(
+        r"^(?P<name>.*?[A-Za-z].*?)(?:\s+|\s*\.{2,}\s*)" + PRICE + TAX_FLAG + r"$"
+    ),
+}
+
+# A quantity line that belongs to the item name on the previous line, e.g. "2 @ 0.59   1.18"
+QUANTITY_LINE = re.compile(
+    r"^(?P<qty>\d{1,3}(?:\.\d+)?)\s*[xX@]\s*\$?(?P<unit>\d+[.,]\d{2})(?:\s*(?:ea|each|/ea))?(?:\s+" + PRICE + r")?$",
+    re.IGNORECASE
+)
+
+SUBTOTAL_LINE = re.compile(r"^sub\s*-?\s*total\b.*?" + PRICE + r"\s*$", re.IGNORECASE)
+TOTAL_LINE = re.compile(r"^(?:grand\s+)?(?:total|balance\s+due|amount\s+due)\b(?!\s+(?:savings|saved|items|discount)).*?" + PRICE + r"\s*$", re.IGNORECASE)
+TAX_LINE = re.compile(r"^(?:sales\s+)?(?:tax|gst|hst|pst|vat)\b.*?" + PRICE + r"\s*$", re.IGNORECASE)
+IGNORED_LINE = re.compile(
+    r"^(?:cash|change|visa|mastercard|amex|debit|credit|card|tend|tendered|payment|paid|"
+    r"rounding|savings|you saved|discount total|points|balance|auth|ref|approval)\b",
+    re.IGNORECASE
+)
+PRICE_ANYWHERE = re.compile(r"\d+[.,]\d{2}\b")
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12
+}
+DATE_PATTERNS = [
+    ("ymd", re.compile(r"\b(?P<y>\d{4})[-/.](?P<m>\d{1,2})[-/.](?P<d>\d{1,2})\b")),
+    ("mdy", re.compile(r"\b(?P<a>\d{1,2})[-/.](?P<b>\d{1,2})[-/.](?P<y>\d{4}|\d{2})\b")),
+    ("month_name", re.compile(r"\b(?P<mon>[A-Za-z]{3})[a-z]*\.?\s+(?P<d>\d{1,2}),?\s+(?P<y>\d{4})\b")),
+    ("day_month_name", re.compile(r"\b(?P<d>\d{1,2})\s+(?P<mon>[A-Za-z]{3})[a-z]*\.?,?\s+(?P<y>\d{4})\b")),
+]
+
+def _to_amount(value: str) -> float:
+    return float(value.replace(",", "."))
+
+def _normalize_line(line: str) -> str:
+    return re.sub(r"\s+", " ", line).strip()
+
+def header_key(lines: List[str]) -> Optional[str]:
+    # Merchants are recognised by their first two header lines, ignoring digits (store numbers, phones)
+    header = [re.sub(r"[\d\W]+", " ", line).strip().lower() for line in lines[:2]]
+    header = [line for line in header if line]
+    if not header:
+        return None
+    return hashlib.sha1("|".join(header).encode("utf-8")).hexdigest()
+
+def parse_date(text: str) -> Optional[str]:
+    """
+    Find the first recognisable date in the receipt text.
+
+    Returns:
+        Date in ISO (YYYY-MM-DD) format, or None
+    """
+    for kind, pattern in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            try:
+                groups = match.groupdict()
+                year = int(groups["y"])
+                if year < 100:
+                    year += 2000
+                if kind == "ymd":
+                    month, day = int(groups["m"]), int(groups["d"])
+                elif kind == "mdy":
+                    # Month first unless the first number can only be a day
+                    first, second = int(groups["a"]), int(groups["b"])
+                    month, day = (second, first) if first > 12 else (first, second)
+                else:
+                    month = MONTHS.get(groups["mon"][:3].lower())
+                    day = int(groups["d"])
+                    if not month:
+                        continue
+                return datetime(year, month, day).date().isoformat()
+            except ValueError:
+                continue
+    return None
+
+def _guess_store_name(lines: List[str]) -> Optional[str]:
+    for line in lines[:3]:
+        letters = sum(ch.isalpha() for ch in line)
+        if letters >= 3 and letters >= len(line.replace(" ", "")) * 0.6 and not PRICE_ANYWHERE.search(line):
+            return line
+    return None
+
+def parse_receipt_text(text: str, template: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], float]:
+    """
+    Parse pasted receipt text without calling the LLM.
+
+    Args:
+        text: Raw receipt text
+        template: Optional learned merchant template for this receipt's header
+
+    Returns:
+        Tuple of (receipt data in the /api/scan/text format, confidence between 0 and 1)
+    """
+    lines = [_normalize_line(line) for line in text.splitlines()]
+    lines = [line for line in lines if line]
+
+    template = template or {}
+    item_categories = template.get("item_categories", {})
+    pattern_order = list(ITEM_PATTERNS)
+    if template.get("item_pattern") in ITEM_PATTERNS:
+        pattern_order.remove(template["item_pattern"])
+        pattern_order.insert(0, template["item_pattern"])
+
+    items: List[Dict[str, Any]] = []
+    subtotal = total = None
+    tax = 0.0
+    pending_name = None
+    unparsed_price_lines = 0
+    price_lines = 0
+    pattern_hits: Dict[str, int] = {}
+
+    for line in lines:
+        has_price = bool(PRICE_ANYWHERE.search(line))
+        if has_price:
+            price_lines += 1
+
+        # Summary lines end the item section once the total is known
+        subtotal_match = SUBTOTAL_LINE.match(line)
+        if subtotal_match:
+            subtotal = _to_amount(subtotal_match.group("price"))
+            pending_name = None
+            continue
+        total_match = TOTAL_LINE.match(line)
+        if total_match:
+            if total is None:
+                total = _to_amount(total_match.group("price"))
+            pending_name = None
+            continue
+        tax_match = TAX_LINE.match(line)
+        if tax_match:
+            tax += _to_amount(tax_match.group("price"))
+            continue
+        if total is not None or IGNORED_LINE.match(line):
+            continue
+
+        quantity_match = QUANTITY_LINE.match(line)
+        if quantity_match and pending_name:
+            quantity = float(quantity_match.group("qty"))
+            unit_price = _to_amount(quantity_match.group("unit"))
+            line_total = quantity_match.group("price")
+            items.append({
+                "name": pending_name,
+                "price": round(_to_amount(line_total) / quantity if line_total else unit_price, 2),
+                "quantity": quantity
+            })
+            pattern_hits["quantity_line"] = pattern_hits.get("quantity_line", 0) + 1
+            pending_name = None
+            continue
+
+        for pattern_name in pattern_order:
+            match = ITEM_PATTERNS[pattern_name].match(line)
+            if not match:
+                continue
+            groups = match.groupdict()
+            quantity = float(groups.get("qty") or 1)
+            line_total = _to_amount(groups["price"])
+            items.append({
+                "name": groups["name"].strip(" .:-"),
+                "price": round(line_total / quantity, 2) if quantity else line_total,
+                "quantity": quantity
+            })
+            pattern_hits[pattern_name] = pattern_hits.get(pattern_name, 0) + 1
+            pending_name = None
+            break
+        else:
+            if has_price:
+                unparsed_price_lines += 1
+                pending_name = None
+            elif items or any(ch.isalpha() for ch in line):
+                # Possibly an item name whose quantity/price sits on the next line
+                pending_name = line
+
+    date = parse_date(text)
+    store_name = template.get("store_name") or _guess_store_name(lines)
+
+    for item in items:
+        item["category"] = item_categories.get(item["name"].lower(), DEFAULT_CATEGORY)
+
+    items_sum = round(sum(item["price"] * item["quantity"] for item in items), 2)
+    if total is None and subtotal is not None:
+        total = round(subtotal + tax, 2)
+
+    result = {
+        "store_name": store_name or "Unknown Store",
+        "date": date,
+        "total_amount": total if total is not None else items_sum,
+        "items": items
+    }
+
+    # Score: reconciliation against printed totals dominates, the rest is supporting evidence
+    if not items:
+        return result, 0.0
+    confidence = 0.0
+    tolerance = 0.02 + 0.005 * len(items)
+    if total is not None:
+        confidence += 0.25
+        if abs(items_sum - total) <= tolerance or abs(items_sum + tax - total) <= tolerance:
+            confidence += 0.45
+        elif subtotal is not None and abs(items_sum - subtotal) <= tolerance:
+            confidence += 0.4
+    if date:
+        confidence += 0.1
+    if store_name:
+        confidence += 0.1
+    if template:
+        confidence += 0.1
+    if price_lines:
+        confidence -= 0.5 * unparsed_price_lines / price_lines
+
+    result["_item_pattern"] = max(pattern_hits, key=pattern_hits.get) if pattern_hits else None
+    return result, round(max(0.0, min(1.0, confidence)), 3)
+
+# Merchant templates
+
+# Templates keyed by header key: (expires_at, template or None), least recently used first
+_template_cache: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+MAX_CACHED_TEMPLATES = 5000
+MAX_TEMPLATE_ITEMS = 500
+
+async def get_merchant_template(text: str) -> Optional[Dict[str, Any]]:
+    # Look up the learned template for this receipt's header lines
+    key = header_key([_normalize_line(line) for line in text.splitlines() if line.strip()])
+    if not key:
+        return None
+    cached = _template_cache.pop(key, None)
+    if cached and cached[0] > time.monotonic():
+        # Re-inserted, so the least recently used entry is the first to be evicted
+        _template_cache[key] = cached
+        return cached[1]
+
+    db = get_database()
+    template = await db.merchant_templates.find_one({"header_key": key})
+    if template:
+        template["item_categories"] = {
+            entry["name"]: entry["category"] for entry in template.get("items", [])
+        }
+    ttl = settings.MERCHANT_TEMPLATE_CACHE_TTL_SECONDS if template else settings.MERCHANT_TEMPLATE_MISS_TTL_SECONDS
+    if len(_template_cache) >= MAX_CACHED_TEMPLATES:
+        _template_cache.pop(next(iter(_template_cache)))
+    _template_cache[key] = (time.monotonic() + ttl, template)
+    return template
+
+async def parse_receipt_text_fast(text: str) -> Tuple[Dict[str, Any], float]:
+    # Parse with the merchant's learned template if there is one; without the
+    # template store the local parser still runs, just without it
+    try:
+        template = await get_merchant_template(text)
+    except Exception as e:
+        print(f"Error loading merchant template: {str(e)}")
+        template = None
+    result, confidence = parse_receipt_text(text, template)
+    result.pop("_item_pattern", None)
+    return result, confidence
+
+async def learn_merchant_template(text: str, receipt: Dict[str, Any]):
+    """
+    Learn a merchant template from an LLM-parsed receipt so the next receipt
+    from the same merchant can be handled by the local parser.
+
+    Args:
+        text: Raw receipt text that was sent to the LLM
+        receipt: Parsed receipt returned by the LLM
+    """
+    lines = [_normalize_line(line) for line in text.splitlines() if line.strip()]
+    key = header_key(lines)
+    if not key or not receipt.get("store_name"):
+        return
+
+    # Record which local layout matches this merchant and its item categories
+    local_result, _ = parse_receipt_text(text)
+    item_entries = [
+        {"name": str(item.get("name", "")).lower(), "category": item.get("category", DEFAULT_CATEGORY)}
+        for item in receipt.get("items", [])
+        if item.get("name")
+    ]
+
+    db = get_database()
+    await db.merchant_templates.update_one(
+        {"header_key": key},
+        {
+            "$set": {
+                "store_name": receipt["store_name"],
+                "item_pattern": local_result.get("_item_pattern"),
+                "updated_at": datetime.now()
+            },
+            "$push": {"items": {"$each": item_entries, "$slice": -MAX_TEMPLATE_ITEMS}},
+            "$setOnInsert": {"header_key": key, "created_at": datetime.now()}
+        },
+        upsert=True
+    )
+    _template_cache.pop(key, None)
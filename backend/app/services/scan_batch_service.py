@@ -0,0 +1,161 @@
+# app/services/scan_batch_service.py
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple, Union
+from app.config.settings import settings
+from app.services.blob_store import put_bytes
+from app.services.ocr_service import process_receipt_image
+from app.services.receipt_service import save_receipts
+from app.utils.metrics import metrics
+
+class TooManyBatchJobs(Exception):
+    """Raised when a user already has SCAN_BATCH_MAX_JOBS_PER_USER background batch jobs running."""
+
+# Per-user concurrency caps, so one large import can't starve other users' scans.
+# Each entry is [semaphore, scans holding or waiting on it]; dropped when the last one is done.
+_user_semaphores: Dict[str, List[Any]] = {}
+
+# Background batch jobs, keyed by job id
+_jobs: Dict[str, Dict[str, Any]] = {}
+MAX_FINISHED_JOBS = 500
+# The loop only keeps weak references to tasks, so running jobs are held here
+_tasks: Set[asyncio.Task] = set()
+
+@asynccontextmanager
+async def _user_slot(user_id: str) -> AsyncIterator[None]:
+    entry = _user_semaphores.get(user_id)
+    if entry is None:
+        entry = _user_semaphores[user_id] = [asyncio.Semaphore(settings.SCAN_BATCH_MAX_CONCURRENCY_PER_USER), 0]
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            _user_semaphores.pop(user_id, None)
+
+def _to_receipt_document(user_id: str, receipt: Dict[str, Any], image_blob: Optional[str] = None) -> Dict[str, Any]:
+    # Shape OCR output like a ReceiptCreate payload
+    return {
+        "user_id": user_id,
+        "store_name": receipt.get("store_name"),
+        "date": receipt.get("date") or datetime.now(),
+        "total_amount": float(receipt.get("total_amount") or 0),
+        "items": [
+            {
+                "name": item.get("name", ""),
+                "price": float(item.get("price") or 0),
+                "quantity": float(item.get("quantity") or 1),
+                "category": item.get("category") or "other"
+            }
+            for item in receipt.get("items", [])
+        ],
+        "image_url": "",
+        "image_blob": image_blob,
+        "is_shared": False,
+        "shared_expenses": []
+    }
+
+async def _scan_one(user_id: str, filename: str, image_bytes: Union[bytes, memoryview], mime_type: str,
+                    job: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    async with _user_slot(user_id):
+        try:
+            receipt_data = await process_receipt_image(image_bytes, mime_type=mime_type)
+        except Exception as e:
+            receipt_data = {"error": str(e)}
+
+    if "error" in receipt_data:
+        result = {"filename": filename, "status": "error", "error": receipt_data["error"]}
+    else:
+        result = {"filename": filename, "status": "ok", "processed_data": receipt_data}
+
+    metrics.increment("scan_batch_images_total", status=result["status"])
+    if job is not None:
+        job["completed"] += 1
+    return result
+
+async def scan_batch(user_id: str, images: List[Tuple[str, Union[bytes, memoryview], str]], auto_save: bool = False,
+                     job: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Scan several receipt images concurrently under the user's concurrency cap.
+
+    Args:
+        user_id: Firebase user ID
+        images: List of (filename, image bytes, sniffed MIME type)
+        auto_save: If True, save successfully scanned receipts with one insert_many
+        job: Optional job record to report progress into
+
+    Returns:
+        One result per image, in upload order
+    """
+    results = await asyncio.gather(*[
+        _scan_one(user_id, filename, image_bytes, mime_type, job) for filename, image_bytes, mime_type in images
+    ])
+
+    if auto_save:
+        scanned = [(result, image_bytes) for result, (_, image_bytes, _) in zip(results, images) if result["status"] == "ok"]
+        documents = []
+        for result, image_bytes in scanned:
+            try:
+                image_blob = (await put_bytes(image_bytes))["id"]
+            except Exception as e:
+                print(f"Warning: could not store image for {result['filename']}: {str(e)}")
+                image_blob = None
+            documents.append(_to_receipt_document(user_id, result["processed_data"], image_blob))
+        receipt_ids = await save_receipts(documents)
+        for (result, _), receipt_id in zip(scanned, receipt_ids):
+            result["receipt_id"] = receipt_id
+
+    return results
+
+def start_batch_job(user_id: str, images: List[Tuple[str, Union[bytes, memoryview], str]], auto_save: bool = False) -> str:
+    """
+    Run a batch scan in the background and return its job id.
+
+    Raises:
+        TooManyBatchJobs: If the user is at SCAN_BATCH_MAX_JOBS_PER_USER running jobs
+    """
+    running = sum(1 for job in _jobs.values() if job["user_id"] == user_id and job["status"] == "processing")
+    if running >= settings.SCAN_BATCH_MAX_JOBS_PER_USER:
+        metrics.increment("scan_batch_jobs_rejected_total")
+        raise TooManyBatchJobs(f"At most {settings.SCAN_BATCH_MAX_JOBS_PER_USER} batch scans can run at once; wait for one to finish")
+
+    # Forget the oldest finished jobs so the registry doesn't grow without bound
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] != "processing"]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        _jobs.pop(job_id, None)
+
+    job_id = uuid.uuid4().hex
+    job = {
+        "job_id": job_id,
+        "user_id": user_id,
+        "status": "processing",
+        "total": len(images),
+        "completed": 0,
+        "results": None,
+        "created_at": datetime.now()
+    }
+    _jobs[job_id] = job
+
+    async def run():
+        try:
+            job["results"] = await scan_batch(user_id, images, auto_save, job)
+            job["status"] = "completed"
+        except Exception as e:
+            print(f"Error in batch scan job {job_id}: {str(e)}")
+            job["status"] = "failed"
+            job["error"] = str(e)
+
+    task = asyncio.create_task(run())
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return job_id
+
+def get_batch_job(job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    job = _jobs.get(job_id)
+    if not job or job["user_id"] != user_id:
+        return None
+    return {key: value for key, value in job.items() if key != "user_id"}
@@ -1,48 +1,96 @@
 # app/services/settings_service.py
 from datetime import datetime
+from pymongo import ReturnDocument
 from app.config.mongodb import get_database
+from app.services.budget_alert_service import invalidate_budget_limits
+
+# Settings a user starts with; stored on first read or write
+DEFAULT_SETTINGS = {
+    "theme": "light",
+    "currency": "USD",
+    "budget_limits": {},
+    "notifications": {
+        "email": True,
+        "push": False,
+        "budget_alerts": True
+    }
+}
+
+# Fields callers can't overwrite
+PROTECTED_FIELDS = {"_id", "user_id", "created_at", "updated_at"}
+
+def _format_settings(settings):
+    settings["_id"] = str(settings["_id"])
+    return settings
+
+def _insert_defaults(user_id, fields, now):
+    # $setOnInsert values for a new document. Mongo rejects an update where both
+    # operators target the same path, so defaults being $set are left out, and
+    # for a nested field being $set (e.g. "notifications.push") only its
+    # siblings' defaults are inserted.
+    defaults = {}
+    for key, value in DEFAULT_SETTINGS.items():
+        if key in fields:
+            continue
+        nested = {path.split(".")[1] for path in fields if path.startswith(f"{key}.")}
+        if not nested:
+            defaults[key] = value
+        elif isinstance(value, dict):
+            defaults.update({f"{key}.{field}": default for field, default in value.items() if field not in nested})
+    return {**defaults, "user_id": user_id, "created_at": now}
 
 async def get_user_settings(user_id):
     # Get user settings.
     db = get_database()
     settings = await db.user_settings.find_one({"user_id": user_id})
-    
+
     if settings:
-        settings["_id"] = str(settings["_id"])
-        return settings
-    
+        return _format_settings(settings)
+
     return None
 
+async def get_or_create_user_settings(user_id):
+    """Get user settings, storing the defaults first if the user has none, in one round trip."""
+    db = get_database()
+    now = datetime.now()
+    settings = await db.user_settings.find_one_and_update(
+        {"user_id": user_id},
+        {"$setOnInsert": {**_insert_defaults(user_id, {}, now), "updated_at": now}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return _format_settings(settings)
+
 async def update_user_settings(user_id, settings_data):
-    # Update user settings.
+    """
+    Update user settings with a single upsert, creating them from the defaults
+    if the user has none yet.
+
+    Args:
+        user_id: Firebase user ID
+        settings_data: Fields to set; dotted paths (e.g. "notifications.email")
+            update a single nested field
+
+    Returns:
+        The settings after the update
+    """
+    db = get_database()
+    now = datetime.now()
+    fields = {key: value for key, value in settings_data.items() if key not in PROTECTED_FIELDS}
+
+    settings = await db.user_settings.find_one_and_update(
+        {"user_id": user_id},
+        {
+            "$set": {**fields, "updated_at": now},
+            "$setOnInsert": _insert_defaults(user_id, fields, now)
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    invalidate_budget_limits(user_id)
+    return _format_settings(settings)
+
+async def ensure_settings_indexes():
     db = get_database()
-    settings_data["updated_at"] = datetime.now()
-    
-    # Check if settings exist
-    existing_settings = await db.user_settings.find_one({"user_id": user_id})
-    
-    if existing_settings:
-        # Update existing settings
-        result = await db.user_settings.update_one(
-            {"user_id": user_id},
-            {"$set": settings_data}
-        )
-        
-        if result.modified_count:
-            # Get and return updated settings
-            updated_settings = await db.user_settings.find_one({"user_id": user_id})
-            updated_settings["_id"] = str(updated_settings["_id"])
-            return updated_settings
-    else:
-        # Create new settings
-        settings_data["user_id"] = user_id
-        settings_data["created_at"] = datetime.now()
-        
-        result = await db.user_settings.insert_one(settings_data)
-        
-        # Get and return created settings
-        created_settings = await db.user_settings.find_one({"_id": result.inserted_id})
-        created_settings["_id"] = str(created_settings["_id"])
-        return created_settings
-    
-    return None
\ No newline at end of file
+    # Unique, so concurrent first writes can't create two settings documents for a user
+    await db.user_settings.create_index("user_id", unique=True)
@@ -0,0 +1,89 @@
+# app/services/spending_profile_service.py
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Tuple
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.utils.metrics import metrics
+
+# Cached profiles keyed by user_id, then days: (expires_at, profile)
+_profiles: Dict[str, Dict[int, Tuple[float, Dict[str, Any]]]] = {}
+MAX_CACHED_USERS = 10000
+# Bumped on every invalidation, so a profile computed across a receipt write isn't cached
+_generations: Dict[str, int] = {}
+
+def invalidate_spending_profile(user_id: str):
+    """Drop a user's cached profiles. Called whenever their receipts change."""
+    _generations[user_id] = _generations.get(user_id, 0) + 1
+    _profiles.pop(user_id, None)
+
+async def get_spending_profile(user_id: str, days: int = 30) -> Dict[str, Any]:
+    """
+    Get a user's spending profile for the last `days` days, computed with a
+    single aggregation and cached until their receipts change.
+
+    Args:
+        user_id: Firebase user ID
+        days: Size of the window in days
+
+    Returns:
+        Dictionary with top_spending_categories and frequent_stores (lists of
+        (name, value) tuples, top 5), spending_by_category, total_spending and
+        receipt_count
+    """
+    cached = _profiles.get(user_id, {}).get(days)
+    if cached and cached[0] > time.monotonic():
+        metrics.increment("spending_profile_cache_total", outcome="hit")
+        return cached[1]
+
+    metrics.increment("spending_profile_cache_total", outcome="miss")
+    generation = _generations.get(user_id, 0)
+    profile = await _compute_spending_profile(user_id, days)
+    if _generations.get(user_id, 0) == generation:
+        if len(_profiles) >= MAX_CACHED_USERS and user_id not in _profiles:
+            # Evict the oldest cached user
+            _profiles.pop(next(iter(_profiles)))
+        _profiles.setdefault(user_id, {})[days] = (time.monotonic() + settings.SPENDING_PROFILE_TTL_SECONDS, profile)
+    return profile
+
+async def _compute_spending_profile(user_id: str, days: int) -> Dict[str, Any]:
+    db = get_database()
+    since = datetime.now() - timedelta(days=days)
+
+    pipeline = [
+        {"$match": {"user_id": user_id, "date": {"$gte": since}}},
+        {"$facet": {
+            "categories": [
+                {"$unwind": "$items"},
+                {"$group": {
+                    "_id": {"$ifNull": ["$items.category", "Uncategorized"]},
+                    "amount": {"$sum": {"$ifNull": ["$items.price", 0]}}
+                }},
+                {"$sort": {"amount": -1}}
+            ],
+            "stores": [
+                {"$group": {"_id": {"$ifNull": ["$store_name", "Unknown"]}, "count": {"$sum": 1}}},
+                {"$sort": {"count": -1}},
+                {"$limit": 5}
+            ],
+            "totals": [
+                {"$group": {"_id": None, "receipt_count": {"$sum": 1}}}
+            ]
+        }}
+    ]
+
+    started = time.perf_counter()
+    result = (await db.receipts.aggregate(pipeline).to_list(length=1))[0]
+    metrics.observe("spending_profile_compute_ms", (time.perf_counter() - started) * 1000)
+
+    spending_by_category = {row["_id"]: row["amount"] for row in result["categories"]}
+    totals = result["totals"][0] if result["totals"] else {}
+
+    return {
+        "top_spending_categories": [(row["_id"], row["amount"]) for row in result["categories"][:5]],
+        "frequent_stores": [(row["_id"], row["count"]) for row in result["stores"]],
+        "spending_by_category": spending_by_category,
+        "total_spending": sum(spending_by_category.values()),
+        "receipt_count": totals.get("receipt_count", 0),
+        "days": days
+    }
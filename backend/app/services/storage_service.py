@@ -1,41 +1,22 @@
 # backend/app/services/storage_service.py
 from fastapi import UploadFile
-import os
-import aiofiles
-from pathlib import Path
-import uuid
+from app.config.settings import settings
+from app.services.blob_store import put_upload
 
-# Directory to store uploaded files
-UPLOAD_DIR = Path("uploads")
-
-async def upload_image(file: UploadFile, filename: str) -> str:
+async def upload_image(file: UploadFile) -> str:
     """
-    Upload an image file to local storage (in a production environment, 
+    Upload an image file to the local blob store (in a production environment,
     this would be replaced with cloud storage like S3, GCS, etc.)
     
+    The upload is streamed to disk in chunks and stored under its SHA-256, so
+    uploading the same image twice stores it once. Reference the returned id
+    with blob_store.add_reference from the document that uses it.
+    
     Args:
         file: The uploaded file
-        filename: Desired filename including path
         
     Returns:
-        str: URL to access the uploaded file
+        str: Blob id of the stored image
     """
-    try:
-        # Ensure upload directory exists
-        full_path = UPLOAD_DIR / filename
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        
-        # Save the file
-        async with aiofiles.open(full_path, "wb") as out_file:
-            content = await file.read()
-            await out_file.write(content)
-            
-        # Reset file position for future reads
-        await file.seek(0)
-        
-        # In production, return a proper URL to the file
-        # For now, return the local path
-        return f"/uploads/{filename}"
-        
-    except Exception as e:
-        raise Exception(f"Error uploading file: {str(e)}")
\ No newline at end of file
+    blob = await put_upload(file, settings.UPLOAD_MAX_IMAGE_SIZE)
+    return blob["id"]
@@ -0,0 +1,209 @@
+# app/services/tip_cohort_service.py
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.utils.metrics import metrics
+
+# Cohort documents never change once written, so they can be cached by id
+_cohort_cache: Dict[ObjectId, Dict[str, Any]] = {}
+MAX_CACHED_COHORTS = 256
+
+def kmeans(points: np.ndarray, k: int, iterations: int = 50, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Cluster points with k-means (k-means++ initialisation), fully vectorized.
+
+    Args:
+        points: (n, d) array
+        k: Number of clusters, at most n
+        iterations: Maximum number of refinement rounds
+        seed: Random seed, so repeated runs over the same data agree
+
+    Returns:
+        Tuple of ((k, d) centroids, (n,) cluster label per point)
+    """
+    rng = np.random.default_rng(seed)
+    n = len(points)
+    k = min(k, n)
+
+    # k-means++: pick each next centroid with probability proportional to its squared distance
+    centroids = np.empty((k, points.shape[1]))
+    centroids[0] = points[rng.integers(n)]
+    closest = ((points - centroids[0]) ** 2).sum(axis=1)
+    for index in range(1, k):
+        total = closest.sum()
+        choice = rng.choice(n, p=closest / total) if total > 0 else rng.integers(n)
+        centroids[index] = points[choice]
+        closest = np.minimum(closest, ((points - centroids[index]) ** 2).sum(axis=1))
+
+    point_norms = (points ** 2).sum(axis=1)[:, None]
+    labels = np.full(n, -1)
+    for _ in range(iterations):
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, without materialising an (n, k, d) array
+        distances = point_norms - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+        new_labels = distances.argmin(axis=1)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, points)
+        # Empty clusters keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+
+    return centroids, labels
+
+async def build_spending_vectors(days: int = 30) -> Tuple[List[str], List[str], np.ndarray]:
+    """
+    Build a category-spend vector per user from the last `days` days of receipts.
+
+    Returns:
+        Tuple of (user ids, category names, (users, categories) spend matrix)
+    """
+    db = get_database()
+    since = datetime.now() - timedelta(days=days)
+    rows = await db.receipts.aggregate([
+        {"$match": {"date": {"$gte": since}, "user_id": {"$ne": None}}},
+        {"$unwind": "$items"},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "category": {"$ifNull": ["$items.category", "Uncategorized"]}},
+            "amount": {"$sum": {"$ifNull": ["$items.price", 0]}}
+        }}
+    ], allowDiskUse=True).to_list(length=None)
+
+    users = sorted({row["_id"]["user_id"] for row in rows})
+    categories = sorted({row["_id"]["category"] for row in rows})
+    user_index = {user_id: index for index, user_id in enumerate(users)}
+    category_index = {category: index for index, category in enumerate(categories)}
+
+    spend = np.zeros((len(users), len(categories)))
+    for row in rows:
+        spend[user_index[row["_id"]["user_id"]], category_index[row["_id"]["category"]]] += row["amount"]
+    return users, categories, spend
+
+def _cohort_profile(categories: List[str], centroid: np.ndarray, average_total: float) -> Dict[str, Any]:
+    # Describe a centroid like a spending profile, so the personalized tip prompt can be reused
+    order = np.argsort(centroid)[::-1]
+    top = [(categories[index], float(centroid[index] * average_total)) for index in order[:5] if centroid[index] > 0]
+    return {
+        "top_spending_categories": top,
+        "frequent_stores": [],
+        "total_spending": float(average_total)
+    }
+
+async def refresh_tip_cohorts():
+    """
+    Cluster users by spending mix and generate one tip set per cluster.
+
+    Each user's category-spend vector is normalised to spending shares before
+    clustering, so cohorts group users by what they spend on rather than how much.
+    """
+    from app.services.tip_dedup_service import dedupe_batch
+    from app.services.tip_service import generate_personalized_tips, title_hash
+
+    started = time.perf_counter()
+    db = get_database()
+    users, categories, spend = await build_spending_vectors(settings.TIP_COHORT_WINDOW_DAYS)
+
+    totals = spend.sum(axis=1)
+    active = totals > 0
+    users = [user_id for user_id, keep in zip(users, active) if keep]
+    spend, totals = spend[active], totals[active]
+    if not users:
+        print("No spending data to build tip cohorts from")
+        return
+
+    shares = spend / totals[:, None]
+    centroids, labels = kmeans(shares, settings.TIP_COHORT_COUNT)
+
+    run_id = uuid.uuid4().hex
+    now = datetime.now()
+
+    async def build_cohort(cluster: int) -> Dict[str, Any]:
+        members = labels == cluster
+        profile = _cohort_profile(categories, centroids[cluster], float(totals[members].mean()))
+        tips = await generate_personalized_tips(
+            None, profile, None, settings.TIP_COHORT_TIPS_PER_COHORT,
+            fallback=False, feature="cohort_tips"
+        )
+        tips = dedupe_batch([tip for tip in tips if tip.get("title") and tip.get("content")])
+        return {
+            "_id": ObjectId(),
+            "run_id": run_id,
+            "cluster": cluster,
+            "size": int(members.sum()),
+            "centroid": {categories[index]: round(float(share), 4) for index, share in enumerate(centroids[cluster]) if share > 0},
+            "tips": [
+                {
+                    "_id": ObjectId(),
+                    "title": tip["title"],
+                    "content": tip["content"],
+                    "category": tip.get("category"),
+                    "tags": tip.get("tags", []),
+                    "title_hash": title_hash(tip["title"]),
+                    "is_personalized": True,
+                    "created_at": now,
+                    "updated_at": now
+                }
+                for tip in tips
+            ],
+            "created_at": now
+        }
+
+    clusters = sorted(set(labels.tolist()))
+    cohorts = await asyncio.gather(*[build_cohort(cluster) for cluster in clusters])
+    await db.tip_cohorts.insert_many(cohorts)
+
+    cohort_ids = {cohort["cluster"]: cohort["_id"] for cohort in cohorts}
+    await db.tip_cohort_assignments.bulk_write([
+        UpdateOne(
+            {"user_id": user_id},
+            {"$set": {"cohort_id": cohort_ids[int(label)], "run_id": run_id, "updated_at": now}},
+            upsert=True
+        )
+        for user_id, label in zip(users, labels)
+    ], ordered=False)
+
+    # Users with no recent spending drop out of cohorts; older runs are no longer referenced
+    await db.tip_cohort_assignments.delete_many({"run_id": {"$ne": run_id}})
+    await db.tip_cohorts.delete_many({"run_id": {"$ne": run_id}})
+    _cohort_cache.clear()
+
+    metrics.observe("tip_cohort_refresh_ms", (time.perf_counter() - started) * 1000)
+    print(f"Built {len(cohorts)} tip cohorts for {len(users)} users")
+
+async def get_cohort_tips(user_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Get the tips generated for the user's spending cohort.
+
+    Returns:
+        The cohort's tips, or None if the user hasn't been assigned a cohort yet
+    """
+    db = get_database()
+    assignment = await db.tip_cohort_assignments.find_one({"user_id": user_id})
+    if not assignment:
+        return None
+
+    cohort = _cohort_cache.get(assignment["cohort_id"])
+    if cohort is None:
+        cohort = await db.tip_cohorts.find_one({"_id": assignment["cohort_id"]})
+        if not cohort:
+            return None
+        if len(_cohort_cache) >= MAX_CACHED_COHORTS:
+            _cohort_cache.clear()
+        _cohort_cache[cohort["_id"]] = cohort
+    return cohort["tips"]
+
+async def ensure_tip_cohort_indexes():
+    db = get_database()
+    await db.tip_cohort_assignments.create_index("user_id", unique=True)
+    await db.tip_cohort_assignments.create_index("run_id")
+    await db.tip_cohorts.create_index("run_id")
@@ -0,0 +1,136 @@
+# app/services/tip_dedup_service.py
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.services.tip_ranking_service import tokenize
+from app.utils.metrics import metrics
+from app.utils.minhash import MinHasher, estimate_similarity
+
+minhasher = MinHasher(num_perm=64, bands=16)
+
+def signature_fields(tip: Dict[str, Any]) -> Dict[str, list]:
+    """
+    MinHash signature and LSH band keys over the words of a tip's title and
+    content, stored on the tip document as "minhash" and "lsh_bands".
+    """
+    signature = minhasher.signature(tokenize(f"{tip.get('title', '')} {tip.get('content', '')}"))
+    return {"minhash": signature, "lsh_bands": minhasher.band_keys(signature)}
+
+def is_near_duplicate(first: Dict[str, Any], second: Dict[str, Any]) -> bool:
+    return estimate_similarity(first["minhash"], second["minhash"]) >= settings.TIP_DUPLICATE_THRESHOLD
+
+def dedupe_batch(tips: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drop near-duplicates within a batch of new tips, keeping the first of each.
+    Each kept tip gets its minhash/lsh_bands fields set.
+    """
+    kept = []
+    buckets: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for tip in tips:
+        tip.update(signature_fields(tip))
+        candidates = {id(other): other for band in tip["lsh_bands"] for other in buckets[band]}
+        if any(is_near_duplicate(tip, other) for other in candidates.values()):
+            metrics.increment("tip_duplicates_rejected_total", source="batch")
+            continue
+        kept.append(tip)
+        for band in tip["lsh_bands"]:
+            buckets[band].append(tip)
+    return kept
+
+async def find_near_duplicate(tip: Dict[str, Any], scope: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Find a stored tip within `scope` (e.g. the general pool, or one user's
+    personalized tips) that is a near-duplicate of `tip`.
+
+    Args:
+        tip: Tip with minhash/lsh_bands fields
+        scope: Extra query conditions limiting which stored tips are compared
+
+    Returns:
+        The most similar stored duplicate, or None
+    """
+    db = get_database()
+    candidates = await db.tips.find(
+        {**scope, "lsh_bands": {"$in": tip["lsh_bands"]}},
+        {"vector": 0}
+    ).to_list(length=settings.TIP_DUPLICATE_MAX_CANDIDATES)
+
+    best, best_similarity = None, 0.0
+    for candidate in candidates:
+        if not candidate.get("minhash"):
+            continue
+        similarity = estimate_similarity(tip["minhash"], candidate["minhash"])
+        if similarity >= settings.TIP_DUPLICATE_THRESHOLD and similarity > best_similarity:
+            best, best_similarity = candidate, similarity
+    return best
+
+async def filter_new_tips(tips: List[Dict[str, Any]], scope: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[Tuple[Dict[str, Any], Dict[str, Any]]]]:
+    """
+    Split new tips into ones worth inserting and near-duplicates of stored tips.
+
+    Returns:
+        Tuple of (new tips, [(new tip, stored duplicate)])
+    """
+    fresh, duplicates = [], []
+    for tip in dedupe_batch(tips):
+        existing = await find_near_duplicate(tip, scope)
+        if existing:
+            metrics.increment("tip_duplicates_rejected_total", source="stored")
+            duplicates.append((tip, existing))
+        else:
+            fresh.append(tip)
+    return fresh, duplicates
+
+def _scope_key(tip: Dict[str, Any]) -> Tuple:
+    # Tips are only duplicates of each other within the general pool or within one user's tips
+    return (bool(tip.get("is_personalized")), tip.get("user_id"))
+
+async def compact_tips(dry_run: bool = False) -> Dict[str, int]:
+    """
+    Collapse existing near-duplicate tips, keeping the oldest of each group,
+    and backfill minhash/lsh_bands on tips that predate them.
+
+    Args:
+        dry_run: If True, report what would change without writing
+
+    Returns:
+        Counts of scanned, backfilled and removed tips
+    """
+    db = get_database()
+    tips = await db.tips.find(
+        {},
+        {"title": 1, "content": 1, "is_personalized": 1, "user_id": 1, "created_at": 1, "minhash": 1, "lsh_bands": 1}
+    ).sort([("created_at", 1), ("_id", 1)]).to_list(length=None)
+
+    backfill = []
+    for tip in tips:
+        if not tip.get("minhash") or not tip.get("lsh_bands"):
+            tip.update(signature_fields(tip))
+            backfill.append(tip)
+
+    # Oldest first, so the tip kept in each group is the one users have seen longest
+    removed = []
+    buckets: Dict[Tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for tip in tips:
+        scope = _scope_key(tip)
+        candidates = {id(other): other for band in tip["lsh_bands"] for other in buckets[(scope, band)]}
+        if any(is_near_duplicate(tip, other) for other in candidates.values()):
+            removed.append(tip["_id"])
+            continue
+        for band in tip["lsh_bands"]:
+            buckets[(scope, band)].append(tip)
+
+    removed_ids = set(removed)
+    backfill = [tip for tip in backfill if tip["_id"] not in removed_ids]
+    if not dry_run:
+        if backfill:
+            await db.tips.bulk_write([
+                UpdateOne({"_id": tip["_id"]}, {"$set": {"minhash": tip["minhash"], "lsh_bands": tip["lsh_bands"]}})
+                for tip in backfill
+            ], ordered=False)
+        if removed:
+            await db.tips.delete_many({"_id": {"$in": removed}})
+
+    return {"scanned": len(tips), "backfilled": len(backfill), "removed": len(removed)}
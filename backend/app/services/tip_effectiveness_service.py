@@ -0,0 +1,247 @@
+# app/services/tip_effectiveness_service.py
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.utils.metrics import metrics
+
+UNCATEGORIZED = "Uncategorized"
+
+async def _find_tip_category(tip_id: ObjectId) -> Optional[str]:
+    # Tips live either in the tips collection or embedded in a spending cohort
+    db = get_database()
+    tip = await db.tips.find_one({"_id": tip_id}, {"category": 1})
+    if tip:
+        return tip.get("category") or UNCATEGORIZED
+    cohort = await db.tip_cohorts.find_one({"tips._id": tip_id}, {"tips.$": 1})
+    if cohort:
+        return cohort["tips"][0].get("category") or UNCATEGORIZED
+    return None
+
+def _contribution(report: Optional[Dict[str, Any]]) -> Dict[str, float]:
+    # What a stored report adds to its rollups; reports from before the rollups have no category and were never added
+    if not report or "category" not in report:
+        return {"reports": 0, "implemented": 0, "savings": 0.0}
+    implemented = bool(report.get("implemented"))
+    return {
+        "reports": 1,
+        "implemented": int(implemented),
+        "savings": max(float(report.get("savings") or 0.0), 0.0) if implemented else 0.0
+    }
+
+async def _increment_rollups(tip_id: str, category: str, increments: Dict[str, float], now: datetime) -> Optional[Dict[str, Any]]:
+    # Adjust the category's and the tip's rollups, returning the tip's
+    db = get_database()
+    await db.tip_category_effectiveness.update_one(
+        {"category": category},
+        {"$inc": increments, "$set": {"updated_at": now}},
+        upsert=True
+    )
+    if not ObjectId.is_valid(tip_id):
+        return None
+    tip_object_id = ObjectId(tip_id)
+    tip = await db.tips.find_one_and_update(
+        {"_id": tip_object_id},
+        {"$inc": {f"effectiveness.{field}": value for field, value in increments.items()}},
+        projection={"effectiveness": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if tip:
+        return tip.get("effectiveness")
+    # Cohort tips are embedded in their cohort, so the rollup goes on the matched element
+    cohort = await db.tip_cohorts.find_one_and_update(
+        {"tips._id": tip_object_id},
+        {"$inc": {f"tips.$.effectiveness.{field}": value for field, value in increments.items()}},
+        projection={"tips.$": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    return cohort["tips"][0].get("effectiveness") if cohort else None
+
+async def record_tip_effectiveness(user_id: str, tip_id: str, implemented: bool, savings: float = 0.0) -> Dict[str, Any]:
+    """
+    Record a user's report on a tip and fold it into the tip's and its
+    category's effectiveness rollups.
+
+    Each user has one report per tip; reporting again replaces the earlier
+    report, and the rollups are adjusted by the difference with $inc, so they
+    never need rebuilding from the raw reports.
+
+    Args:
+        user_id: Firebase user ID
+        tip_id: ID of the tip
+        implemented: Whether the user put the tip into practice
+        savings: Amount the user reports having saved
+
+    Returns:
+        The tip's effectiveness rollup
+
+    Raises:
+        ValueError: If the tip doesn't exist
+    """
+    if not ObjectId.is_valid(tip_id):
+        raise ValueError("Invalid tip ID")
+    category = await _find_tip_category(ObjectId(tip_id))
+    if category is None:
+        raise ValueError("Tip not found")
+
+    savings = max(float(savings), 0.0) if implemented else 0.0
+    db = get_database()
+    now = datetime.now()
+    report = {"implemented": implemented, "savings": savings, "category": category, "date": now}
+    for attempt in range(2):
+        try:
+            previous = await db.tip_effectiveness.find_one_and_update(
+                {"user_id": user_id, "tip_id": tip_id},
+                {"$set": report},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+            break
+        except DuplicateKeyError:
+            # A concurrent first report from the same user inserted it first; update that one instead
+            if attempt:
+                raise
+
+    current, earlier = _contribution(report), _contribution(previous)
+    increments = {field: current[field] - earlier[field] for field in current}
+    if not any(increments.values()):
+        return await get_tip_effectiveness(tip_id)
+
+    counts = await _increment_rollups(tip_id, category, increments, now)
+    metrics.increment("tip_effectiveness_reports_total", implemented=str(implemented).lower())
+    return _rollup(counts, tip_id)
+
+async def get_tip_effectiveness(tip_id: str) -> Dict[str, Any]:
+    """Get a tip's effectiveness rollup."""
+    db = get_database()
+    tip_object_id = ObjectId(tip_id)
+    tip = await db.tips.find_one({"_id": tip_object_id}, {"effectiveness": 1})
+    if tip:
+        return _rollup(tip.get("effectiveness"), tip_id)
+    cohort = await db.tip_cohorts.find_one({"tips._id": tip_object_id}, {"tips.$": 1})
+    return _rollup(cohort["tips"][0].get("effectiveness") if cohort else None, tip_id)
+
+async def get_category_effectiveness() -> Dict[str, Dict[str, float]]:
+    """
+    Get every category's effectiveness rollup.
+
+    Returns:
+        {category: {"reports", "implemented", "savings"}}
+    """
+    db = get_database()
+    rows = await db.tip_category_effectiveness.find({}, {"_id": 0, "updated_at": 0}).to_list(length=None)
+    return {row["category"]: row for row in rows}
+
+def _rollup(counts: Optional[Dict[str, Any]], tip_id: str) -> Dict[str, Any]:
+    counts = counts or {}
+    reports = counts.get("reports", 0)
+    implemented = counts.get("implemented", 0)
+    savings = counts.get("savings", 0.0)
+    return {
+        "tip_id": tip_id,
+        "reports": reports,
+        "implemented": implemented,
+        "implementation_rate": implemented / reports if reports else 0.0,
+        "total_savings": round(savings, 2),
+        "average_savings": round(savings / implemented, 2) if implemented else 0.0
+    }
+
+def effectiveness_scores(tips: List[Dict[str, Any]], categories: Dict[str, Dict[str, float]]) -> List[float]:
+    """
+    Score each tip's proven effectiveness between 0 and 1 from its rollup.
+
+    Implementation rates are smoothed toward the tip's category rate with
+    TIP_EFFECTIVENESS_PRIOR_REPORTS pseudo-reports, so a tip with one lucky
+    report doesn't outrank one with a long record. Average savings per
+    implementation are smoothed the same way and scaled by the largest in the
+    batch; the score is the mean of the two.
+    """
+    prior = settings.TIP_EFFECTIVENESS_PRIOR_REPORTS
+    rates, savings = [], []
+    for tip in tips:
+        counts = tip.get("effectiveness") or {}
+        category = categories.get(tip.get("category") or UNCATEGORIZED) or {}
+        category_rate = category.get("implemented", 0) / category["reports"] if category.get("reports") else 0.0
+        category_savings = category.get("savings", 0.0) / category["implemented"] if category.get("implemented") else 0.0
+
+        rates.append((counts.get("implemented", 0) + prior * category_rate) / (counts.get("reports", 0) + prior))
+        savings.append((counts.get("savings", 0.0) + prior * category_savings) / (counts.get("implemented", 0) + prior))
+
+    top_savings = max(savings, default=0.0)
+    return [
+        (rate + (saved / top_savings if top_savings > 0 else 0.0)) / 2
+        for rate, saved in zip(rates, savings)
+    ]
+
+async def dedupe_tip_reports() -> int:
+    """
+    Keep only each user's latest report per tip, taking any removed report
+    that was already rolled up back out of the rollups.
+
+    Returns:
+        Number of reports removed
+    """
+    db = get_database()
+    now = datetime.now()
+    removed = 0
+    cursor = db.tip_effectiveness.aggregate([
+        {"$sort": {"date": -1, "_id": -1}},
+        {"$group": {"_id": {"user_id": "$user_id", "tip_id": "$tip_id"}, "reports": {"$push": "$$ROOT"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    async for group in cursor:
+        for report in group["reports"][1:]:
+            result = await db.tip_effectiveness.delete_one({"_id": report["_id"]})
+            contribution = _contribution(report)
+            if result.deleted_count and contribution["reports"]:
+                await _increment_rollups(report["tip_id"], report["category"],
+                                         {field: -value for field, value in contribution.items()}, now)
+            removed += result.deleted_count
+    if removed:
+        print(f"Removed {removed} duplicate tip effectiveness reports")
+    return removed
+
+async def backfill_tip_rollups() -> int:
+    """
+    Fold reports from before the rollups existed into them.
+
+    Such reports have no category; each is claimed by setting it, so a report
+    is only counted once even if the user reports again meanwhile.
+
+    Returns:
+        Number of reports folded in
+    """
+    db = get_database()
+    legacy = await db.tip_effectiveness.find({"category": {"$exists": False}}).to_list(length=None)
+    now = datetime.now()
+    folded = 0
+    for report in legacy:
+        tip_id = report.get("tip_id")
+        category = (await _find_tip_category(ObjectId(tip_id)) if ObjectId.is_valid(tip_id) else None) or UNCATEGORIZED
+        claimed = await db.tip_effectiveness.find_one_and_update(
+            {"_id": report["_id"], "category": {"$exists": False}},
+            {"$set": {"category": category}}
+        )
+        if claimed:
+            await _increment_rollups(tip_id, category, _contribution({**claimed, "category": category}), now)
+            folded += 1
+    if folded:
+        print(f"Folded {folded} earlier tip effectiveness reports into the rollups")
+    return folded
+
+async def ensure_tip_effectiveness_indexes():
+    """Create the report and rollup indexes, merging duplicate reports first if they block the unique one."""
+    db = get_database()
+    # One report per user and tip, and one rollup per category
+    try:
+        await db.tip_effectiveness.create_index([("user_id", 1), ("tip_id", 1)], unique=True)
+    except OperationFailure as e:
+        if e.code != 11000:  # Duplicate reports already exist
+            raise
+        await dedupe_tip_reports()
+        await db.tip_effectiveness.create_index([("user_id", 1), ("tip_id", 1)], unique=True)
+    await db.tip_category_effectiveness.create_index("category", unique=True)
+    await backfill_tip_rollups()
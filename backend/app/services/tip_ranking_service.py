@@ -0,0 +1,202 @@
+# app/services/tip_ranking_service.py
+import math
+import re
+import time
+import zlib
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from pymongo import UpdateOne
+from app.config.mongodb import get_database
+from app.config.settings import settings
+from app.services.spending_profile_service import get_spending_profile
+from app.services.tip_effectiveness_service import effectiveness_scores, get_category_effectiveness
+from app.utils.metrics import metrics
+
+TOKEN_PATTERN = re.compile(r"[a-z]{3,}")
+STOPWORDS = {
+    "the", "and", "for", "you", "your", "are", "can", "with", "that", "this", "from", "have",
+    "each", "more", "into", "than", "when", "what", "will", "them", "they", "their", "our",
+    "not", "but", "all", "any", "use", "using", "per", "out", "may", "also", "about", "instead"
+}
+
+# Feature weights relative to content terms
+CATEGORY_WEIGHT = 1.0
+TAG_WEIGHT = 0.5
+
+# Bumped whenever tip vectors are rebuilt, invalidating candidate and ranking caches
+_pool_version = 0
+# Candidate pools keyed by category: (expires_at, pool_version, tips, matrix, column ids, effectiveness scores)
+_candidates: Dict[Optional[str], Tuple[float, int, List[Dict[str, Any]], np.ndarray, np.ndarray, np.ndarray]] = {}
+# Rankings keyed by (user_id, category): (expires_at, pool_version, profile, ranked tips)
+_rankings: Dict[Tuple[str, Optional[str]], Tuple[float, int, Dict[str, Any], List[Dict[str, Any]]]] = {}
+MAX_CACHED_RANKINGS = 10000
+# Only the head of each ranking is cached
+RANKING_CACHE_DEPTH = 50
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall((text or "").lower()) if token not in STOPWORDS]
+
+def feature_index(feature: str) -> int:
+    # Stable hashing trick, so vectors stay comparable across processes and restarts
+    return zlib.crc32(feature.encode("utf-8")) % settings.TIP_VECTOR_DIMENSIONS
+
+def _normalize(weights: Dict[int, float]) -> Dict[str, list]:
+    norm = math.sqrt(sum(value * value for value in weights.values()))
+    if not norm:
+        return {"indices": [], "values": []}
+    indices = sorted(weights)
+    return {"indices": indices, "values": [round(weights[index] / norm, 6) for index in indices]}
+
+def build_tip_vector(tip: Dict[str, Any], idf: Dict[str, float], default_idf: float) -> Dict[str, list]:
+    """
+    Build a tip's L2-normalised sparse feature vector from its category, tags and
+    the TF-IDF of its title and content.
+
+    Returns:
+        {"indices": [...], "values": [...]}, stored on the tip document
+    """
+    weights: Dict[int, float] = defaultdict(float)
+    category = tip.get("category")
+    if category:
+        weights[feature_index(f"cat:{category.lower()}")] += CATEGORY_WEIGHT
+    for tag in tip.get("tags", []):
+        weights[feature_index(f"tag:{tag.lower()}")] += TAG_WEIGHT
+
+    terms = tokenize(f"{tip.get('title', '')} {tip.get('content', '')} {category or ''} {' '.join(tip.get('tags', []))}")
+    counts = Counter(terms)
+    for term, count in counts.items():
+        weights[feature_index(f"term:{term}")] += (count / len(terms)) * idf.get(term, default_idf)
+
+    return _normalize(weights)
+
+def build_profile_vector(profile: Dict[str, Any]) -> Dict[int, float]:
+    """
+    Build a user's sparse vector from their spending profile: each category
+    weighted by its share of spending, plus the category's words as terms.
+    """
+    spending = profile.get("spending_by_category", {})
+    total = sum(amount for amount in spending.values() if amount > 0)
+    weights: Dict[int, float] = defaultdict(float)
+    if not total:
+        return {}
+    for category, amount in spending.items():
+        if amount <= 0 or not isinstance(category, str):
+            continue
+        share = amount / total
+        weights[feature_index(f"cat:{category.lower()}")] += share * CATEGORY_WEIGHT
+        for term in tokenize(category):
+            weights[feature_index(f"term:{term}")] += share * TAG_WEIGHT
+    vector = _normalize(weights)
+    return dict(zip(vector["indices"], vector["values"]))
+
+async def reindex_tip_vectors() -> int:
+    """
+    Recompute the feature vector of every general tip, with IDF taken over the
+    current pool. Run after the pool is refilled.
+
+    Returns:
+        Number of tips indexed
+    """
+    global _pool_version
+    db = get_database()
+    tips = await db.tips.find(
+        {"is_personalized": False},
+        {"title": 1, "content": 1, "category": 1, "tags": 1}
+    ).to_list(length=None)
+    if not tips:
+        return 0
+
+    document_frequency = Counter()
+    for tip in tips:
+        document_frequency.update(set(tokenize(f"{tip.get('title', '')} {tip.get('content', '')} {tip.get('category') or ''} {' '.join(tip.get('tags', []))}")))
+    count = len(tips)
+    idf = {term: math.log((1 + count) / (1 + df)) + 1 for term, df in document_frequency.items()}
+    default_idf = math.log(1 + count) + 1
+
+    await db.tips.bulk_write([
+        UpdateOne({"_id": tip["_id"]}, {"$set": {"vector": build_tip_vector(tip, idf, default_idf)}})
+        for tip in tips
+    ], ordered=False)
+
+    _pool_version += 1
+    _candidates.clear()
+    _rankings.clear()
+    return count
+
+async def _get_candidates(category: Optional[str]) -> Tuple[List[Dict[str, Any]], np.ndarray, np.ndarray, np.ndarray]:
+    # Load the candidate pool once per TTL as a dense matrix over the feature columns it uses,
+    # with each tip's effectiveness score taken from the rollups on the tip and its category
+    cached = _candidates.get(category)
+    if cached and cached[0] > time.monotonic() and cached[1] == _pool_version:
+        return cached[2], cached[3], cached[4], cached[5]
+
+    db = get_database()
+    query = {"is_personalized": False}
+    if category:
+        query["category"] = category
+    tips = await db.tips.find(query).sort("created_at", -1).limit(settings.TIP_RANKING_CANDIDATES).to_list(length=None)
+
+    vectors = [tip.pop("vector", None) or {"indices": [], "values": []} for tip in tips]
+    columns = np.unique(np.fromiter((index for vector in vectors for index in vector["indices"]), dtype=np.int64))
+    matrix = np.zeros((len(tips), len(columns)), dtype=np.float32)
+    for row, vector in enumerate(vectors):
+        if vector["indices"]:
+            matrix[row, np.searchsorted(columns, vector["indices"])] = vector["values"]
+
+    boosts = np.asarray(effectiveness_scores(tips, await get_category_effectiveness()), dtype=np.float32)
+    for tip in tips:
+        tip.pop("effectiveness", None)
+
+    _candidates[category] = (time.monotonic() + settings.TIP_RANKING_CACHE_TTL_SECONDS, _pool_version, tips, matrix, columns, boosts)
+    return tips, matrix, columns, boosts
+
+def rank_tips(tips: List[Dict[str, Any]], matrix: np.ndarray, columns: np.ndarray,
+              profile_vector: Dict[int, float], boosts: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+    """
+    Order tips by cosine similarity to the profile vector (both are L2-normalised,
+    so it's a single matrix-vector product), newest first among equal scores.
+    Effectiveness scores, if given, are added with weight TIP_EFFECTIVENESS_WEIGHT.
+    """
+    user = np.zeros(len(columns), dtype=np.float32)
+    if profile_vector and len(columns):
+        indices = np.fromiter(profile_vector.keys(), dtype=np.int64)
+        positions = np.searchsorted(columns, indices)
+        found = (positions < len(columns)) & (columns[np.minimum(positions, len(columns) - 1)] == indices)
+        user[positions[found]] = np.fromiter(profile_vector.values(), dtype=np.float32)[found]
+
+    scores = matrix @ user
+    if boosts is not None and len(boosts):
+        scores = scores + settings.TIP_EFFECTIVENESS_WEIGHT * boosts
+    # Candidates arrive newest first, so a stable sort keeps recency as the tie-breaker
+    order = np.argsort(-scores, kind="stable")
+    return [tips[index] for index in order]
+
+async def get_ranked_tips(user_id: str, category: Optional[str] = None, limit: int = 5) -> List[Dict[str, Any]]:
+    """
+    Get general tips ordered by relevance to the user's spending profile.
+
+    The ranking is cached per user until it expires, the profile changes or the
+    tip vectors are rebuilt.
+    """
+    profile = await get_spending_profile(user_id, days=30)
+    key = (user_id, category)
+    cached = _rankings.get(key)
+    if (cached and cached[0] > time.monotonic() and cached[1] == _pool_version and cached[2] is profile
+            and (limit <= len(cached[3]) or len(cached[3]) < RANKING_CACHE_DEPTH)):
+        metrics.increment("tip_ranking_cache_total", outcome="hit")
+        return cached[3][:limit]
+
+    metrics.increment("tip_ranking_cache_total", outcome="miss")
+    tips, matrix, columns, boosts = await _get_candidates(category)
+    started = time.perf_counter()
+    ranked = rank_tips(tips, matrix, columns, build_profile_vector(profile), boosts)
+    metrics.observe("tip_ranking_ms", (time.perf_counter() - started) * 1000)
+
+    if len(_rankings) >= MAX_CACHED_RANKINGS and key not in _rankings:
+        _rankings.pop(next(iter(_rankings)))
+    _rankings[key] = (
+        time.monotonic() + settings.TIP_RANKING_CACHE_TTL_SECONDS, _pool_version, profile,
+        ranked[:max(limit, RANKING_CACHE_DEPTH)]
+    )
+    return ranked[:limit]
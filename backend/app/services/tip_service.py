@@ -1,83 +1,172 @@
 # app/services/tip_service.py
+import asyncio
+import hashlib
 from datetime import datetime
-from typing import List, Optional
-import google.generativeai as genai
+from typing import Dict, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
 from app.config.mongodb import get_database
 from app.models.tip_model import TipCreate, TipInDB, TipResponse
+from app.config.settings import settings
+from app.services.llm_service import generate, record_parse_failure
+from app.services.spending_profile_service import get_spending_profile
+from app.services.tip_cohort_service import get_cohort_tips
+from app.services.tip_ranking_service import get_ranked_tips, reindex_tip_vectors
+from app.services.tip_dedup_service import filter_new_tips
+from app.utils.metrics import metrics
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 # Load environment variables
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-genai_model = genai.GenerativeModel('gemini-pro')
+TIPS_MODEL = 'gemini-pro'
 
-async def get_general_tips(category: Optional[str] = None, limit: int = 5) -> List[TipResponse]:
+# Personalized tip requests currently being generated, keyed by (user_id, category, limit)
+_personalized_in_flight: Dict[Tuple[str, Optional[str], int], asyncio.Future] = {}
+
+async def get_general_tips(category: Optional[str] = None, limit: int = 5, user_id: Optional[str] = None) -> List[TipResponse]:
     """
     Get general money-saving tips, optionally filtered by category.
+
+    Tips are read from the pool kept topped up by refill_tip_pool; the request
+    path never calls the LLM.
     
     Args:
         category: Optional category to filter tips by
         limit: Maximum number of tips to return
+        user_id: If given, order tips by relevance to this user's spending instead of newest first
         
     Returns:
         List of tips
     """
-    db = get_database()
+    if user_id:
+        tips = list(await get_ranked_tips(user_id, category, limit))
+    else:
+        db = get_database()
+        
+        # Build query
+        query = {"is_personalized": False}
+        if category:
+            query["category"] = category
+        
+        # Get tips from the pool (served by the is_personalized/category/created_at index)
+        cursor = db.tips.find(query, {"vector": 0}).sort("created_at", -1).limit(limit)
+        tips = await cursor.to_list(length=limit)
     
-    # Build query
-    query = {"is_personalized": False}
-    if category:
-        query["category"] = category
+    # Pool not filled for this category yet; fall back to the built-in tips
+    if len(tips) < limit:
+        metrics.increment("tip_pool_misses_total", category=category or "all")
+        tips.extend(generate_fallback_tips(category, limit - len(tips)))
     
-    # Get tips from database
-    cursor = db.tips.find(query).sort("created_at", -1).limit(limit)
-    tips = await cursor.to_list(length=limit)
+    return tips
+
+async def ensure_tip_indexes():
+    db = get_database()
+    await db.tips.create_index([("is_personalized", 1), ("category", 1), ("created_at", -1)])
+    await db.tips.create_index([("is_personalized", 1), ("created_at", -1)])
+    # Candidate lookups for near-duplicate detection
+    await db.tips.create_index([("lsh_bands", 1), ("is_personalized", 1)])
+    # One copy of each personalized tip per user. Partial, since tips saved before
+    # title_hash existed don't have one.
+    await db.tips.create_index(
+        [("user_id", 1), ("title_hash", 1), ("is_personalized", 1)],
+        unique=True,
+        partialFilterExpression={"title_hash": {"$exists": True}}
+    )
+
+async def refill_tip_pool():
+    """
+    Top up the pool of general tips so the system categories, and custom
+    categories shared by at least TIP_POOL_MIN_CATEGORY_USERS users, have
+    TIP_POOL_TARGET_PER_CATEGORY tips. At most TIP_POOL_MAX_GENERATIONS_PER_RUN
+    LLM calls are made per run; categories left short are topped up next run.
+    """
+    from app.services.category_service import get_known_category_names
+    db = get_database()
     
-    # If we don't have enough tips in the database, generate some
-    if len(tips) < limit:
-        needed_tips = limit - len(tips)
-        generated_tips = await generate_general_tips(category, needed_tips)
+    generations = 0
+    for category in await get_known_category_names(settings.TIP_POOL_MIN_CATEGORY_USERS):
+        available = await db.tips.count_documents({"is_personalized": False, "category": category})
+        needed = settings.TIP_POOL_TARGET_PER_CATEGORY - available
+        if needed <= 0:
+            continue
+        if generations >= settings.TIP_POOL_MAX_GENERATIONS_PER_RUN:
+            metrics.increment("tip_pool_refill_deferred_total")
+            print("Tip pool refill reached its generation limit; continuing next run")
+            break
         
-        # Save generated tips to database
-        if generated_tips:
-            tip_docs = []
-            for tip in generated_tips:
-                tip_dict = {
-                    "title": tip["title"],
-                    "content": tip["content"],
-                    "category": category if category else tip["category"],
-                    "tags": tip.get("tags", []),
-                    "is_personalized": False,
-                    "created_at": datetime.now(),
-                    "updated_at": datetime.now()
-                }
-                tip_docs.append(tip_dict)
-                
-            if tip_docs:
-                await db.tips.insert_many(tip_docs)
-                
-            # Get the newly inserted tips
-            new_tips_cursor = db.tips.find(query).sort("created_at", -1).limit(limit)
-            tips = await new_tips_cursor.to_list(length=limit)
+        generations += 1
+        generated_tips = await generate_general_tips(category, min(needed, settings.TIP_POOL_GENERATE_BATCH), fallback=False)
+        tip_docs = [
+            {
+                "title": tip["title"],
+                "content": tip["content"],
+                "category": category,
+                "tags": tip.get("tags", []),
+                "is_personalized": False,
+                "created_at": datetime.now(),
+                "updated_at": datetime.now()
+            }
+            for tip in generated_tips
+            if tip.get("title") and tip.get("content")
+        ]
+        # Paraphrases of tips already in the pool are dropped
+        tip_docs, _ = await filter_new_tips(tip_docs, {"is_personalized": False})
+        if tip_docs:
+            await db.tips.insert_many(tip_docs)
+            metrics.increment("tip_pool_generated_total", len(tip_docs), category=category)
+            print(f"Added {len(tip_docs)} tips to the {category} pool")
     
-    return tips
+    # New tips change the pool's term statistics, so rebuild every tip's ranking vector
+    if await db.tips.count_documents({"is_personalized": False, "vector": {"$exists": False}}, limit=1):
+        await reindex_tip_vectors()
+
+def title_hash(title: str) -> str:
+    # Case and whitespace insensitive key used to deduplicate tips
+    normalized = " ".join(title.lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
 
-async def get_personalized_tips(user_id: str, category: Optional[str] = None, limit: int = 5) -> List[TipResponse]:
+async def get_personalized_tips(user_id: str, category: Optional[str] = None, limit: int = 5, refresh: bool = False) -> List[TipResponse]:
     """
     Get personalized money-saving tips based on user's spending patterns.
+
+    By default tips come from the user's spending cohort (built nightly by
+    tip_cohort_service), topped up from the general pool. With refresh=True
+    tips are generated for this user specifically; concurrent refreshes for
+    the same user, category and limit share one generation and one write batch.
     
     Args:
         user_id: Firebase user ID
         category: Optional category to filter tips by
         limit: Maximum number of tips to return
+        refresh: If True, generate fresh tips for this user with the LLM
         
     Returns:
         List of personalized tips
     """
+    if not refresh:
+        cohort_tips = await get_cohort_tips(user_id) or []
+        tips = [tip for tip in cohort_tips if not category or tip.get("category") == category][:limit]
+        metrics.increment("personalized_tips_served_total", source="cohort" if tips else "general")
+        if len(tips) < limit:
+            tips.extend(await get_general_tips(category, limit - len(tips), user_id=user_id))
+        return tips
+    
+    key = (user_id, category, limit)
+    task = _personalized_in_flight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_build_personalized_tips(user_id, category, limit))
+        _personalized_in_flight[key] = task
+        task.add_done_callback(lambda _: _personalized_in_flight.pop(key, None))
+    else:
+        metrics.increment("personalized_tips_coalesced_total")
+    
+    # Shielded so one caller disconnecting doesn't cancel the work for the others
+    return list(await asyncio.shield(task))
+
+async def _build_personalized_tips(user_id: str, category: Optional[str], limit: int) -> List[dict]:
     db = get_database()
     
     # First, get user's spending patterns from recent receipts
@@ -86,37 +175,71 @@ async def get_personalized_tips(user_id: str, category: Optional[str] = None, li
     # Generate personalized tips based on spending patterns
     generated_tips = await generate_personalized_tips(user_id, spending_patterns, category, limit)
     
-    # Save generated tips to database (if they don't already exist)
-    tip_responses = []
+    # Drop exact repeats, then near-duplicates of each other or of tips the user already has
+    candidates = []
     for tip in generated_tips:
-        # Check if this exact tip already exists
-        existing_tip = await db.tips.find_one({
+        if not tip.get("title") or not tip.get("content"):
+            continue
+        tip_hash = title_hash(tip["title"])
+        if any(candidate["title_hash"] == tip_hash for candidate in candidates):
+            continue
+        candidates.append({
             "title": tip["title"],
-            "user_id": user_id,
-            "is_personalized": True
+            "content": tip["content"],
+            "category": category if category else tip.get("category"),
+            "tags": tip.get("tags", []),
+            "title_hash": tip_hash
         })
-        
-        if not existing_tip:
-            tip_dict = {
+    fresh, duplicates = await filter_new_tips(candidates, {"user_id": user_id, "is_personalized": True})
+    merged = {id(tip): existing for tip, existing in duplicates}
+    
+    # Save the new tips with one batch of upserts; tips the user already has are left untouched
+    operations = [
+        UpdateOne(
+            {"user_id": user_id, "title_hash": tip["title_hash"], "is_personalized": True},
+            {"$setOnInsert": {
                 "title": tip["title"],
                 "content": tip["content"],
-                "category": category if category else tip["category"],
-                "tags": tip.get("tags", []),
-                "is_personalized": True,
-                "user_id": user_id,
+                "category": tip["category"],
+                "tags": tip["tags"],
+                "minhash": tip["minhash"],
+                "lsh_bands": tip["lsh_bands"],
                 "created_at": datetime.now(),
                 "updated_at": datetime.now()
-            }
-            
-            result = await db.tips.insert_one(tip_dict)
-            tip_dict["_id"] = result.inserted_id
-            tip_responses.append(tip_dict)
-        else:
-            tip_responses.append(existing_tip)
+            }},
+            upsert=True
+        )
+        for tip in fresh
+    ]
+    
+    by_hash = {}
+    if operations:
+        try:
+            await db.tips.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            # A concurrent upsert of the same tip loses the race on the unique index; that's fine
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        
+        hashes = [tip["title_hash"] for tip in fresh]
+        saved = await db.tips.find({
+            "user_id": user_id,
+            "is_personalized": True,
+            "title_hash": {"$in": hashes}
+        }).to_list(length=len(hashes))
+        by_hash = {tip["title_hash"]: tip for tip in saved}
+    
+    # Near-duplicates are answered with the stored tip they duplicate
+    tip_responses = []
+    for tip in candidates:
+        if id(tip) in merged:
+            tip_responses.append(merged[id(tip)])
+        elif tip["title_hash"] in by_hash:
+            tip_responses.append(by_hash[tip["title_hash"]])
     
     # If we don't have enough personalized tips, supplement with general tips
     if len(tip_responses) < limit:
-        general_tips = await get_general_tips(category, limit - len(tip_responses))
+        general_tips = await get_general_tips(category, limit - len(tip_responses), user_id=user_id)
         tip_responses.extend(general_tips)
     
     return tip_responses[:limit]
@@ -129,57 +252,18 @@ async def analyze_user_spending(user_id: str):
         user_id: Firebase user ID
         
     Returns:
-        Dictionary with spending pattern analysis
+        Dictionary with spending pattern analysis (see spending_profile_service)
     """
-    db = get_database()
-    
-    # Get user's recent receipts (last 30 days)
-    thirty_days_ago = datetime.now() - datetime.timedelta(days=30)
-    query = {
-        "user_id": user_id,
-        "date": {"$gte": thirty_days_ago}
-    }
-    
-    receipts_cursor = db.receipts.find(query)
-    receipts = await receipts_cursor.to_list(length=100)  # Limit to last 100 receipts for performance
-    
-    # Process receipts to extract spending patterns
-    spending_by_category = {}
-    frequent_stores = {}
-    
-    for receipt in receipts:
-        # Track spending by category
-        for item in receipt.get("items", []):
-            category = item.get("category", "Uncategorized")
-            if category not in spending_by_category:
-                spending_by_category[category] = 0
-            spending_by_category[category] += item.get("price", 0)
-        
-        # Track frequent stores
-        store = receipt.get("store_name", "Unknown")
-        if store not in frequent_stores:
-            frequent_stores[store] = 0
-        frequent_stores[store] += 1
-    
-    # Identify top spending categories
-    top_categories = sorted(spending_by_category.items(), key=lambda x: x[1], reverse=True)
-    
-    # Identify most frequent stores
-    top_stores = sorted(frequent_stores.items(), key=lambda x: x[1], reverse=True)
-    
-    return {
-        "top_spending_categories": top_categories[:5],
-        "frequent_stores": top_stores[:5],
-        "total_spending": sum(spending_by_category.values())
-    }
+    return await get_spending_profile(user_id, days=30)
 
-async def generate_general_tips(category: Optional[str] = None, count: int = 5):
+async def generate_general_tips(category: Optional[str] = None, count: int = 5, fallback: bool = True):
     """
     Generate general money-saving tips using Gemini AI.
     
     Args:
         category: Optional category to focus tips on
         count: Number of tips to generate
+        fallback: If True, return built-in tips when generation fails, otherwise an empty list
         
     Returns:
         List of generated tips
@@ -208,7 +292,7 @@ async def generate_general_tips(category: Optional[str] = None, count: int = 5):
         Focus on practical, actionable advice that people can implement immediately.
         """
         
-        response = genai_model.generate_content(prompt)
+        response = await generate("tips", TIPS_MODEL, prompt)
         
         # Extract JSON from response
         import json
@@ -221,20 +305,24 @@ async def generate_general_tips(category: Optional[str] = None, count: int = 5):
             return tips
         else:
             # Fallback to default tips if parsing fails
-            return generate_fallback_tips(category, count)
+            record_parse_failure("tips", TIPS_MODEL)
+            return generate_fallback_tips(category, count) if fallback else []
     except Exception as e:
         print(f"Error generating tips: {str(e)}")
-        return generate_fallback_tips(category, count)
+        return generate_fallback_tips(category, count) if fallback else []
 
-async def generate_personalized_tips(user_id: str, spending_patterns: dict, category: Optional[str] = None, count: int = 5):
+async def generate_personalized_tips(user_id: Optional[str], spending_patterns: dict, category: Optional[str] = None, count: int = 5,
+                                     fallback: bool = True, feature: str = "personalized_tips"):
     """
     Generate personalized money-saving tips based on user's spending patterns.
     
     Args:
-        user_id: Firebase user ID
+        user_id: Firebase user ID, or None when generating for a cohort
         spending_patterns: Dictionary with user's spending analysis
         category: Optional category to focus tips on
         count: Number of tips to generate
+        fallback: If True, return general tips when generation fails, otherwise an empty list
+        feature: Feature name LLM usage is recorded under
         
     Returns:
         List of generated personalized tips
@@ -280,7 +368,7 @@ async def generate_personalized_tips(user_id: str, spending_patterns: dict, cate
         Focus on practical, actionable advice that addresses the specific spending patterns.
         """
         
-        response = genai_model.generate_content(prompt)
+        response = await generate(feature, TIPS_MODEL, prompt)
         
         # Extract JSON from response
         import json
@@ -293,10 +381,11 @@ async def generate_personalized_tips(user_id: str, spending_patterns: dict, cate
             return tips
         else:
             # Fallback to general tips if parsing fails
-            return await generate_general_tips(category, count)
+            record_parse_failure(feature, TIPS_MODEL)
+            return await generate_general_tips(category, count) if fallback else []
     except Exception as e:
         print(f"Error generating personalized tips: {str(e)}")
-        return await generate_general_tips(category, count)
+        return await generate_general_tips(category, count) if fallback else []
 
 def generate_fallback_tips(category: Optional[str] = None, count: int = 5):
     """
@@ -309,53 +398,52 @@ def generate_fallback_tips(category: Optional[str] = None, count: int = 5):
     Returns:
         List of fallback tips
     """
+    # Keyed by the system category names (category_service.DEFAULT_CATEGORIES)
     fallback_tips = {
-        "Groceries": [
+        "Food & Dining": [
             {
                 "title": "Plan Meals Around Weekly Sales",
                 "content": "Check store flyers and plan your meals around discounted items. This simple habit can save you 20-30% on your grocery bill.",
-                "category": "Groceries",
+                "category": "Food & Dining",
                 "tags": ["meal planning", "discounts", "food"]
             },
             {
                 "title": "Buy Seasonal Produce",
                 "content": "Fruits and vegetables in season are typically cheaper and more flavorful. Shop at farmers' markets near closing time for additional discounts.",
-                "category": "Groceries",
+                "category": "Food & Dining",
                 "tags": ["produce", "seasonal", "shopping"]
             },
             {
                 "title": "Use a Grocery List and Stick to It",
                 "content": "Create a detailed shopping list before going to the store and commit to buying only what's on it. This prevents impulse purchases that can add up quickly.",
-                "category": "Groceries",
+                "category": "Food & Dining",
                 "tags": ["planning", "discipline", "shopping"]
-            }
-        ],
-        "Dining": [
+            },
             {
                 "title": "Pack Lunch Instead of Eating Out",
                 "content": "Bringing lunch from home can save $50-$100 per week compared to buying daily. Prep multiple meals on weekends to make it convenient.",
-                "category": "Dining",
+                "category": "Food & Dining",
                 "tags": ["meal prep", "lunch", "work"]
             },
             {
                 "title": "Use Restaurant Loyalty Programs",
                 "content": "Sign up for loyalty programs at places you frequent. Many offer free items after a certain number of purchases or birthday rewards.",
-                "category": "Dining",
+                "category": "Food & Dining",
                 "tags": ["loyalty", "rewards", "discounts"]
             }
         ],
-        "Entertainment": [
+        "Transportation": [
             {
-                "title": "Explore Free Community Events",
-                "content": "Check local community calendars for free concerts, festivals, and activities. Many museums also offer free admission days each month.",
-                "category": "Entertainment",
-                "tags": ["free", "community", "activities"]
+                "title": "Combine Errands Into One Trip",
+                "content": "Group your errands by location and run them in a single loop. Fewer short trips mean lower fuel costs and less wear on your car.",
+                "category": "Transportation",
+                "tags": ["fuel", "planning", "car"]
             },
             {
-                "title": "Rotate Streaming Services",
-                "content": "Instead of subscribing to multiple streaming platforms simultaneously, rotate them monthly based on what you want to watch. This can cut your streaming costs by up to 75%.",
-                "category": "Entertainment",
-                "tags": ["streaming", "subscriptions", "media"]
+                "title": "Compare Fuel Prices Before Filling Up",
+                "content": "Fuel price apps show the cheapest stations nearby. Filling up a few blocks away can save several dollars a tank.",
+                "category": "Transportation",
+                "tags": ["fuel", "apps", "comparison"]
             }
         ],
         "Shopping": [
@@ -372,24 +460,62 @@ def generate_fallback_tips(category: Optional[str] = None, count: int = 5):
                 "tags": ["tools", "price tracking", "timing"]
             }
         ],
-        "General": [
+        "Bills & Utilities": [
+            {
+                "title": "Do a Subscription Audit",
+                "content": "Review all your recurring subscriptions and cancel those you rarely use. Many people save $50-$100 monthly by eliminating forgotten or underused services.",
+                "category": "Bills & Utilities",
+                "tags": ["subscriptions", "recurring costs", "audit"]
+            },
+            {
+                "title": "Call Providers to Negotiate Rates",
+                "content": "Phone, internet and insurance providers often have better rates for customers who ask. A short call once a year can lower a bill you pay every month.",
+                "category": "Bills & Utilities",
+                "tags": ["negotiation", "bills", "recurring costs"]
+            }
+        ],
+        "Healthcare": [
+            {
+                "title": "Ask for Generic Medications",
+                "content": "Generic drugs contain the same active ingredients as brand names and usually cost far less. Ask your doctor or pharmacist whether a generic is available.",
+                "category": "Healthcare",
+                "tags": ["pharmacy", "generics", "health"]
+            }
+        ],
+        "Entertainment": [
+            {
+                "title": "Explore Free Community Events",
+                "content": "Check local community calendars for free concerts, festivals, and activities. Many museums also offer free admission days each month.",
+                "category": "Entertainment",
+                "tags": ["free", "community", "activities"]
+            },
+            {
+                "title": "Rotate Streaming Services",
+                "content": "Instead of subscribing to multiple streaming platforms simultaneously, rotate them monthly based on what you want to watch. This can cut your streaming costs by up to 75%.",
+                "category": "Entertainment",
+                "tags": ["streaming", "subscriptions", "media"]
+            }
+        ],
+        "Education": [
+            {
+                "title": "Buy or Rent Used Textbooks",
+                "content": "Used and rental textbooks cost a fraction of new ones. Check your library and student exchange groups before buying.",
+                "category": "Education",
+                "tags": ["textbooks", "used", "students"]
+            }
+        ],
+        "Miscellaneous": [
             {
                 "title": "Track Every Expense for One Month",
                 "content": "Record every single purchase for 30 days to identify spending patterns. Most people find they can immediately cut 10-15% after seeing where their money goes.",
-                "category": "General",
+                "category": "Miscellaneous",
                 "tags": ["awareness", "tracking", "budgeting"]
             },
             {
                 "title": "Automate Savings Transfers",
                 "content": "Set up automatic transfers to your savings account on payday. Treating savings as a non-negotiable expense ensures you consistently build your financial cushion.",
-                "category": "General",
+                "category": "Miscellaneous",
                 "tags": ["automation", "savings", "habits"]
-            },
-            {
-                "title": "Do a Subscription Audit",
-                "content": "Review all your recurring subscriptions and cancel those you rarely use. Many people save $50-$100 monthly by eliminating forgotten or underused services.",
-                "category": "General",
-                "tags": ["subscriptions", "recurring costs", "audit"]
             }
         ]
     }
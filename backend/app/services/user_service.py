@@ -1,10 +1,31 @@
 # app/services/user_service.py
+import asyncio
 from datetime import datetime
 from app.config.mongodb import get_database
 from bson import ObjectId
-from firebase_admin import auth
+from pymongo import DeleteMany, ReplaceOne, ReturnDocument
+from pymongo.errors import OperationFailure
+from app.services.firebase_service import get_firebase_user
 from firebase_admin.exceptions import FirebaseError
 
+def _lookup_email(firebase_uid):
+    # Email from the Firebase user record, as the UserProfile model requires one
+    try:
+        firebase_user = get_firebase_user(firebase_uid)
+        return firebase_user.email or "user@example.com"
+    except FirebaseError:
+        # Fallback email if Firebase lookup fails
+        return "user@example.com"
+
+def _format_profile(user_profile, firebase_uid):
+    user_profile["_id"] = str(user_profile["_id"])
+    
+    # Ensure email field exists (required by UserProfile model)
+    if "email" not in user_profile:
+        user_profile["email"] = _lookup_email(firebase_uid)
+    
+    return user_profile
+
 async def create_user_profile(user_data):
     # Create a new user profile in MongoDB.
     db = get_database()
@@ -13,19 +34,13 @@ async def create_user_profile(user_data):
     
     # Ensure email is included if not provided
     if "email" not in user_data and "firebase_uid" in user_data:
-        try:
-            firebase_user = auth.get_user(user_data["firebase_uid"])
-            user_data["email"] = firebase_user.email or "user@example.com"
-        except FirebaseError:
-            user_data["email"] = "user@example.com"
-    
-    # Insert user profile
-    result = await db.user_profiles.insert_one(user_data)
+        user_data["email"] = _lookup_email(user_data["firebase_uid"])
     
-    # Get and return created profile
-    user_profile = await db.user_profiles.find_one({"_id": result.inserted_id})
-    user_profile["_id"] = str(user_profile["_id"])
-    return user_profile
+    # Insert user profile; insert_one sets _id on the document, so there is nothing to read back.
+    # Raises DuplicateKeyError if the user already has a profile.
+    await db.user_profiles.insert_one(user_data)
+    user_data["_id"] = str(user_data["_id"])
+    return user_data
 
 async def get_user_profile(firebase_uid):
     # Get user profile by Firebase UID.
@@ -33,47 +48,89 @@ async def get_user_profile(firebase_uid):
     user_profile = await db.user_profiles.find_one({"firebase_uid": firebase_uid})
     
     if user_profile:
-        user_profile["_id"] = str(user_profile["_id"])
-        
-        # Ensure email field exists (required by UserProfile model)
-        if "email" not in user_profile:
-            try:
-                # Get email from Firebase user record
-                firebase_user = auth.get_user(firebase_uid)
-                user_profile["email"] = firebase_user.email or "user@example.com"
-            except FirebaseError:
-                # Fallback email if Firebase lookup fails
-                user_profile["email"] = "user@example.com"
-        
-        return user_profile
+        return _format_profile(user_profile, firebase_uid)
     
     return None
 
-async def update_user_profile(firebase_uid, update_data):
-    # Update user profile.
+async def update_user_profile(firebase_uid, update_data, upsert=False):
+    """
+    Update a user profile in one round trip, returning the updated profile.
+
+    Args:
+        firebase_uid: Firebase user ID
+        update_data: Fields to set
+        upsert: If True, create the profile when the user has none
+
+    Returns:
+        The updated profile, or None if it doesn't exist and upsert is False
+    """
     db = get_database()
-    update_data["updated_at"] = datetime.now()
+    now = datetime.now()
+    update = {"$set": {**update_data, "updated_at": now}}
     
-    # Update profile
-    result = await db.user_profiles.update_one(
+    user_profile = await db.user_profiles.find_one_and_update(
         {"firebase_uid": firebase_uid},
-        {"$set": update_data}
+        update,
+        return_document=ReturnDocument.AFTER
     )
+    if user_profile is None and upsert:
+        # No profile yet: create it with its email, looked up once (off the event loop)
+        # rather than on every update
+        update["$setOnInsert"] = {"created_at": now}
+        if "email" not in update_data:
+            update["$setOnInsert"]["email"] = await asyncio.to_thread(_lookup_email, firebase_uid)
+        user_profile = await db.user_profiles.find_one_and_update(
+            {"firebase_uid": firebase_uid},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    if not user_profile:
+        return None
     
-    # Check if the document was matched (exists), not just modified
-    if result.matched_count:
-        # Get and return updated profile
-        user_profile = await db.user_profiles.find_one({"firebase_uid": firebase_uid})
-        user_profile["_id"] = str(user_profile["_id"])
-        
-        # Ensure email field exists (required by UserProfile model)
-        if "email" not in user_profile:
-            try:
-                firebase_user = auth.get_user(firebase_uid)
-                user_profile["email"] = firebase_user.email or "user@example.com"
-            except FirebaseError:
-                user_profile["email"] = "user@example.com"
-        
-        return user_profile
-    
-    return None
\ No newline at end of file
+    return _format_profile(user_profile, firebase_uid)
+
+async def dedupe_user_profiles() -> int:
+    """
+    Merge users' duplicate profiles (created before firebase_uid was unique)
+    into one. Fields from the most recently updated profile win; fields only
+    an older profile has are kept.
+
+    Returns:
+        Number of duplicate profiles removed
+    """
+    db = get_database()
+    removed = 0
+    cursor = db.user_profiles.aggregate([
+        {"$match": {"firebase_uid": {"$exists": True}}},
+        {"$sort": {"updated_at": 1, "_id": 1}},
+        {"$group": {"_id": "$firebase_uid", "profiles": {"$push": "$$ROOT"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ], allowDiskUse=True)
+    async for group in cursor:
+        profiles = group["profiles"]
+        merged = {}
+        for profile in profiles:
+            merged.update({key: value for key, value in profile.items() if value is not None})
+        keep = profiles[-1]["_id"]
+        merged["_id"] = keep
+        await db.user_profiles.bulk_write([
+            ReplaceOne({"_id": keep}, merged),
+            DeleteMany({"_id": {"$in": [profile["_id"] for profile in profiles[:-1]]}})
+        ], ordered=True)
+        removed += len(profiles) - 1
+    if removed:
+        print(f"Merged {removed} duplicate user profiles")
+    return removed
+
+async def ensure_user_indexes():
+    """Create the unique firebase_uid index, merging duplicate profiles first if they block it."""
+    db = get_database()
+    # Unique, so concurrent first writes can't create two profiles for a user
+    try:
+        await db.user_profiles.create_index("firebase_uid", unique=True)
+    except OperationFailure as e:
+        if e.code != 11000:  # Duplicate profiles already exist
+            raise
+        await dedupe_user_profiles()
+        await db.user_profiles.create_index("firebase_uid", unique=True)
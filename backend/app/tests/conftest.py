@@ -0,0 +1,525 @@
+import copy
+import os
+import re
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+# Run the test suite against the local stand-ins for Gemini and Firebase
+os.environ.setdefault("AUTH_BACKEND", "fake")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("FAKE_LLM_LATENCY_MS", "0")
+os.environ.setdefault("FAKE_LLM_JITTER_MS", "0")
+
+
+# In-memory stand-in for the motor collections the services use, so service tests
+# run without MongoDB. It covers the query, update and pipeline operators the
+# services issue; anything else raises NotImplementedError rather than passing
+# silently.
+
+_MISSING = object()
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, list) and part.isdigit():
+            value = value[int(part)] if int(part) < len(value) else _MISSING
+            if value is _MISSING:
+                return value
+            continue
+        if isinstance(value, list):
+            values = [_get(item, part) for item in value if isinstance(item, dict)]
+            return [item for item in values if item is not _MISSING] or _MISSING
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set(doc, path, value):
+    *parents, field = path.split(".")
+    for parent in parents:
+        doc = doc[int(parent)] if isinstance(doc, list) else doc.setdefault(parent, {})
+    doc[field] = value
+
+
+def _unset(doc, path):
+    *parents, field = path.split(".")
+    for parent in parents:
+        doc = doc.get(parent, {})
+    doc.pop(field, None)
+
+
+def _compare(value, condition):
+    if isinstance(condition, dict) and condition and all(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$exists":
+                if (value is not _MISSING) != bool(operand):
+                    return False
+                continue
+            candidates = value if isinstance(value, list) else [value]
+            if operator == "$in":
+                ok = any(candidate in operand for candidate in candidates) or (value is _MISSING and None in operand)
+            elif operator == "$nin":
+                ok = not any(candidate in operand for candidate in candidates)
+            elif operator == "$ne":
+                ok = not _compare(value, operand)
+            elif operator == "$regex":
+                ok = any(isinstance(candidate, str) and re.search(operand, candidate) for candidate in candidates)
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                compare = {"$gt": lambda a, b: a > b, "$gte": lambda a, b: a >= b,
+                           "$lt": lambda a, b: a < b, "$lte": lambda a, b: a <= b}[operator]
+                ok = any(candidate not in (_MISSING, None) and compare(candidate, operand) for candidate in candidates)
+            else:
+                raise NotImplementedError(operator)
+            if not ok:
+                return False
+        return True
+    if value is _MISSING:
+        return condition is None
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, branch) for branch in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, branch) for branch in condition):
+                return False
+        elif not _compare(_get(doc, key), condition):
+            return False
+    return True
+
+
+def evaluate(expression, doc):
+    """Evaluate an aggregation expression against a document."""
+    if isinstance(expression, str) and expression.startswith("$"):
+        value = _get(doc, expression[1:])
+        return None if value is _MISSING else value
+    if isinstance(expression, list):
+        return [evaluate(item, doc) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) == 1 and next(iter(expression)).startswith("$"):
+        operator, operand = next(iter(expression.items()))
+        if operator == "$literal":
+            return operand
+        args = evaluate(operand, doc) if isinstance(operand, list) else [evaluate(operand, doc)]
+        if operator == "$add":
+            return None if any(arg is None for arg in args) else sum(args)
+        if operator == "$ifNull":
+            return next((arg for arg in args if arg is not None), None)
+        if operator == "$concat":
+            return None if any(arg is None for arg in args) else "".join(args)
+        if operator == "$concatArrays":
+            return [item for arg in args for item in arg]
+        if operator == "$slice":
+            items, count = args
+            return items[count:] if count < 0 else items[:count]
+        if operator == "$toString":
+            return str(args[0])
+        raise NotImplementedError(operator)
+    return {key: evaluate(value, doc) for key, value in expression.items()}
+
+
+def _positional(doc, query, path):
+    # Resolve the positional $ in an update or projection path to the first array
+    # element the query matched, e.g. tips.$.views with {"tips._id": id}
+    if ".$" not in path:
+        return path
+    array, rest = path.split(".$", 1)
+    conditions = {key[len(array) + 1:]: value for key, value in (query or {}).items() if key.startswith(f"{array}.")}
+    if not conditions:
+        raise NotImplementedError(f"positional {path} without a query on {array}")
+    items = _get(doc, array)
+    index = next(index for index, item in enumerate(items) if matches(item, conditions))
+    return f"{array}.{index}{rest}"
+
+
+def _check_conflicts(update):
+    # Mongo rejects an update where two operators target the same path or one inside the other
+    targets = [(operator, path) for operator, fields in update.items() for path in fields]
+    for index, (operator, path) in enumerate(targets):
+        for other_operator, other in targets[index + 1:]:
+            if other_operator != operator and (path == other or other.startswith(f"{path}.") or path.startswith(f"{other}.")):
+                raise OperationFailure(f"Updating the path '{other}' would create a conflict at '{path}'", code=40)
+
+
+def _apply_update(doc, update, inserting):
+    if isinstance(update, list):
+        # Update pipeline: each $set stage sees the result of the previous one
+        for stage in update:
+            (operator, fields), = stage.items()
+            if operator != "$set":
+                raise NotImplementedError(operator)
+            values = {path: evaluate(expression, doc) for path, expression in fields.items()}
+            for path, value in values.items():
+                _set(doc, path, value)
+        return
+    _check_conflicts(update)
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == "$set" or (operator == "$setOnInsert" and inserting):
+                _set(doc, path, copy.deepcopy(value))
+            elif operator == "$setOnInsert":
+                continue
+            elif operator == "$unset":
+                _unset(doc, path)
+            elif operator == "$inc":
+                current = _get(doc, path)
+                _set(doc, path, (0 if current is _MISSING else current) + value)
+            elif operator == "$push":
+                items = _get(doc, path)
+                items = [] if items is _MISSING else items
+                if isinstance(value, dict) and "$each" in value:
+                    items = items + list(value["$each"])
+                    if "$slice" in value:
+                        items = items[value["$slice"]:] if value["$slice"] < 0 else items[:value["$slice"]]
+                else:
+                    items = items + [value]
+                _set(doc, path, items)
+            else:
+                raise NotImplementedError(operator)
+
+
+def _project(doc, projection, query=None):
+    if not projection:
+        return copy.deepcopy(doc)
+    included = {field for field, flag in projection.items() if flag}
+    if included:
+        projected = copy.deepcopy({key: value for key, value in doc.items() if key in included or key == "_id"})
+        for field in included:
+            if field.endswith(".$"):
+                # Only the array element the query matched
+                projected[field[:-2]] = [copy.deepcopy(_get(doc, _positional(doc, query, field)))]
+        return projected
+    return copy.deepcopy({key: value for key, value in doc.items() if key not in projection})
+
+
+def _sorted(docs, sort):
+    for field, direction in reversed(sort or []):
+        docs = sorted(docs, key=lambda doc: (_get(doc, field) is _MISSING, _get(doc, field)), reverse=direction < 0)
+    return docs
+
+
+def bulk_operation(operation):
+    """
+    The (kind, filter, document, upsert) of a pymongo bulk write operation.
+    pymongo has no public accessors for these, so this is the one place the
+    fake reads its private attributes.
+    """
+    return (
+        type(operation).__name__,
+        getattr(operation, "_filter", None),
+        getattr(operation, "_doc", None),
+        getattr(operation, "_upsert", False)
+    )
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, key, direction=None):
+        self._docs = _sorted(self._docs, [(key, direction)] if isinstance(key, str) else key)
+        return self
+
+    def skip(self, count):
+        self._docs = self._docs[count:]
+        return self
+
+    def limit(self, count):
+        if count:
+            self._docs = self._docs[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    async def to_list(self, length=None):
+        return self._docs[:length] if length else list(self._docs)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._docs:
+            yield doc
+
+
+class FakeCollection:
+    """
+    In-memory motor collection. `unique` lists fields with a unique index;
+    `aggregate` can be given a function returning the pipeline's rows.
+    """
+
+    def __init__(self, name="collection", docs=(), unique=(), aggregate=None, database=None):
+        self.name = name
+        self.docs = [{"_id": ObjectId(), **doc} for doc in docs]
+        self.unique = tuple(unique)
+        self.database = database
+        self.indexes = {}
+        self.calls = {}
+        self._aggregate = aggregate
+
+    def _count(self, method):
+        self.calls[method] = self.calls.get(method, 0) + 1
+
+    def _check_unique(self, candidate, ignore=None):
+        for field in self.unique:
+            value = _get(candidate, field)
+            if value is _MISSING:
+                continue
+            if any(doc is not ignore and _get(doc, field) == value for doc in self.docs):
+                raise DuplicateKeyError(f"E11000 duplicate key error {self.name}.{field}", code=11000)
+
+    def _insert(self, doc):
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self.docs.append(copy.deepcopy(doc))
+        return doc["_id"]
+
+    def _first(self, query, sort=None):
+        return next(iter(_sorted([doc for doc in self.docs if matches(doc, query)], sort)), None)
+
+    def _upsert(self, query, update):
+        doc = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+        _apply_update(doc, update, inserting=True)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return doc
+
+    def _update(self, doc, update, query=None):
+        before = copy.deepcopy(doc)
+        if isinstance(update, dict):
+            update = {operator: {_positional(doc, query, path): value for path, value in fields.items()}
+                      for operator, fields in update.items()}
+        _apply_update(doc, update, inserting=False)
+        try:
+            self._check_unique(doc, ignore=doc)
+        except DuplicateKeyError:
+            doc.clear()
+            doc.update(before)
+            raise
+        return doc != before
+
+    async def insert_one(self, doc):
+        self._count("insert_one")
+        return SimpleNamespace(inserted_id=self._insert(doc))
+
+    async def insert_many(self, docs, ordered=True):
+        self._count("insert_many")
+        inserted, errors = [], []
+        for index, doc in enumerate(docs):
+            try:
+                inserted.append(self._insert(doc))
+            except DuplicateKeyError:
+                errors.append({"index": index, "code": 11000})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        self._count("find_one")
+        doc = self._first(query or {}, sort)
+        return _project(doc, projection, query) if doc is not None else None
+
+    def find(self, query=None, projection=None):
+        self._count("find")
+        return FakeCursor([_project(doc, projection) for doc in self.docs if matches(doc, query or {})])
+
+    async def count_documents(self, query, limit=0):
+        self._count("count_documents")
+        count = sum(1 for doc in self.docs if matches(doc, query))
+        return min(count, limit) if limit else count
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    async def distinct(self, field, query=None):
+        values = []
+        for doc in self.docs:
+            value = _get(doc, field)
+            if matches(doc, query or {}) and value is not _MISSING and value not in values:
+                values.append(value)
+        return values
+
+    async def update_one(self, query, update, upsert=False):
+        self._count("update_one")
+        doc = self._first(query)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._upsert(query, update)["_id"])
+        return SimpleNamespace(matched_count=1, modified_count=int(self._update(doc, update, query)), upserted_id=None)
+
+    async def update_many(self, query, update, upsert=False):
+        self._count("update_many")
+        matched = [doc for doc in self.docs if matches(doc, query)]
+        modified = sum(int(self._update(doc, update)) for doc in matched)
+        return SimpleNamespace(matched_count=len(matched), modified_count=modified, upserted_id=None)
+
+    async def find_one_and_update(self, query, update, upsert=False, sort=None, projection=None,
+                                  return_document=ReturnDocument.BEFORE):
+        self._count("find_one_and_update")
+        doc = self._first(query, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = self._upsert(query, update)
+            return _project(doc, projection) if return_document == ReturnDocument.AFTER else None
+        before = _project(doc, projection, query)
+        self._update(doc, update, query)
+        return _project(doc, projection, query) if return_document == ReturnDocument.AFTER else before
+
+    async def find_one_and_delete(self, query, projection=None):
+        self._count("find_one_and_delete")
+        doc = self._first(query)
+        if doc is None:
+            return None
+        self.docs.remove(doc)
+        return _project(doc, projection)
+
+    async def delete_one(self, query):
+        self._count("delete_one")
+        doc = self._first(query)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, query):
+        self._count("delete_many")
+        remaining = [doc for doc in self.docs if not matches(doc, query)]
+        deleted = len(self.docs) - len(remaining)
+        self.docs = remaining
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def bulk_write(self, operations, ordered=True):
+        self._count("bulk_write")
+        matched = modified = upserted = inserted = deleted = 0
+        errors = []
+        for index, operation in enumerate(operations):
+            kind, query, document, upsert = bulk_operation(operation)
+            try:
+                if kind == "InsertOne":
+                    self._insert(document)
+                    inserted += 1
+                elif kind in ("UpdateOne", "ReplaceOne"):
+                    doc = self._first(query)
+                    if kind == "ReplaceOne" and doc is not None:
+                        document = {**document, "_id": doc["_id"]}
+                        changed = doc != document
+                        doc.clear()
+                        doc.update(copy.deepcopy(document))
+                    elif doc is not None:
+                        changed = self._update(doc, document)
+                    if doc is not None:
+                        matched += 1
+                        modified += int(changed)
+                    elif upsert:
+                        self._upsert(query, document if kind == "UpdateOne" else {"$set": document})
+                        upserted += 1
+                elif kind == "UpdateMany":
+                    for doc in [doc for doc in self.docs if matches(doc, query)]:
+                        matched += 1
+                        modified += int(self._update(doc, document))
+                elif kind in ("DeleteOne", "DeleteMany"):
+                    result = await (self.delete_one(query) if kind == "DeleteOne" else self.delete_many(query))
+                    deleted += result.deleted_count
+                else:
+                    raise NotImplementedError(kind)
+            except DuplicateKeyError:
+                errors.append({"index": index, "code": 11000})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+        return SimpleNamespace(matched_count=matched, modified_count=modified, upserted_count=upserted,
+                               inserted_count=inserted, deleted_count=deleted)
+
+    def aggregate(self, pipeline, **kwargs):
+        self._count("aggregate")
+        if self._aggregate is None:
+            raise NotImplementedError("give the FakeCollection an aggregate function for this test")
+        return FakeCursor(list(self._aggregate(pipeline, self.docs)))
+
+    async def create_index(self, keys, **options):
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = "_".join(f"{field}_{direction}" for field, direction in keys)
+        existing = self.indexes.get(name)
+        if existing is not None and existing != options:
+            raise OperationFailure(f"An index named {name} already exists with different options", code=85)
+        if options.get("unique"):
+            values = [repr([_get(doc, field) for field, _ in keys]) for doc in self.docs
+                      if any(_get(doc, field) is not _MISSING for field, _ in keys)]
+            if len(set(values)) < len(values):
+                raise OperationFailure(f"E11000 duplicate key error collection: {self.name}", code=11000)
+            if len(keys) == 1 and keys[0][0] not in self.unique:
+                self.unique += (keys[0][0],)
+        self.indexes[name] = options
+        return name
+
+
+class FakeDatabase:
+    """
+    In-memory motor database; collections are created on first access. Use
+    collection() to seed one or give it unique fields or aggregate rows.
+    """
+
+    def __init__(self, **collections):
+        self.commands = []
+        self._collections = {}
+        for name, collection in collections.items():
+            self[name] = collection
+
+    def __setitem__(self, name, collection):
+        collection.name, collection.database = name, self
+        self._collections[name] = collection
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self[name] = FakeCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def collection(self, name, docs=(), unique=(), aggregate=None):
+        self[name] = FakeCollection(name, docs, unique, aggregate)
+        return self[name]
+
+    async def command(self, command):
+        self.commands.append(command)
+        if "collMod" in command:
+            index = command["index"]
+            name = "_".join(f"{field}_{direction}" for field, direction in index["keyPattern"].items())
+            self[command["collMod"]].indexes[name]["expireAfterSeconds"] = index["expireAfterSeconds"]
+        return {"ok": 1}
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    """
+    A FakeDatabase installed as the get_database of every imported service
+    module. Seed collections with fake_db.collection(name, docs, ...).
+    """
+    import sys
+
+    db = FakeDatabase()
+    for name, module in list(sys.modules.items()):
+        if name.startswith("app.services.") and hasattr(module, "get_database"):
+            monkeypatch.setattr(module, "get_database", lambda: db)
+    return db
@@ -0,0 +1,43 @@
+import asyncio
+import base64
+import io
+import os
+
+from PIL import Image
+
+from app.config.settings import settings
+from app.services import avatar_service
+from app.utils.uploads import decode_data_url
+
+
+def _png(color, size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_avatars_are_stored_once_per_content(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STATIC_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "AVATAR_SIZES", [64, 256])
+
+    first = asyncio.run(avatar_service.store_avatar(_png("red")))
+    assert first["avatar"] == first["avatar_thumbnails"]["256"]
+    assert first["avatar"].startswith("static/avatars/") and first["avatar"].endswith("_256.webp")
+
+    # Every rendition is a square WebP of its size
+    for size, url in first["avatar_thumbnails"].items():
+        with Image.open(tmp_path / url[len("static/"):]) as image:
+            assert image.format == "WEBP" and image.size == (int(size), int(size))
+
+    # Re-uploading the same bytes reuses the stored files; different bytes get new URLs
+    stored = os.path.getmtime(tmp_path / first["avatar"][len("static/"):])
+    assert asyncio.run(avatar_service.store_avatar(_png("red"))) == first
+    assert os.path.getmtime(tmp_path / first["avatar"][len("static/"):]) == stored
+    assert asyncio.run(avatar_service.store_avatar(_png("blue")))["avatar"] != first["avatar"]
+
+
+def test_decode_data_url():
+    image = _png("green")
+    assert decode_data_url(f"data:image/png;base64,{base64.b64encode(image).decode()}") == image
+    assert decode_data_url("static/avatars/ab/abc_256.webp") is None
+    assert decode_data_url("data:image/png;base64,not base64!") is None
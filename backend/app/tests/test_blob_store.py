@@ -0,0 +1,80 @@
+import asyncio
+import io
+
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.config.settings import settings
+from app.services import blob_store
+
+
+def _png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (600, 400), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _blob(blobs, blob_id):
+    return asyncio.run(blobs.find_one({"_id": blob_id}))
+
+
+def _use_store(tmp_path, monkeypatch, fake_db):
+    blobs = fake_db.collection("blobs")
+    monkeypatch.setattr(settings, "BLOB_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BLOB_TRANSCODE_FORMAT", "webp")
+    return blobs
+
+
+def test_identical_uploads_share_one_blob(tmp_path, monkeypatch, fake_db):
+    blobs = _use_store(tmp_path, monkeypatch, fake_db)
+
+    first = asyncio.run(blob_store.put_bytes(_png("red")))
+    second = asyncio.run(blob_store.put_bytes(_png("red")))
+    other = asyncio.run(blob_store.put_bytes(_png("blue")))
+
+    assert first == second and other["id"] != first["id"]
+    # The PNG was smaller as WebP, so that is what was stored
+    assert first["content_type"] == "image/webp" and first["size"] < len(_png("red"))
+    assert sorted(path.name for path in tmp_path.rglob("*") if path.is_file()) == sorted([first["id"], other["id"]])
+    assert _blob(blobs, first["id"])["ref_count"] == 0
+
+    assert asyncio.run(blob_store.add_reference(first["id"])) is True
+    assert asyncio.run(blob_store.add_reference("missing")) is False
+    assert _blob(blobs, first["id"])["ref_count"] == 1
+
+
+def test_blob_response_supports_ranges_and_etags(tmp_path, monkeypatch, fake_db):
+    blobs = _use_store(tmp_path, monkeypatch, fake_db)
+    blob = asyncio.run(blob_store.put_bytes(_png("green")))
+    stored = open(blob_store.blob_path(blob["id"]), "rb").read()
+
+    doc = _blob(blobs, blob["id"])
+    app = FastAPI()
+
+    @app.get("/image")
+    async def image(request: Request):
+        return blob_store.blob_response(doc, request.headers)
+
+    client = TestClient(app)
+    full = client.get("/image")
+    assert full.status_code == 200 and full.content == stored
+    assert full.headers["etag"] == f'"{blob["id"]}"'
+    assert "immutable" in full.headers["cache-control"]
+
+    partial = client.get("/image", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206 and partial.content == stored[:10]
+    assert partial.headers["content-range"] == f"bytes 0-9/{len(stored)}"
+
+    suffix = client.get("/image", headers={"Range": "bytes=-5"})
+    assert suffix.status_code == 206 and suffix.content == stored[-5:]
+
+    unsatisfiable = client.get("/image", headers={"Range": "bytes=99999999-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(stored)}"
+
+    # A stale If-Range validator gets the whole file
+    stale = client.get("/image", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert stale.status_code == 200 and stale.content == stored
+
+    assert client.get("/image", headers={"If-None-Match": full.headers["etag"]}).status_code == 304
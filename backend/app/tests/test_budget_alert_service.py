@@ -0,0 +1,111 @@
+import asyncio
+from datetime import datetime
+
+from bson import ObjectId
+
+from app.services import budget_alert_service
+from app.services.budget_alert_service import evaluate_threshold, receipt_deltas
+
+
+def test_alert_fires_once_per_threshold_crossing():
+    alerted, sent = 0.0, []
+    # Spend hovers around 90% of a $100 limit, then passes it, dips back and passes it again
+    for spend in [50, 91, 89, 92, 101, 98, 102, 80, 93]:
+        alerted, fire = evaluate_threshold(spend, 100.0, alerted)
+        if fire:
+            sent.append((spend, alerted))
+
+    # Dipping to 89 or 98 stays within the hysteresis band; only falling to 80 re-arms 90%
+    assert sent == [(91, 0.9), (101, 1.0), (93, 0.9)]
+
+
+def test_receipt_deltas_by_month_and_category():
+    before = {"date": datetime(2024, 5, 3), "items": [
+        {"category": "Groceries", "price": 10.0},
+        {"category": "Dining", "price": 5.0}
+    ]}
+    after = {"date": datetime(2024, 5, 3), "items": [
+        {"category": "Groceries", "price": 12.5},
+        {"category": "Dining", "price": 5.0},
+        {"category": "Transportation", "price": 3.0}
+    ]}
+
+    assert receipt_deltas(before, after) == {("2024-05", "Groceries"): 2.5, ("2024-05", "Transportation"): 3.0}
+    assert receipt_deltas(before, None) == {("2024-05", "Groceries"): -10.0, ("2024-05", "Dining"): -5.0}
+    # Moving a receipt to another month takes it out of one and adds it to the other
+    moved = {**before, "date": "2024-06-01T12:00:00"}
+    assert receipt_deltas(before, moved) == {
+        ("2024-05", "Groceries"): -10.0, ("2024-05", "Dining"): -5.0,
+        ("2024-06", "Groceries"): 10.0, ("2024-06", "Dining"): 5.0
+    }
+
+
+def _month_rows(receipts):
+    def aggregate(pipeline, docs):
+        totals = {}
+        for receipt in receipts:
+            for item in receipt["items"]:
+                key = (receipt["_id"], item["category"])
+                totals[key] = totals.get(key, 0) + item["price"]
+        return [{"_id": {"receipt": receipt_id, "category": category}, "amount": amount}
+                for (receipt_id, category), amount in totals.items()]
+    return aggregate
+
+
+def _receipt(price, category="Groceries"):
+    return {"_id": ObjectId(), "user_id": "u1", "date": datetime.now(), "items": [{"category": category, "price": price}]}
+
+
+def test_first_write_of_month_seeds_without_counting_its_change_twice(fake_db, monkeypatch):
+    receipts = [_receipt(40.0)]
+    fake_db.collection("receipts", aggregate=_month_rows(receipts))
+    monkeypatch.setattr(budget_alert_service, "get_budget_limits", _no_limits)
+
+    async def scenario():
+        # The new receipt is written before its change is applied, so the seed already counts it
+        new = _receipt(10.0)
+        receipts.append(new)
+        await budget_alert_service.apply_receipt_change("u1", after=new)
+        # Later changes move spend by the difference from the receipt's recorded share
+        await budget_alert_service.apply_receipt_change("u1", before=new, after={**new, "items": [{"category": "Dining", "price": 5.0}]})
+        await budget_alert_service.apply_receipt_change("u1", before=receipts[0])
+
+    asyncio.run(scenario())
+    assert len(fake_db.budget_state.docs) == 1
+    assert fake_db.budget_state.docs[0]["spend"] == {"Groceries": 0.0, "Dining": 5.0}
+    assert fake_db.budget_state.docs[0]["receipts"] == {str(receipts[1]["_id"]): {"Dining": 5.0}}
+
+
+def test_concurrent_first_writes_of_month_are_counted_once(fake_db, monkeypatch):
+    receipts = [_receipt(40.0)]
+    fake_db.collection("receipts", aggregate=_month_rows(receipts))
+    monkeypatch.setattr(budget_alert_service, "get_budget_limits", _no_limits)
+
+    async def scenario():
+        # Both receipts are written before either change is applied, so each seed sees both
+        first, second = _receipt(10.0), _receipt(5.0, "Dining")
+        receipts.extend([first, second])
+        await asyncio.gather(
+            budget_alert_service.apply_receipt_change("u1", after=first),
+            budget_alert_service.apply_receipt_change("u1", after=second)
+        )
+        # Applying a change again is a no-op
+        await budget_alert_service.apply_receipt_change("u1", after=first)
+
+    asyncio.run(scenario())
+    assert len(fake_db.budget_state.docs) == 1
+    assert fake_db.budget_state.docs[0]["spend"] == {"Groceries": 50.0, "Dining": 5.0}
+
+
+def test_delete_in_unseeded_month_is_counted_once(fake_db, monkeypatch):
+    deleted = _receipt(10.0)
+    # The receipt is already gone when its change is applied
+    fake_db.collection("receipts", aggregate=_month_rows([_receipt(40.0)]))
+    monkeypatch.setattr(budget_alert_service, "get_budget_limits", _no_limits)
+
+    asyncio.run(budget_alert_service.apply_receipt_change("u1", before=deleted))
+    assert fake_db.budget_state.docs[0]["spend"] == {"Groceries": 40.0}
+
+
+async def _no_limits(user_id):
+    return {}, True
@@ -0,0 +1,96 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from app.services import budget_tip_service
+from app.services.budget_tip_service import expense_signature, group_by_signature, group_expenses
+from app.utils.rate_limiter import RateLimiter
+
+
+def _summary(user_id, **amounts):
+    return {"_id": user_id, "categories": [{"category": category, "amount": amount} for category, amount in amounts.items()]}
+
+
+def test_similar_spenders_share_a_group():
+    summaries = [
+        _summary("a", Groceries=300, Dining=120, Transport=40),
+        _summary("b", Groceries=280, Dining=150, Transport=60, Other=5),
+        _summary("c", Dining=400, Groceries=100, Transport=50),
+        _summary("d", Groceries=3000, Dining=1200, Transport=400)
+    ]
+    groups = group_by_signature(summaries)
+
+    # Same top categories in the same spend band; a different order or a much larger total splits them
+    assert sorted(sorted(member["_id"] for member in members) for members in groups.values()) == [["a", "b"], ["c"], ["d"]]
+    assert expense_signature(summaries[0]["categories"])[0] == ("Groceries", "Dining", "Transport")
+    assert group_expenses(groups[expense_signature(summaries[0]["categories"])])[0] == {"category": "Groceries", "amount": 290.0}
+
+
+def test_rate_limiter_spaces_calls_after_burst():
+    limiter = RateLimiter(rate=50, burst=2)
+
+    async def acquire_all():
+        started = time.monotonic()
+        for _ in range(6):
+            await limiter.acquire()
+        return time.monotonic() - started
+
+    # Two immediately, then four more at 50 per second
+    assert 0.07 <= asyncio.run(acquire_all()) < 0.5
+
+
+def _receipt_summaries(user_ids):
+    summaries = [_summary(user_id, Groceries=100) for user_id in user_ids]
+
+    def aggregate(pipeline, docs):
+        # The per-user category totals, resuming after the checkpoint's last user
+        after = pipeline[0]["$match"]["user_id"].get("$gt")
+        return [summary for summary in summaries if after is None or summary["_id"] > after]
+    return aggregate
+
+
+def _run_budget_tips(fake_db, monkeypatch, user_ids, on_insert=None):
+    fake_db.collection("receipts", aggregate=_receipt_summaries(user_ids))
+    sent = []
+
+    async def fake_tip(expenses, feature=None):
+        return "Spend less on groceries."
+
+    async def fake_create(notifications):
+        sent.extend(notification["user_id"] for notification in notifications)
+        if on_insert:
+            on_insert()
+        return [notification["dedupe_key"] for notification in notifications]
+
+    monkeypatch.setattr(budget_tip_service, "generate_budget_tip_text", fake_tip)
+    monkeypatch.setattr(budget_tip_service, "create_notifications_in_db", fake_create)
+    monkeypatch.setattr(budget_tip_service.settings, "BUDGET_TIP_CHUNK_USERS", 2)
+    asyncio.run(budget_tip_service.send_budget_tips())
+    return sent
+
+
+def test_budget_tips_resume_after_checkpoint(fake_db, monkeypatch):
+    # An earlier run stopped after u2 and its lease has expired
+    checkpoints = fake_db.collection("job_checkpoints", [{
+        "_id": "budget_tips", "run_id": "r1", "status": "running", "owner": "crashed",
+        "lease_until": datetime.now() - timedelta(minutes=1), "started_at": datetime.now() - timedelta(hours=1),
+        "last_user_id": "u2", "processed": 2, "sent": 2
+    }])
+    sent = _run_budget_tips(fake_db, monkeypatch, ["u1", "u2", "u3", "u4", "u5"])
+
+    checkpoint = checkpoints.docs[0]
+    assert sent == ["u3", "u4", "u5"]
+    assert checkpoint["run_id"] == "r1" and checkpoint["status"] == "done"
+    assert checkpoint["processed"] == 5 and checkpoint["sent"] == 5
+
+
+def test_budget_tips_stop_when_lease_is_lost(fake_db, monkeypatch):
+    checkpoints = fake_db.collection("job_checkpoints")
+
+    def steal_lease():
+        # Another worker takes over while the first chunk is being sent
+        checkpoints.docs[0]["owner"] = "other-worker"
+
+    sent = _run_budget_tips(fake_db, monkeypatch, ["u1", "u2", "u3", "u4"], on_insert=steal_lease)
+
+    assert sent == ["u1", "u2"]
+    assert checkpoints.docs[0]["status"] == "running" and checkpoints.docs[0]["last_user_id"] is None
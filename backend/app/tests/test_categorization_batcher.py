@@ -0,0 +1,24 @@
+import asyncio
+import gc
+import pytest
+from app.services.categorization_batcher import CategorizationBatcher
+from app.utils.fakes import FakeGenerativeModel
+
+def test_rejects_empty_batches():
+    with pytest.raises(ValueError):
+        CategorizationBatcher(model=FakeGenerativeModel("gemini-pro"), max_items=0)
+
+def test_in_flight_batches_are_kept_alive():
+    """A flushed batch's task isn't collected while callers are still waiting on it"""
+    batcher = CategorizationBatcher(model=FakeGenerativeModel("gemini-pro"), window_ms=0, max_items=2)
+
+    async def run():
+        pending = asyncio.ensure_future(batcher.categorize(["Milk", "Bread", "Bus ticket"], ["Food & Dining", "Transportation"]))
+        await asyncio.sleep(0)
+        gc.collect()
+        results = await asyncio.wait_for(pending, timeout=5)
+        return results, len(batcher._tasks)
+
+    results, tasks_left = asyncio.run(run())
+    assert set(results) == {"Milk", "Bread", "Bus ticket"}
+    assert tasks_left == 0
@@ -0,0 +1,32 @@
+import asyncio
+
+from app.services import category_service
+
+
+def test_category_view_is_cached_until_a_write(fake_db):
+    collection = fake_db.collection("categories")
+    category_service._views.clear()
+
+    async def run():
+        version, categories = await category_service.get_category_view("user-1")
+        assert len(categories) == len(category_service.DEFAULT_CATEGORIES)
+
+        # Served from the cache, and callers get copies they can't corrupt it through
+        categories[0]["name"] = "Changed"
+        assert await category_service.get_category_view("user-1") == (version, await category_service.get_all_categories("user-1"))
+        assert collection.calls["find"] == 1
+
+        # A custom category replaces the system one of the same name and changes the version
+        created = await category_service.create_category("user-1", {"name": "food & dining", "color": "#000000"})
+        new_version, categories = await category_service.get_category_view("user-1")
+        assert new_version != version and collection.calls["find"] == 2
+        assert [category["name"] for category in categories].count("Food & Dining") == 0
+        assert len(categories) == len(category_service.DEFAULT_CATEGORIES)
+
+        # Other users can't delete it; deleting it restores the original view and version
+        assert await category_service.delete_category(created["_id"], "user-2") is False
+        assert await category_service.delete_category("not-an-id", "user-1") is False
+        assert await category_service.delete_category(created["_id"], "user-1") is True
+        assert (await category_service.get_category_view("user-1"))[0] == version
+
+    asyncio.run(run())
@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from app.services import llm_service
+from app.utils.fakes import FakeGenerativeModel
+from app.utils.metrics import metrics
+
+@pytest.fixture(autouse=True)
+def clean_usage():
+    metrics.reset()
+    llm_service._usage_buffer.clear()
+    yield
+    llm_service._usage_buffer.clear()
+
+def _counter(name, **labels):
+    for counter in metrics.snapshot()["counters"]:
+        if counter["name"] == name and all(counter["labels"].get(k) == v for k, v in labels.items()):
+            return counter["value"]
+    return 0
+
+def test_generate_records_tokens_latency_and_cost():
+    model = FakeGenerativeModel("gemini-1.5-flash")
+    response = asyncio.run(llm_service.generate("tips", "gemini-1.5-flash", "Generate 2 money-saving tips", model=model))
+
+    assert response.text
+    assert _counter("llm_requests_total", feature="tips", model="gemini-1.5-flash", outcome="ok") == 1
+    assert _counter("llm_cost_usd_total", feature="tips") > 0
+    histograms = {h["name"] for h in metrics.snapshot()["histograms"]}
+    assert {"llm_latency_ms", "llm_prompt_tokens", "llm_response_tokens"} <= histograms
+
+    (day, feature, model_name), usage = next(iter(llm_service._usage_buffer.items()))
+    assert (feature, model_name) == ("tips", "gemini-1.5-flash")
+    assert usage["calls"] == 1 and usage["errors"] == 0
+    assert usage["prompt_tokens"] > 0 and usage["response_tokens"] > 0
+
+def test_generate_records_failed_retries():
+    model = FakeGenerativeModel("gemini-1.5-flash", overloaded_rate=1.0)
+    with pytest.raises(Exception, match="503"):
+        asyncio.run(llm_service.generate("ocr", "gemini-1.5-flash", "hello", model=model, retries=2))
+
+    assert _counter("llm_requests_total", feature="ocr", outcome="error") == 1
+    assert _counter("llm_retries_total", feature="ocr") == 1
+
+def test_flush_keeps_usage_when_database_unavailable():
+    llm_service.record_cache_hit("scan_text")
+    llm_service.record_parse_failure("scan_text", "gemini-pro")
+    asyncio.run(llm_service.flush_usage())
+
+    # No database connection in this test, so the counts stay buffered for the next flush
+    counts = {key[1:]: value for key, value in llm_service._usage_buffer.items()}
+    assert counts[("scan_text", "none")]["cache_hits"] == 1
+    assert counts[("scan_text", "gemini-pro")]["parse_failures"] == 1
+
+def test_usage_flush_is_scheduled_once_per_interval(monkeypatch):
+    flushes = []
+
+    async def fake_flush():
+        flushes.append(1)
+
+    monkeypatch.setattr(llm_service, "flush_usage", fake_flush)
+    monkeypatch.setattr(llm_service, "_last_flush", 0.0)
+
+    async def scenario():
+        for _ in range(5):
+            llm_service._maybe_flush()
+        in_flight = len(llm_service._flush_tasks)
+        await asyncio.gather(*llm_service._flush_tasks)
+        llm_service._maybe_flush()
+        return in_flight
+
+    assert asyncio.run(scenario()) == 1
+    assert flushes == [1] and not llm_service._flush_tasks
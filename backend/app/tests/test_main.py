@@ -0,0 +1,18 @@
+from fastapi.testclient import TestClient
+from app.config.settings import settings
+
+def test_metrics_requires_token_or_local_client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "static").mkdir()
+    from app.main import app
+    client = TestClient(app)
+
+    # The test client isn't a loopback address, and no token is configured
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "")
+    assert client.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "scrape-secret")
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 404
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"})
+    assert response.status_code == 200
+    assert "counters" in response.json()
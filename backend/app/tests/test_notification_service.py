@@ -0,0 +1,317 @@
+import asyncio
+
+from app.services import broadcast_service, notification_service
+
+
+def _counters(fake_db, counts=None):
+    return fake_db.collection("notification_counters",
+                              [{"user_id": user_id, "unread": unread} for user_id, unread in (counts or {}).items()],
+                              unique=("user_id",))
+
+
+def _counts(counters):
+    return {doc["user_id"]: doc["unread"] for doc in counters.docs}
+
+
+def test_unread_counter_tracks_writes_without_counting(fake_db):
+    notifications, counters = fake_db.collection("notifications"), _counters(fake_db)
+    notification_service._unread_counts.clear()
+
+    async def scenario():
+        first = await notification_service.create_notification_in_db({"user_id": "u1", "is_read": False})
+        await notification_service.create_notifications_in_db([
+            {"user_id": "u1", "is_read": False},
+            {"user_id": "u1", "is_read": False},
+            {"user_id": "u2", "is_read": False}
+        ])
+        counts = [await notification_service.get_notification_count("u1")]
+        # Served from the in-process cache
+        counts.append(await notification_service.get_notification_count("u1"))
+        reads = counters.calls.get("find_one", 0)
+
+        await notification_service.mark_as_read(first, "u1")
+        # Marking an already read notification again doesn't decrement twice
+        await notification_service.mark_as_read(first, "u1")
+        counts.append(await notification_service.get_notification_count("u1"))
+        await notification_service.mark_all_notifications_read("u1")
+        counts.append(await notification_service.get_notification_count("u1"))
+        return counts, reads
+
+    counts, reads = asyncio.run(scenario())
+    assert counts == [3, 3, 2, 0]
+    assert reads == 1
+    # Counted only once per user, to seed their counter on the first write
+    assert notifications.calls["count_documents"] == 2
+    assert _counts(counters) == {"u1": 0, "u2": 1}
+
+
+def test_unread_counter_is_seeded_from_existing_notifications(fake_db):
+    # Unread notifications from before the user had a counter
+    notifications = fake_db.collection("notifications", [{"user_id": "u1", "is_read": False} for _ in range(4)])
+    _counters(fake_db)
+    notification_service._unread_counts.clear()
+
+    async def scenario():
+        await notification_service.create_notification_in_db({"user_id": "u1", "is_read": False})
+        first = await notification_service.get_notification_count("u1")
+        await notification_service.mark_as_read(str(notifications.docs[0]["_id"]), "u1")
+        return first, await notification_service.get_notification_count("u1")
+
+    assert asyncio.run(scenario()) == (5, 4)
+    assert notifications.calls["count_documents"] == 1
+
+
+def test_reconcile_rewrites_only_drifted_counters(fake_db):
+    rows = [{"_id": "u1", "unread": 3}, {"_id": "u2", "unread": 1}, {"_id": "u4", "unread": 6}]
+    fake_db.collection("notifications", aggregate=lambda pipeline, docs: rows)
+    counters = _counters(fake_db, {"u1": 3, "u2": 5, "u3": 2})
+
+    asyncio.run(notification_service.reconcile_unread_counts())
+    assert _counts(counters) == {"u1": 3, "u2": 1, "u3": 0, "u4": 6}
+
+
+def test_bulk_insert_counts_only_notifications_actually_inserted(fake_db, monkeypatch):
+    notifications = fake_db.collection("notifications", [
+        {"user_id": "u1", "is_read": False, "dedupe_key": "tip:u1"}
+    ], unique=("dedupe_key",))
+    counters = _counters(fake_db, {"u1": 1})
+    published = []
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_FANOUT", "local")
+    monkeypatch.setattr(notification_service.notification_hub, "publish",
+                        lambda notification, event="notification": published.append(notification["user_id"]))
+    notification_service._unread_counts.clear()
+
+    ids = asyncio.run(notification_service.create_notifications_in_db([
+        {"user_id": "u1", "is_read": False, "dedupe_key": "tip:u1"},
+        {"user_id": "u2", "is_read": False, "dedupe_key": "tip:u2"}
+    ]))
+    assert len(ids) == 1 and ids[0] == str(notifications.docs[-1]["_id"])
+    assert _counts(counters) == {"u1": 1, "u2": 1}
+    assert published == ["u2"]
+
+
+def test_notification_stream_delivers_and_resyncs_slow_clients(monkeypatch):
+    from app.services.notification_hub import NotificationHub, TooManyStreams, stream_notifications
+    from app.services import notification_hub as hub_module
+
+    hub = NotificationHub()
+    monkeypatch.setattr(hub_module, "notification_hub", hub)
+    monkeypatch.setattr(hub_module.settings, "NOTIFICATION_STREAM_MAX_PER_USER", 2)
+    monkeypatch.setattr(hub_module.settings, "NOTIFICATION_STREAM_QUEUE_SIZE", 2)
+
+    async def fake_count(user_id):
+        return 7
+
+    monkeypatch.setattr(notification_service, "get_notification_count", fake_count)
+
+    async def scenario():
+        subscription = hub.subscribe("u1")
+        hub.subscribe("u1")
+        try:
+            hub.subscribe("u1")
+            rejected = False
+        except TooManyStreams:
+            rejected = True
+
+        # The queue holds two events; the third is dropped and the client is told to resync
+        for index in range(3):
+            hub.publish({"user_id": "u1", "title": f"n{index}"})
+        hub.publish({"user_id": "u2", "title": "other user"})
+
+        stream = stream_notifications(subscription)
+        events = [await stream.__anext__() for _ in range(5)]
+        subscription.close()
+        events += [event async for event in stream]
+        return rejected, events
+
+    rejected, events = asyncio.run(scenario())
+    assert rejected
+    assert events[0].startswith("retry: ")
+    assert [event.split("\n")[0] for event in events[1:]] == [
+        "event: unread_count", "event: notification", "event: notification", "event: resync"
+    ]
+    assert '"n1"' in events[3] and '"count": 7' in events[4]
+    # The closed stream unsubscribed itself
+    assert hub.connection_count("u1") == 1
+
+
+def test_notification_stream_stops_at_heartbeat_after_disconnect(monkeypatch):
+    from app.services.notification_hub import NotificationHub, stream_notifications
+    from app.services import notification_hub as hub_module
+
+    hub = NotificationHub()
+    monkeypatch.setattr(hub_module, "notification_hub", hub)
+    monkeypatch.setattr(hub_module.settings, "NOTIFICATION_STREAM_HEARTBEAT_SECONDS", 0.01)
+
+    async def fake_count(user_id):
+        return 0
+
+    monkeypatch.setattr(notification_service, "get_notification_count", fake_count)
+
+    class _Request:
+        def __init__(self):
+            self.checks = 0
+
+        async def is_disconnected(self):
+            self.checks += 1
+            return self.checks > 1
+
+    async def scenario():
+        request = _Request()
+        events = [event async for event in stream_notifications(hub.subscribe("u1"), request)]
+        return events, request.checks
+
+    events, checks = asyncio.run(scenario())
+    assert events[-1] == ": heartbeat\n\n" and checks == 2
+    assert hub.connection_count("u1") == 0
+
+
+def test_stream_takes_no_slot_until_the_response_starts(monkeypatch):
+    from app.services.notification_hub import NotificationHub, open_notification_stream
+    from app.services import notification_hub as hub_module
+
+    hub = NotificationHub()
+    monkeypatch.setattr(hub_module, "notification_hub", hub)
+    monkeypatch.setattr(hub_module.settings, "NOTIFICATION_STREAM_MAX_PER_USER", 1)
+
+    async def fake_count(user_id):
+        return 0
+
+    monkeypatch.setattr(notification_service, "get_notification_count", fake_count)
+
+    async def scenario():
+        # The client went away before the body was iterated
+        open_notification_stream("u1")
+        counts = [hub.connection_count("u1")]
+
+        stream = open_notification_stream("u1")
+        await stream.__anext__()
+        counts.append(hub.connection_count("u1"))
+        # The response is closed after the client disconnects mid-stream
+        await stream.aclose()
+        counts.append(hub.connection_count("u1"))
+        return counts
+
+    assert asyncio.run(scenario()) == [0, 1, 0]
+
+
+def test_broadcast_inserts_in_chunks_and_reports_progress(fake_db, monkeypatch):
+    fake_db.collection("user_profiles", [{"firebase_uid": f"user-{index}"} for index in range(25)]
+                       + [{"email": "no-uid@example.com"}])
+    notifications = fake_db.collection("notifications", unique=("dedupe_key",))
+    counters = _counters(fake_db, {"user-0": 2})
+    monkeypatch.setattr(broadcast_service.settings, "BROADCAST_CHUNK_SIZE", 10)
+    monkeypatch.setattr(broadcast_service.settings, "BROADCAST_WRITES_PER_SECOND", 0)
+
+    async def scenario():
+        started = await broadcast_service.start_broadcast("admin", "Maintenance", "Down at noon")
+        await asyncio.gather(*broadcast_service._tasks.values())
+        return started, await broadcast_service.get_broadcast(started["id"])
+
+    started, finished = asyncio.run(scenario())
+    assert started["status"] == "running"
+    assert notifications.calls["insert_many"] == 3 and len(notifications.docs) == 25
+    assert finished["status"] == "completed" and finished["sent"] == 25 and finished["progress"] == 1.0
+    # One bulk upsert of the counters per chunk, without counting each recipient's notifications
+    assert counters.calls["bulk_write"] == 3 and "count_documents" not in notifications.calls
+    assert _counts(counters)["user-0"] == 3 and _counts(counters)["user-24"] == 1
+
+
+def test_interrupted_broadcast_resumes_from_its_checkpoint(fake_db, monkeypatch):
+    from datetime import datetime, timedelta
+
+    profiles = fake_db.collection("user_profiles", [{"firebase_uid": f"user-{index}"} for index in range(6)])
+    notifications = fake_db.collection("notifications", unique=("dedupe_key",))
+    _counters(fake_db)
+    monkeypatch.setattr(broadcast_service.settings, "BROADCAST_WRITES_PER_SECOND", 0)
+    stale = datetime.now() - timedelta(minutes=1)
+    broadcasts = fake_db.collection("broadcasts", [
+        # Stopped by a restart after checkpointing the first chunk, but before recording the second
+        {"title": "Maintenance", "message": "Down at noon", "link": None, "status": "running", "total": 6, "sent": 2,
+         "last_profile_id": profiles.docs[1]["_id"], "owner": "gone", "lease_until": stale},
+        # Still held by a live worker
+        {"title": "Other", "message": "Hi", "link": None, "status": "running", "total": 6, "sent": 0,
+         "last_profile_id": None, "owner": "alive", "lease_until": datetime.now() + timedelta(minutes=5)},
+        # From before broadcasts kept checkpoints
+        {"title": "Old", "message": "Hi", "link": None, "status": "running", "total": 6, "sent": 3}
+    ])
+    for index in range(4):
+        notifications.docs.append({"user_id": f"user-{index}", "is_read": False,
+                                   "dedupe_key": f"broadcast:{broadcasts.docs[0]['_id']}:user-{index}"})
+
+    async def scenario():
+        resumed = await broadcast_service.resume_broadcasts()
+        await asyncio.gather(*broadcast_service._tasks.values())
+        return resumed
+
+    assert asyncio.run(scenario()) == 1
+    resumed, alive, old = broadcasts.docs
+    assert resumed["status"] == "completed" and resumed["sent"] == 6
+    assert sorted(doc["user_id"] for doc in notifications.docs) == [f"user-{index}" for index in range(6)]
+    assert alive["status"] == "running" and alive["owner"] == "alive"
+    assert old["status"] == "failed"
+
+
+def test_prune_backfills_read_at_and_archives_expired(fake_db, monkeypatch):
+    from datetime import datetime, timedelta
+
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_ARCHIVE_ENABLED", True)
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_READ_RETENTION_DAYS", 30)
+    monkeypatch.setattr(notification_service, "ARCHIVE_BATCH_SIZE", 2)
+    long_ago = datetime.now() - timedelta(days=45)
+    notifications = fake_db.collection("notifications", [
+        {"user_id": "u1", "type": "tip", "title": f"old {index}", "message": "...", "is_read": True, "read_at": long_ago}
+        for index in range(3)
+    ] + [
+        {"user_id": "u1", "type": "tip", "title": "read before read_at", "is_read": True},
+        {"user_id": "u1", "type": "tip", "title": "unread", "is_read": False}
+    ])
+    archive = fake_db.collection("notifications_archive", unique=("_id",))
+    # An earlier run archived this one but stopped before deleting it
+    archive.docs.append({key: notifications.docs[0][key] for key in ("_id", "user_id", "title")})
+
+    asyncio.run(notification_service.prune_notifications())
+
+    assert sorted(doc["title"] for doc in notifications.docs) == ["read before read_at", "unread"]
+    backfilled = next(doc for doc in notifications.docs if doc["is_read"])
+    assert backfilled["read_at"] > long_ago
+    assert sorted(doc["title"] for doc in archive.docs) == ["old 0", "old 1", "old 2"]
+    # Only the archive fields are kept
+    assert all("message" not in doc for doc in archive.docs)
+
+
+def test_ttl_index_expiry_is_updated_in_place(fake_db, monkeypatch):
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_ARCHIVE_ENABLED", False)
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_READ_RETENTION_DAYS", 30)
+    asyncio.run(notification_service.ensure_notification_indexes())
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_READ_RETENTION_DAYS", 7)
+    asyncio.run(notification_service.ensure_notification_indexes())
+
+    assert fake_db.notifications.indexes["read_at_1"] == {"expireAfterSeconds": 7 * 24 * 60 * 60}
+    assert fake_db.commands == [{
+        "collMod": "notifications",
+        "index": {"keyPattern": {"read_at": 1}, "expireAfterSeconds": 7 * 24 * 60 * 60}
+    }]
+
+
+def test_digest_folds_notifications_of_the_same_type(fake_db, monkeypatch):
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_DIGEST_MAX_ITEMS", 2)
+    monkeypatch.setattr(notification_service.settings, "NOTIFICATION_FANOUT", "change_stream")
+    notification_service._unread_counts.clear()
+
+    async def scenario():
+        ids = []
+        for store in ("Aldi", "Lidl", "Tesco"):
+            ids.append(await notification_service.create_receipt_notification("u1", {"store_name": store, "total_amount": 5}))
+        ids.append(await notification_service.create_notification_in_db({"user_id": "u1", "type": "budget", "title": "Budget", "is_read": False}))
+        return ids, await notification_service.get_notification_count("u1")
+
+    ids, count = asyncio.run(scenario())
+    digest = fake_db.notifications.docs[0]
+    assert ids[0] == ids[1] == ids[2] != ids[3]
+    assert len(fake_db.notifications.docs) == 2
+    assert digest["title"] == "3 Receipts Added" and digest["digest_count"] == 3
+    assert [item["title"] for item in digest["digest_items"]] == ["Receipt Added: Lidl", "Receipt Added: Tesco"]
+    assert digest["message"].startswith("Your receipt from Tesco")
+    # The digest is one unread notification
+    assert count == 2
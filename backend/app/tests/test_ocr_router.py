@@ -0,0 +1,20 @@
+import io
+
+from PIL import Image, ImageDraw
+
+from app.services.ocr_router import estimate_complexity
+
+
+def test_complexity_counts_text_lines():
+    image = Image.new("RGB", (600, 900), "white")
+    draw = ImageDraw.Draw(image)
+    for top in (100, 300, 500, 880):
+        draw.rectangle([50, top, 550, top + 20], fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+
+    complexity = estimate_complexity(buffer.getvalue(), "image/png")
+    # The last bar runs off the bottom edge and still counts
+    assert complexity["text_lines"] == 4
+    assert complexity["mime_type"] == "image/png"
+    assert 0 < complexity["ink_density"] < 0.2
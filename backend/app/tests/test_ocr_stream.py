@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import llm_service, ocr_stream
+from app.utils.metrics import metrics
+
+
+def test_staged_scans_are_capped_and_single_use(monkeypatch):
+    monkeypatch.setattr(ocr_stream, "_pending_scans", {})
+    monkeypatch.setattr(ocr_stream, "_pending_bytes", 0)
+    monkeypatch.setattr(ocr_stream.settings, "SCAN_STREAM_MAX_PENDING_PER_USER", 2)
+    monkeypatch.setattr(ocr_stream.settings, "SCAN_STREAM_MAX_PENDING_BYTES", 250)
+
+    first = ocr_stream.stage_scan("u1", b"a" * 100, "image/png")
+    ocr_stream.stage_scan("u1", b"b" * 100, "image/png")
+    with pytest.raises(ocr_stream.TooManyPendingScans):
+        ocr_stream.stage_scan("u1", b"c" * 10, "image/png")
+    # Another user is only held back by the total budget
+    with pytest.raises(ocr_stream.TooManyPendingScans):
+        ocr_stream.stage_scan("u2", b"d" * 100, "image/png")
+
+    assert ocr_stream.claim_scan(first) == (b"a" * 100, "image/png")
+    assert ocr_stream.claim_scan(first) is None
+    # Claiming released the first scan's bytes and its slot
+    ocr_stream.stage_scan("u2", b"d" * 100, "image/png")
+    assert ocr_stream._pending_bytes == 200
+
+
+class _HeldStream:
+    # Sends two chunks, then holds the third until the test releases it
+    def __init__(self):
+        self.released = threading.Event()
+        self.chunks_sent = 0
+
+    def generate_content(self, contents, stream=False):
+        for text in ('{"store_name": "Corner Shop",', ' "date": "2024-05-01",', ' "items": []}'):
+            if self.chunks_sent == 2:
+                self.released.wait(5)
+            self.chunks_sent += 1
+            yield SimpleNamespace(text=text, usage_metadata=None)
+
+class _Request:
+    def __init__(self):
+        self.checks = 0
+
+    async def is_disconnected(self):
+        # The client goes away after the first chunk has been sent
+        self.checks += 1
+        return self.checks > 1
+
+class _CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    async def acquire(self):
+        self.acquired += 1
+
+def test_stream_stops_reading_the_model_when_the_client_disconnects(monkeypatch):
+    metrics.reset()
+    model = _HeldStream()
+    limiter = _CountingLimiter()
+    monkeypatch.setattr(llm_service, "get_generative_model", lambda model_name: model)
+    monkeypatch.setattr(llm_service, "rate_limiter", limiter)
+    monkeypatch.setattr(llm_service, "_maybe_flush", lambda: None)
+
+    async def scan():
+        return [event async for event in ocr_stream.stream_receipt_image(b"not an image", "image/png", _Request())]
+
+    events = asyncio.run(scan())
+    model.released.set()
+    deadline = time.monotonic() + 5
+    while not llm_service._usage_buffer and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert [event.split("\n")[0] for event in events] == ["event: started", "event: store_name"]
+    assert limiter.acquired == 1
+    # The worker saw the stop flag instead of reading the rest of the response
+    assert model.chunks_sent == 3
+    counters = {(c["name"], c["labels"].get("outcome")): c["value"] for c in metrics.snapshot()["counters"]}
+    assert counters[("llm_requests_total", "cancelled")] == 1
+    assert counters[("ocr_stream_disconnects_total", None)] == 1
+    llm_service._usage_buffer.clear()
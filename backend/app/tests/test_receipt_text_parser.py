@@ -0,0 +1,87 @@
+import asyncio
+
+from app.services import receipt_text_parser
+from app.services.receipt_text_parser import parse_receipt_text, parse_date, header_key
+
+GROCERY_RECEIPT = """TRADER JOE'S
+Store #552 (555) 123-4567
+03/14/2024 10:22
+BANANAS
+3 @ 0.25   0.75
+2 x GREEK YOGURT 5.98
+ALMOND MILK      3.49 F
+SUBTOTAL 10.22
+TAX 0.51
+TOTAL 10.73
+VISA 10.73
+"""
+
+def test_parses_items_totals_and_date():
+    """Quantity lines, multipliers and totals reconcile into a confident result"""
+    result, confidence = parse_receipt_text(GROCERY_RECEIPT)
+
+    assert result["store_name"] == "TRADER JOE'S"
+    assert result["date"] == "2024-03-14"
+    assert result["total_amount"] == 10.73
+    assert [(item["name"], item["price"], item["quantity"]) for item in result["items"]] == [
+        ("BANANAS", 0.25, 3.0),
+        ("GREEK YOGURT", 2.99, 2.0),
+        ("ALMOND MILK", 3.49, 1.0),
+    ]
+    assert confidence >= 0.75
+
+def test_unreconciled_receipt_has_low_confidence():
+    """Receipts without a printed total should fall back to the LLM"""
+    _, confidence = parse_receipt_text("Corner Cafe\nLatte 4.50\nMuffin 3.00\nThanks!")
+    assert confidence < 0.75
+
+def test_template_supplies_store_name_and_categories():
+    """Learned merchant templates override the guessed store name and categories"""
+    template = {"store_name": "Trader Joe's", "item_categories": {"bananas": "food"}}
+    result, _ = parse_receipt_text(GROCERY_RECEIPT, template)
+
+    assert result["store_name"] == "Trader Joe's"
+    assert result["items"][0]["category"] == "food"
+    assert result["items"][1]["category"] == "other"
+
+def test_date_formats():
+    assert parse_date("2024-01-05 12:00") == "2024-01-05"
+    assert parse_date("25/12/23") == "2023-12-25"
+    assert parse_date("Jan 5, 2024") == "2024-01-05"
+    assert parse_date("5 March 2024") == "2024-03-05"
+    assert parse_date("no date here") is None
+
+def test_header_key_ignores_store_numbers():
+    assert header_key(["TRADER JOE'S", "Store #552"]) == header_key(["Trader Joe's", "Store #101"])
+
+def test_template_misses_expire_sooner_than_hits(fake_db, monkeypatch):
+    """A merchant learned by another worker is found once the cached miss expires"""
+    templates = fake_db.collection("merchant_templates")
+    clock = [1000.0]
+    monkeypatch.setattr(receipt_text_parser.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(receipt_text_parser, "_template_cache", {})
+    monkeypatch.setattr(receipt_text_parser.settings, "MERCHANT_TEMPLATE_MISS_TTL_SECONDS", 60)
+    monkeypatch.setattr(receipt_text_parser.settings, "MERCHANT_TEMPLATE_CACHE_TTL_SECONDS", 600)
+    lookup = lambda: asyncio.run(receipt_text_parser.get_merchant_template(GROCERY_RECEIPT))
+
+    assert lookup() is None and lookup() is None
+    assert templates.calls["find_one"] == 1
+
+    # The miss is cached under the receipt's header key
+    key = next(iter(receipt_text_parser._template_cache))
+    templates.docs.append({"header_key": key, "store_name": "Trader Joe's", "items": []})
+    clock[0] += 61
+    assert lookup()["store_name"] == "Trader Joe's"
+    clock[0] += 300
+    assert lookup()["store_name"] == "Trader Joe's"
+    assert templates.calls["find_one"] == 2
+
+def test_fast_path_parses_without_template_when_lookup_fails(fake_db, monkeypatch):
+    async def unavailable(query):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(fake_db.merchant_templates, "find_one", unavailable)
+    receipt_text_parser._template_cache.clear()
+
+    result, confidence = asyncio.run(receipt_text_parser.parse_receipt_text_fast(GROCERY_RECEIPT))
+    assert result["total_amount"] == 10.73 and confidence > 0
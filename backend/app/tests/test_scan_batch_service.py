@@ -0,0 +1,40 @@
+import asyncio
+
+from app.services import scan_batch_service
+
+
+def test_background_jobs_are_capped_and_release_their_slots(monkeypatch):
+    monkeypatch.setattr(scan_batch_service.settings, "SCAN_BATCH_MAX_JOBS_PER_USER", 1)
+    monkeypatch.setattr(scan_batch_service, "_jobs", {})
+    release = None
+
+    async def fake_process(image_bytes, mime_type=None):
+        await release.wait()
+        return {"store_name": "Fake Mart", "items": []}
+
+    monkeypatch.setattr(scan_batch_service, "process_receipt_image", fake_process)
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        images = [("a.png", b"a", "image/png"), ("b.png", b"b", "image/png")]
+        job_id = scan_batch_service.start_batch_job("u1", images)
+        try:
+            scan_batch_service.start_batch_job("u1", images)
+            rejected = False
+        except scan_batch_service.TooManyBatchJobs:
+            rejected = True
+        # Other users aren't affected
+        other_id = scan_batch_service.start_batch_job("u2", images[:1])
+        await asyncio.sleep(0.01)
+        held = set(scan_batch_service._user_semaphores)
+
+        release.set()
+        await asyncio.gather(*scan_batch_service._tasks)
+        return rejected, held, scan_batch_service.get_batch_job(job_id, "u1"), scan_batch_service.get_batch_job(other_id, "u2")
+
+    rejected, held, job, other = asyncio.run(scenario())
+    assert rejected and held == {"u1", "u2"}
+    assert job["status"] == other["status"] == "completed" and job["completed"] == 2
+    # Semaphores are dropped once a user's scans are done
+    assert scan_batch_service._user_semaphores == {} and not scan_batch_service._tasks
@@ -0,0 +1,30 @@
+import asyncio
+from app.utils.metrics import metrics
+from app.utils.scheduler import Scheduler
+
+def test_scheduler_runs_jobs_and_survives_failures():
+    runs = []
+
+    async def refill():
+        runs.append("refill")
+
+    async def broken():
+        runs.append("broken")
+        raise RuntimeError("boom")
+
+    async def main():
+        scheduler = Scheduler()
+        scheduler.add_job("refill", refill, interval_seconds=0.01)
+        scheduler.add_job("broken", broken, interval_seconds=0.01)
+        scheduler.start()
+        await asyncio.sleep(0.05)
+        await scheduler.stop()
+
+    metrics.reset()
+    asyncio.run(main())
+
+    # A failing job keeps being retried and doesn't stop the others
+    assert runs.count("refill") >= 2
+    assert runs.count("broken") >= 2
+    counters = {(c["name"], c["labels"]["job"], c["labels"]["outcome"]) for c in metrics.snapshot()["counters"]}
+    assert ("scheduler_runs_total", "broken", "error") in counters
@@ -0,0 +1,25 @@
+import asyncio
+
+from app.services import settings_service
+
+
+def test_settings_writes_are_single_upserts(fake_db):
+    # The fake rejects $set/$setOnInsert path conflicts the way Mongo does
+    collection = fake_db.collection("user_settings", unique=["user_id"])
+
+    async def run():
+        # The first write for a user creates the defaults around the fields being set
+        created = await settings_service.update_user_settings("user-1", {"notifications.push": True})
+        updated = await settings_service.update_user_settings("user-1", {"theme": "dark", "_id": "ignored"})
+        fetched = await settings_service.get_or_create_user_settings("user-1")
+        return created, updated, fetched
+
+    created, updated, fetched = asyncio.run(run())
+    assert created["notifications"] == {"email": True, "push": True, "budget_alerts": True}
+    assert created["theme"] == "light" and created["budget_limits"] == {}
+    assert updated["theme"] == "dark" and updated["notifications"] == created["notifications"]
+    assert fetched["_id"] == updated["_id"] == str(collection.docs[0]["_id"])
+    assert len(collection.docs) == 1 and collection.calls["find_one_and_update"] == 3
+
+    fresh = asyncio.run(settings_service.get_or_create_user_settings("user-2"))
+    assert fresh["notifications"] == settings_service.DEFAULT_SETTINGS["notifications"]
@@ -0,0 +1,250 @@
+import asyncio
+from app.services import category_service, tip_effectiveness_service, tip_service
+
+def test_personalized_tips_upsert_once_for_concurrent_requests(fake_db, monkeypatch):
+    tips = fake_db.collection("tips")
+    generations = []
+
+    async def fake_analyze(user_id):
+        return {}
+
+    async def fake_generate(user_id, patterns, category, count):
+        generations.append(user_id)
+        await asyncio.sleep(0.01)
+        return [
+            {"title": "Cook at home", "content": "Cook more.", "category": "Food & Dining"},
+            {"title": "cook  AT home", "content": "Duplicate title.", "category": "Food & Dining"},
+            {"title": "Cancel subscriptions", "content": "Audit them.", "category": "Bills & Utilities"}
+        ]
+
+    monkeypatch.setattr(tip_service, "analyze_user_spending", fake_analyze)
+    monkeypatch.setattr(tip_service, "generate_personalized_tips", fake_generate)
+
+    async def main():
+        return await asyncio.gather(*[tip_service.get_personalized_tips("user-1", None, 2, refresh=True) for _ in range(5)])
+
+    results = asyncio.run(main())
+
+    assert generations == ["user-1"]
+    assert tips.calls["bulk_write"] == 1
+    assert len(tips.docs) == 2
+    assert [tip["title"] for tip in results[0]] == ["Cook at home", "Cancel subscriptions"]
+    assert all(result == results[0] for result in results)
+
+def test_spending_profile_is_cached_until_receipts_change(monkeypatch):
+    from app.services import spending_profile_service
+    computed = []
+
+    async def fake_compute(user_id, days):
+        computed.append(user_id)
+        return {"top_spending_categories": [], "spending_by_category": {}, "total_spending": len(computed)}
+
+    monkeypatch.setattr(spending_profile_service, "_compute_spending_profile", fake_compute)
+    spending_profile_service.invalidate_spending_profile("user-2")
+
+    first = asyncio.run(spending_profile_service.get_spending_profile("user-2"))
+    second = asyncio.run(spending_profile_service.get_spending_profile("user-2"))
+    assert first is second and computed == ["user-2"]
+
+    spending_profile_service.invalidate_spending_profile("user-2")
+    third = asyncio.run(spending_profile_service.get_spending_profile("user-2"))
+    assert third["total_spending"] == 2
+
+def test_kmeans_separates_spending_mixes():
+    import numpy as np
+    from app.services.tip_cohort_service import kmeans
+
+    rng = np.random.default_rng(1)
+    groceries = rng.normal([0.8, 0.1, 0.1], 0.03, size=(50, 3))
+    transport = rng.normal([0.1, 0.1, 0.8], 0.03, size=(50, 3))
+    centroids, labels = kmeans(np.vstack([groceries, transport]), k=2)
+
+    assert len(set(labels[:50])) == 1 and len(set(labels[50:])) == 1
+    assert labels[0] != labels[50]
+    assert np.allclose(sorted(centroids[:, 0]), [0.1, 0.8], atol=0.05)
+
+def test_personalized_tips_served_from_cohort_without_llm(monkeypatch):
+    async def fake_cohort_tips(user_id):
+        return [{"title": "Batch cook", "content": "Cook on Sundays.", "category": "Food & Dining"}]
+
+    async def fake_general_tips(category, limit, user_id=None):
+        return [{"title": f"General {index}", "content": "..."} for index in range(limit)]
+
+    async def no_llm(*args, **kwargs):
+        raise AssertionError("the LLM should not be called without refresh")
+
+    monkeypatch.setattr(tip_service, "get_cohort_tips", fake_cohort_tips)
+    monkeypatch.setattr(tip_service, "get_general_tips", fake_general_tips)
+    monkeypatch.setattr(tip_service, "generate_personalized_tips", no_llm)
+
+    tips = asyncio.run(tip_service.get_personalized_tips("user-3", None, 3))
+    assert [tip["title"] for tip in tips] == ["Batch cook", "General 0", "General 1"]
+
+def test_tips_ranked_by_spending_profile():
+    from app.services import tip_ranking_service as ranking
+
+    tips = [
+        {"title": "Compare fuel prices", "content": "Fill up at the cheapest station on your commute.", "category": "Transportation", "tags": ["fuel"]},
+        {"title": "Plan weekly meals", "content": "Plan dinners before shopping so groceries don't go to waste.", "category": "Food & Dining", "tags": ["groceries"]},
+        {"title": "Cancel unused apps", "content": "Review subscriptions every month.", "category": "Bills & Utilities", "tags": ["subscriptions"]}
+    ]
+    vectors = [ranking.build_tip_vector(tip, {}, 1.0) for tip in tips]
+    for tip, vector in zip(tips, vectors):
+        tip["vector"] = vector
+
+    import numpy as np
+    columns = np.unique([index for vector in vectors for index in vector["indices"]])
+    matrix = np.zeros((len(tips), len(columns)), dtype=np.float32)
+    for row, vector in enumerate(vectors):
+        matrix[row, np.searchsorted(columns, vector["indices"])] = vector["values"]
+
+    profile = {"spending_by_category": {"Food & Dining": 400.0, "Transportation": 50.0}}
+    ranked = ranking.rank_tips(tips, matrix, columns, ranking.build_profile_vector(profile))
+    assert [tip["title"] for tip in ranked] == ["Plan weekly meals", "Compare fuel prices", "Cancel unused apps"]
+
+def test_near_duplicate_tips_are_merged(fake_db, monkeypatch):
+    tips = fake_db.collection("tips")
+
+    async def fake_analyze(user_id):
+        return {}
+
+    batches = iter([
+        [{"title": "Plan weekly meals", "content": "Plan your meals for the week before grocery shopping to avoid food waste."}],
+        [{"title": "Plan meals for the week", "content": "Plan your meals for the whole week before grocery shopping to avoid waste."},
+         {"title": "Cancel subscriptions", "content": "Cancel streaming subscriptions you no longer watch."}]
+    ])
+
+    async def fake_generate(user_id, patterns, category, count):
+        return next(batches)
+
+    monkeypatch.setattr(tip_service, "analyze_user_spending", fake_analyze)
+    monkeypatch.setattr(tip_service, "generate_personalized_tips", fake_generate)
+
+    asyncio.run(tip_service.get_personalized_tips("user-4", None, 1, refresh=True))
+    second = asyncio.run(tip_service.get_personalized_tips("user-4", None, 2, refresh=True))
+
+    # The paraphrase is answered with the stored tip instead of being inserted again
+    assert [tip["title"] for tip in tips.docs] == ["Plan weekly meals", "Cancel subscriptions"]
+    assert [tip["title"] for tip in second] == ["Plan weekly meals", "Cancel subscriptions"]
+
+def test_effectiveness_scores_favor_proven_tips():
+    from app.services.tip_effectiveness_service import effectiveness_scores
+
+    categories = {"Groceries": {"reports": 20, "implemented": 10, "savings": 200.0}}
+    tips = [
+        {"category": "Groceries"},
+        {"category": "Groceries", "effectiveness": {"reports": 1, "implemented": 1, "savings": 30.0}},
+        {"category": "Groceries", "effectiveness": {"reports": 30, "implemented": 27, "savings": 810.0}},
+        {"category": "Groceries", "effectiveness": {"reports": 30, "implemented": 3, "savings": 15.0}}
+    ]
+    scores = effectiveness_scores(tips, categories)
+
+    # One lucky report moves a tip only a little away from its category's record
+    assert scores[2] > scores[1] > scores[0] > scores[3]
+    assert all(0 <= score <= 1 for score in scores)
+
+def test_tip_pool_refill_caps_generations_per_run(fake_db, monkeypatch):
+    pool = fake_db.collection("tips")
+    requested = []
+
+    async def fake_names(min_users=1):
+        requested.append(min_users)
+        return ["Food & Dining", "Shopping", "Pet Care"]
+
+    async def fake_generate(category, count, fallback=True):
+        return [{"title": f"{category} tip", "content": "Save."}]
+
+    async def keep_all(docs, scope):
+        return docs, []
+
+    monkeypatch.setattr(category_service, "get_known_category_names", fake_names)
+    monkeypatch.setattr(tip_service, "generate_general_tips", fake_generate)
+    monkeypatch.setattr(tip_service, "filter_new_tips", keep_all)
+    monkeypatch.setattr(tip_service.settings, "TIP_POOL_MIN_CATEGORY_USERS", 4)
+    monkeypatch.setattr(tip_service.settings, "TIP_POOL_MAX_GENERATIONS_PER_RUN", 2)
+
+    asyncio.run(tip_service.refill_tip_pool())
+    assert requested == [4]
+    assert [tip["category"] for tip in pool.docs] == ["Food & Dining", "Shopping"]
+
+def test_concurrent_first_report_is_retried_as_an_update(fake_db):
+    from bson import ObjectId
+    from pymongo.errors import DuplicateKeyError
+
+    tip_id = ObjectId()
+    # The concurrent report was counted by its own request
+    fake_db.collection("tips", [{"_id": tip_id, "category": "Groceries", "effectiveness": {"reports": 1, "implemented": 0, "savings": 0.0}}])
+    reports = fake_db.collection("tip_effectiveness")
+    upsert = reports.find_one_and_update
+
+    async def racing_upsert(query, update, **kwargs):
+        if not reports.docs:
+            reports.docs.append({"_id": ObjectId(), **query, "implemented": False, "savings": 0.0, "category": "Groceries"})
+            raise DuplicateKeyError("E11000 duplicate key error", code=11000)
+        return await upsert(query, update, **kwargs)
+
+    reports.find_one_and_update = racing_upsert
+    rollup = asyncio.run(tip_effectiveness_service.record_tip_effectiveness("u1", str(tip_id), True, 12.5))
+
+    assert len(reports.docs) == 1 and reports.docs[0]["implemented"] is True
+    assert (rollup["reports"], rollup["implemented"]) == (1, 1)
+    assert fake_db.tip_category_effectiveness.docs[0]["savings"] == 12.5
+
+def test_cohort_tip_reports_roll_up_per_tip(fake_db):
+    from bson import ObjectId
+
+    tip_id = ObjectId()
+    fake_db.collection("tip_cohorts", [{"_id": ObjectId(), "tips": [
+        {"_id": ObjectId(), "title": "Other", "category": "Shopping"},
+        {"_id": tip_id, "title": "Meal prep", "category": "Food & Dining"}
+    ]}])
+
+    async def run():
+        await tip_effectiveness_service.record_tip_effectiveness("u1", str(tip_id), True, 20.0)
+        await tip_effectiveness_service.record_tip_effectiveness("u2", str(tip_id), False)
+        return await tip_effectiveness_service.get_tip_effectiveness(str(tip_id))
+
+    rollup = asyncio.run(run())
+    assert (rollup["reports"], rollup["implemented"], rollup["total_savings"]) == (2, 1, 20.0)
+    other, tip = fake_db.tip_cohorts.docs[0]["tips"]
+    assert "effectiveness" not in other and tip["effectiveness"]["reports"] == 2
+
+def test_indexes_dedupe_reports_and_backfill_earlier_ones(fake_db):
+    from datetime import datetime
+    from bson import ObjectId
+
+    def _latest(pipeline, docs):
+        # The dedupe pipeline: reports grouped by user and tip, newest first, where there is more than one
+        groups = {}
+        for doc in sorted(docs, key=lambda doc: doc["date"], reverse=True):
+            groups.setdefault((doc["user_id"], doc["tip_id"]), []).append(dict(doc))
+        return [{"_id": key, "reports": reports, "count": len(reports)} for key, reports in groups.items() if len(reports) > 1]
+
+    tip_id = ObjectId()
+    fake_db.collection("tips", [{"_id": tip_id, "category": "Shopping",
+                                 "effectiveness": {"reports": 1, "implemented": 1, "savings": 5.0}}])
+    fake_db.collection("tip_category_effectiveness", [{"category": "Shopping", "reports": 1, "implemented": 1, "savings": 5.0}])
+    reports = fake_db.collection("tip_effectiveness", [
+        # Rolled up by an earlier report, then superseded by a later duplicate from before the rollups
+        {"user_id": "u1", "tip_id": str(tip_id), "implemented": True, "savings": 5.0, "category": "Shopping", "date": datetime(2024, 1, 1)},
+        {"user_id": "u1", "tip_id": str(tip_id), "implemented": True, "savings": 8.0, "date": datetime(2024, 2, 1)},
+        {"user_id": "u2", "tip_id": str(tip_id), "implemented": False, "savings": 3.0, "date": datetime(2024, 1, 5)}
+    ], aggregate=_latest)
+
+    async def run():
+        await tip_effectiveness_service.ensure_tip_effectiveness_indexes()
+        # A second start finds nothing left to fold in
+        await tip_effectiveness_service.ensure_tip_effectiveness_indexes()
+
+    asyncio.run(run())
+    assert reports.indexes["user_id_1_tip_id_1"] == {"unique": True}
+    assert sorted(report["savings"] for report in reports.docs) == [3.0, 8.0]
+    assert all(report["category"] == "Shopping" for report in reports.docs)
+    assert fake_db.tips.docs[0]["effectiveness"] == {"reports": 2, "implemented": 1, "savings": 8.0}
+    category = fake_db.tip_category_effectiveness.docs[0]
+    assert (category["reports"], category["implemented"], category["savings"]) == (2, 1, 8.0)
+
+def test_fallback_tips_cover_the_system_categories():
+    for name in category_service.DEFAULT_CATEGORY_NAMES:
+        tips = tip_service.generate_fallback_tips(name, count=10)
+        assert tips and all(tip["category"] == name for tip in tips)
@@ -0,0 +1,48 @@
+import asyncio
+from datetime import datetime
+
+from app.services import user_service
+
+
+def _duplicates(pipeline, docs):
+    # The dedupe pipeline: profiles grouped by firebase_uid, oldest first, where there is more than one
+    groups = {}
+    for doc in sorted(docs, key=lambda doc: doc["updated_at"]):
+        groups.setdefault(doc["firebase_uid"], []).append(dict(doc))
+    return [{"_id": uid, "profiles": profiles, "count": len(profiles)} for uid, profiles in groups.items() if len(profiles) > 1]
+
+
+def test_profile_upsert_stores_email_on_insert_only(fake_db, monkeypatch):
+    profiles = fake_db.collection("user_profiles")
+    lookups = []
+
+    def fake_lookup(uid):
+        lookups.append(uid)
+        return f"{uid}@example.com"
+
+    monkeypatch.setattr(user_service, "_lookup_email", fake_lookup)
+
+    async def run():
+        created = await user_service.update_user_profile("u1", {"display_name": "Ann"}, upsert=True)
+        updated = await user_service.update_user_profile("u1", {"display_name": "Anne"}, upsert=True)
+        return created, updated
+
+    created, updated = asyncio.run(run())
+    assert created["email"] == updated["email"] == "u1@example.com"
+    assert updated["display_name"] == "Anne" and len(profiles.docs) == 1
+    # Looked up once, when the profile was created
+    assert lookups == ["u1"]
+
+
+def test_duplicate_profiles_are_merged_before_indexing(fake_db):
+    profiles = fake_db.collection("user_profiles", [
+        {"firebase_uid": "u1", "email": "old@example.com", "phone": "555", "updated_at": datetime(2024, 1, 1)},
+        {"firebase_uid": "u1", "email": "new@example.com", "phone": None, "updated_at": datetime(2024, 6, 1)},
+        {"firebase_uid": "u2", "email": "u2@example.com", "updated_at": datetime(2024, 1, 1)}
+    ], aggregate=_duplicates)
+
+    asyncio.run(user_service.ensure_user_indexes())
+    assert profiles.indexes["firebase_uid_1"] == {"unique": True}
+    merged = next(doc for doc in profiles.docs if doc["firebase_uid"] == "u1")
+    assert len(profiles.docs) == 2
+    assert merged["email"] == "new@example.com" and merged["phone"] == "555"
@@ -0,0 +1,141 @@
+# app/utils/fakes.py
+"""
+Local stand-ins for Gemini and Firebase, used for development, tests and
+benchmarks. Enable them with LLM_BACKEND=fake and AUTH_BACKEND=fake.
+"""
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional
+
+FAKE_TOKEN_PREFIX = "fake:"
+
+FAKE_RECEIPT = {
+    "store_name": "Fake Mart",
+    "date": "2024-01-15",
+    "total_amount": 12.47,
+    "items": [
+        {"name": "Milk", "price": 3.49, "quantity": 1, "category": "groceries"},
+        {"name": "Bread", "price": 2.99, "quantity": 1, "category": "groceries"},
+        {"name": "Coffee", "price": 5.99, "quantity": 1, "category": "groceries"}
+    ]
+}
+
+FAKE_TIPS = [
+    {
+        "title": "Cook Double Portions",
+        "content": "Cook twice the amount for dinner and pack the leftovers for lunch. It avoids paying for takeaway during the week.",
+        "category": "Food & Dining",
+        "tags": ["meal prep", "lunch"]
+    },
+    {
+        "title": "Review Subscriptions Monthly",
+        "content": "List every recurring charge once a month and cancel anything unused. Small subscriptions add up quickly.",
+        "category": "Bills & Utilities",
+        "tags": ["subscriptions", "audit"]
+    },
+    {
+        "title": "Use Public Transport Passes",
+        "content": "A monthly pass is usually cheaper than paying per trip if you commute most days.",
+        "category": "Transportation",
+        "tags": ["commute", "passes"]
+    }
+]
+
+class FakeGenerativeModel:
+    """
+    Drop-in replacement for genai.GenerativeModel.
+
+    Responses are canned per prompt type. Latency, generic errors and 429/503
+    errors are injected at the configured rates, with messages matching what
+    the real SDK raises so retry logic is exercised.
+    """
+
+    def __init__(self, model_name: str, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, overloaded_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.model_name = model_name
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.overloaded_rate = overloaded_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def generate_content(self, contents: Any, stream: bool = False, **kwargs):
+        self.calls += 1
+        self._sleep()
+        self._maybe_fail()
+
+        prompt = contents if isinstance(contents, str) else " ".join(
+            part for part in contents if isinstance(part, str)
+        )
+        text = self._respond(prompt)
+        usage = SimpleNamespace(
+            prompt_token_count=max(1, len(prompt) // 4),
+            candidates_token_count=max(1, len(text) // 4),
+            total_token_count=max(1, len(prompt) // 4) + max(1, len(text) // 4)
+        )
+        if stream:
+            return self._stream(text, usage)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def _sleep(self):
+        delay = self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _maybe_fail(self):
+        roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            raise Exception("429 Resource has been exhausted (e.g. check quota). rate limit exceeded")
+        roll -= self.rate_limit_rate
+        if roll < self.overloaded_rate:
+            raise Exception("503 The model is overloaded. Please try again later.")
+        roll -= self.overloaded_rate
+        if roll < self.error_rate:
+            raise Exception("500 An internal error has occurred.")
+
+    def _stream(self, text: str, usage) -> Iterator[SimpleNamespace]:
+        chunk_size = 24
+        for start in range(0, len(text), chunk_size):
+            yield SimpleNamespace(text=text[start:start + chunk_size], usage_metadata=usage)
+
+    def _respond(self, prompt: str) -> str:
+        lowered = prompt.lower()
+        if "numbered items" in lowered:
+            # Categorization batch: answer "N: Category" with the first offered category
+            categories = re.findall(r"^\s*- (.+)$", prompt, re.MULTILINE)
+            numbers = re.findall(r"^\s*(\d+)\. ", prompt, re.MULTILINE)
+            category = categories[0].strip() if categories else "Miscellaneous"
+            return "\n".join(f"{number}: {category}" for number in numbers)
+        if "receipt" in lowered and ("extract" in lowered or "analyze" in lowered):
+            return "```json\n" + json.dumps(FAKE_RECEIPT, indent=2) + "\n```"
+        if "tips" in lowered:
+            count_match = re.search(r"generate (\d+)", lowered)
+            count = int(count_match.group(1)) if count_match else len(FAKE_TIPS)
+            tips = [FAKE_TIPS[index % len(FAKE_TIPS)] for index in range(count)]
+            return json.dumps(tips)
+        return "Set a weekly spending limit for your largest category and check it every Sunday."
+
+def fake_verify_id_token(token: str) -> Dict[str, Any]:
+    """
+    Accept tokens of the form "fake:<uid>" and return a decoded token like Firebase does.
+
+    Raises:
+        ValueError: If the token is not a fake token
+    """
+    if not token or not token.startswith(FAKE_TOKEN_PREFIX) or len(token) == len(FAKE_TOKEN_PREFIX):
+        raise ValueError("Invalid fake token; expected 'fake:<uid>'")
+    uid = token[len(FAKE_TOKEN_PREFIX):]
+    return {"uid": uid, "email": f"{uid}@example.com", "name": uid}
+
+def fake_get_user(uid: str) -> SimpleNamespace:
+    # Mirrors the attributes of firebase_admin.auth.UserRecord used by the app
+    return SimpleNamespace(uid=uid, email=f"{uid}@example.com", display_name=uid)
+
+def make_fake_tokens(count: int, prefix: str = "bench-user") -> List[str]:
+    return [f"{FAKE_TOKEN_PREFIX}{prefix}-{index}" for index in range(count)]
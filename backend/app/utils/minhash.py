@@ -0,0 +1,52 @@
+# app/utils/minhash.py
+import hashlib
+import zlib
+from typing import Iterable, List, Sequence
+import numpy as np
+
+# Mersenne prime for the universal hash family h(x) = (a * x + b) mod p
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+class MinHasher:
+    """
+    MinHash signatures and LSH band keys for estimating Jaccard similarity
+    between sets of shingles.
+
+    With num_perm = bands * rows, two sets with Jaccard similarity s share at
+    least one band with probability 1 - (1 - s^rows)^bands.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        # a, b and x are all below 2^32, so a * x + b fits in uint64 without overflow
+        self._a = rng.integers(1, _MAX_HASH, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MAX_HASH, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles: Iterable[str]) -> List[int]:
+        hashes = np.fromiter({zlib.crc32(shingle.encode("utf-8")) for shingle in shingles}, dtype=np.uint64)
+        if not len(hashes):
+            return [_MAX_HASH] * self.num_perm
+        # (num_perm, shingles) matrix of permuted hashes, minimum along each row
+        permuted = ((np.outer(self._a, hashes) + self._b[:, None]) % np.uint64(_PRIME)) & np.uint64(_MAX_HASH)
+        return [int(value) for value in permuted.min(axis=1)]
+
+    def band_keys(self, signature: Sequence[int]) -> List[str]:
+        # One key per band; sets that agree on every row of any band become candidates
+        keys = []
+        for band in range(self.bands):
+            rows = signature[band * self.rows:(band + 1) * self.rows]
+            digest = hashlib.blake2b(",".join(map(str, rows)).encode("ascii"), digest_size=8).hexdigest()
+            keys.append(f"{band}:{digest}")
+        return keys
+
+def estimate_similarity(first: Sequence[int], second: Sequence[int]) -> float:
+    # Fraction of matching MinHash values estimates the Jaccard similarity
+    if not first or len(first) != len(second):
+        return 0.0
+    return float(np.mean(np.asarray(first) == np.asarray(second)))
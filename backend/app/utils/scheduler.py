@@ -0,0 +1,73 @@
+# app/utils/scheduler.py
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+from app.utils.metrics import metrics
+
+class _Job:
+    def __init__(self, name: str, func: Callable[[], Awaitable], interval_seconds: float, initial_delay: float):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.initial_delay = initial_delay
+        self.task: Optional[asyncio.Task] = None
+
+class Scheduler:
+    """
+    Runs async jobs periodically on the app's event loop.
+
+    Jobs are registered at startup and cancelled at shutdown. A failing run is
+    logged and retried at the next interval; runs of the same job never overlap.
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, _Job] = {}
+
+    def add_job(self, name: str, func: Callable[[], Awaitable], interval_seconds: float, initial_delay: float = 0):
+        if name in self._jobs:
+            raise ValueError(f"Job already registered: {name}")
+        self._jobs[name] = _Job(name, func, interval_seconds, initial_delay)
+
+    async def run_job(self, name: str):
+        # Run a job once, recording its duration and outcome
+        job = self._jobs[name]
+        started = time.perf_counter()
+        try:
+            await job.func()
+            metrics.increment("scheduler_runs_total", job=name, outcome="ok")
+        except Exception as e:
+            print(f"Error running background job {name}: {str(e)}")
+            metrics.increment("scheduler_runs_total", job=name, outcome="error")
+        metrics.observe("scheduler_run_ms", (time.perf_counter() - started) * 1000, job=name)
+
+    async def _loop(self, job: _Job):
+        if job.initial_delay:
+            await asyncio.sleep(job.initial_delay)
+        while True:
+            await self.run_job(job.name)
+            await asyncio.sleep(job.interval_seconds)
+
+    def start(self):
+        for job in self._jobs.values():
+            if job.task is None or job.task.done():
+                job.task = asyncio.create_task(self._loop(job))
+
+    async def stop(self):
+        tasks = [job.task for job in self._jobs.values() if job.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for job in self._jobs.values():
+            job.task = None
+
+def seconds_until_hour(hour: int) -> float:
+    """Seconds from now until the next occurrence of `hour`:00 UTC, for nightly jobs."""
+    now = datetime.utcnow()
+    next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+# Global instance
+scheduler = Scheduler()
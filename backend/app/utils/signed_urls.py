@@ -0,0 +1,30 @@
+# app/utils/signed_urls.py
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Optional
+from app.config.settings import settings
+
+# Without a configured key, signatures only verify in the process that made them
+_fallback_key = secrets.token_bytes(32)
+
+def _key() -> bytes:
+    return settings.URL_SIGNING_KEY.encode("utf-8") if settings.URL_SIGNING_KEY else _fallback_key
+
+def _signature(path: str, expires: int) -> str:
+    return hmac.new(_key(), f"{path}:{expires}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+def sign_path(path: str, ttl_seconds: int) -> str:
+    """
+    Append an expiry and HMAC signature to a URL path, so it can be loaded
+    without an Authorization header (e.g. from an <img src>) until it expires.
+    """
+    expires = int(time.time()) + ttl_seconds
+    return f"{path}?expires={expires}&signature={_signature(path, expires)}"
+
+def verify_path(path: str, expires: Optional[int], signature: Optional[str]) -> bool:
+    """Check a signature made by sign_path for `path` and that it hasn't expired."""
+    if expires is None or not signature or expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(path, expires), signature)
@@ -0,0 +1,7 @@
+# app/utils/sse.py
+import json
+from typing import Any
+
+def format_sse(event: str, data: Any) -> str:
+    # One Server-Sent Event with a JSON payload
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,20 @@
+# app/utils/static_files.py
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles for content-addressed files, whose URL changes whenever the
+    content does. Responses (including 304s) tell clients and CDNs to keep
+    them for max_age seconds without revalidating; ETag and Last-Modified
+    are still sent by StaticFiles for clients that do revalidate.
+    """
+
+    def __init__(self, *args, max_age: int = 31536000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}, immutable"
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = self.cache_control
+        return response
@@ -0,0 +1,129 @@
+# app/utils/uploads.py
+import base64
+import binascii
+from typing import Iterable, Optional, Tuple
+from fastapi import HTTPException, Request, UploadFile, status
+
+CHUNK_SIZE = 64 * 1024
+SNIFF_BYTES = 32
+
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp", "image/heic", "image/heif"}
+
+# Receipt scans go to Gemini, which doesn't read GIFs
+SCAN_IMAGE_TYPES = IMAGE_TYPES - {"image/gif"}
+
+TYPE_NAMES = {
+    "image/jpeg": "JPEG",
+    "image/png": "PNG",
+    "image/gif": "GIF",
+    "image/webp": "WebP",
+    "image/heic": "HEIC",
+    "image/heif": "HEIF"
+}
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """
+    Detect an image's MIME type from its magic bytes.
+
+    Args:
+        header: At least the first 12 bytes of the file
+
+    Returns:
+        MIME type, or None if the bytes are not a supported image
+    """
+    header = bytes(header[:SNIFF_BYTES])
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+    return None
+
+def decode_data_url(value: Optional[str]) -> Optional[bytes]:
+    """Bytes of a "data:...;base64," URL (as older clients stored images), or None for anything else."""
+    if not value or not value.startswith("data:") or ";base64," not in value:
+        return None
+    try:
+        return base64.b64decode(value.split(";base64,", 1)[1], validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File size must be less than {max_bytes / (1024 * 1024):g}MB"
+    )
+
+def _check_image_type(buffer: bytearray, allowed_types: Iterable[str]) -> str:
+    mime_type = sniff_image_type(buffer)
+    if mime_type not in allowed_types:
+        names = [name for type_, name in TYPE_NAMES.items() if type_ in allowed_types]
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"File must be a {', '.join(names[:-1])} or {names[-1]} image"
+        )
+    return mime_type
+
+async def _collect(chunks, max_bytes: int, allowed_types: Iterable[str]) -> Tuple[memoryview, str]:
+    # Accumulate chunks, enforcing the size limit and sniffing the type as bytes arrive
+    buffer = bytearray()
+    mime_type = None
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            raise _too_large(max_bytes)
+        if mime_type is None and len(buffer) >= SNIFF_BYTES:
+            mime_type = _check_image_type(buffer, allowed_types)
+
+    if mime_type is None:
+        mime_type = _check_image_type(buffer, allowed_types)
+    return memoryview(buffer), mime_type
+
+async def read_image_upload(file: UploadFile, max_bytes: int,
+                            allowed_types: Iterable[str] = IMAGE_TYPES) -> Tuple[memoryview, str]:
+    """
+    Read a multipart image upload in chunks without buffering it twice.
+
+    Args:
+        file: Uploaded file
+        max_bytes: Maximum accepted size; larger uploads are rejected with 413
+        allowed_types: Accepted MIME types, checked against the file's magic bytes
+
+    Returns:
+        Tuple of (image bytes as a memoryview, sniffed MIME type)
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    async def chunks():
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    return await _collect(chunks(), max_bytes, allowed_types)
+
+async def read_image_body(request: Request, max_bytes: int,
+                          allowed_types: Iterable[str] = IMAGE_TYPES) -> Tuple[memoryview, str]:
+    """
+    Stream a raw binary image request body, rejecting oversized bodies from the
+    Content-Length header before reading anything.
+
+    Returns:
+        Tuple of (image bytes as a memoryview, sniffed MIME type)
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise _too_large(max_bytes)
+
+    return await _collect(request.stream(), max_bytes, allowed_types)
@@ -0,0 +1,184 @@
+"""
+End-to-end latency benchmark for the scan, tips and receipt endpoints.
+
+Start the API against the local stand-ins and a local mongod first:
+
+    cd backend
+    AUTH_BACKEND=fake LLM_BACKEND=fake FAKE_LLM_LATENCY_MS=300 \\
+    MONGODB_URI=mongodb://localhost:27017 MONGODB_DB_NAME=budget_tracker_bench \\
+    uvicorn app.main:app --port 8000
+
+Then run, for example:
+
+    python scripts/benchmark.py --concurrency 20 --requests 200 --scenarios scan_receipt,tips,receipts
+"""
+import argparse
+import asyncio
+import io
+import json
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List
+import aiohttp
+from PIL import Image, ImageDraw
+
+RECEIPT_TEXT = """FAKE MART
+Store #12
+2024-01-15
+MILK 3.49
+BREAD 2.99
+2 x COFFEE 11.98
+SUBTOTAL 18.46
+TAX 0.92
+TOTAL 19.38
+"""
+
+def make_receipt_image(lines: int = 20) -> bytes:
+    # Synthetic receipt so the benchmark doesn't depend on fixtures
+    image = Image.new("RGB", (400, 40 + lines * 24), "white")
+    draw = ImageDraw.Draw(image)
+    for index in range(lines):
+        draw.text((20, 20 + index * 24), f"ITEM {index:02d} ............ {index + 1}.99", fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+class Scenario:
+    def __init__(self, session: aiohttp.ClientSession, base_url: str, image: bytes):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.image = image
+
+    async def _check(self, response: aiohttp.ClientResponse):
+        body = await response.read()
+        if response.status >= 400:
+            raise RuntimeError(f"{response.status}: {body[:200]!r}")
+        return json.loads(body) if body else None
+
+    async def scan_receipt(self, headers: Dict[str, str]):
+        form = aiohttp.FormData()
+        form.add_field("file", self.image, filename="receipt.jpg", content_type="image/jpeg")
+        async with self.session.post(f"{self.base_url}/api/scan/receipt", data=form, headers=headers) as response:
+            await self._check(response)
+
+    async def scan_binary(self, headers: Dict[str, str]):
+        async with self.session.post(f"{self.base_url}/api/scan/receipt-binary", data=self.image,
+                                     headers={**headers, "Content-Type": "image/jpeg"}) as response:
+            await self._check(response)
+
+    async def scan_text(self, headers: Dict[str, str]):
+        async with self.session.post(f"{self.base_url}/api/scan/text", params={"text": RECEIPT_TEXT},
+                                     headers=headers) as response:
+            await self._check(response)
+
+    async def tips(self, headers: Dict[str, str]):
+        async with self.session.get(f"{self.base_url}/api/tips/", params={"limit": 5}, headers=headers) as response:
+            await self._check(response)
+
+    async def receipts(self, headers: Dict[str, str]):
+        # Full CRUD cycle: create, read, update, delete
+        payload = {
+            "date": "2024-01-15T00:00:00",
+            "total_amount": 6.48,
+            "store_name": "Bench Store",
+            "items": [{"name": "Milk", "price": 3.49, "quantity": 1, "category": "groceries"},
+                      {"name": "Bread", "price": 2.99, "quantity": 1, "category": "groceries"}],
+            "image_url": ""
+        }
+        async with self.session.post(f"{self.base_url}/api/receipts/", json=payload, headers=headers) as response:
+            receipt = await self._check(response)
+        url = f"{self.base_url}/api/receipts/{receipt['id']}"
+        async with self.session.get(url, headers=headers) as response:
+            await self._check(response)
+        async with self.session.put(url, json={"store_name": "Bench Store 2"}, headers=headers) as response:
+            await self._check(response)
+        async with self.session.delete(url, headers=headers) as response:
+            await self._check(response)
+
+async def run_scenario(name: str, call: Callable[[Dict[str, str]], Awaitable[None]],
+                       total: int, concurrency: int, users: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors: List[str] = []
+    queue: asyncio.Queue = asyncio.Queue()
+    for index in range(total):
+        queue.put_nowait(index)
+
+    async def worker():
+        while True:
+            try:
+                index = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            headers = {"Authorization": f"Bearer fake:bench-user-{index % users}"}
+            started = time.perf_counter()
+            try:
+                await call(headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+            except Exception as e:
+                errors.append(str(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    return {
+        "scenario": name,
+        "requests": total,
+        "errors": len(errors),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "first_error": errors[0] if errors else None
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark BudgetTracker API endpoints")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=100, help="Requests per scenario")
+    parser.add_argument("--users", type=int, default=10, help="Distinct fake users to spread requests over")
+    parser.add_argument("--scenarios", default="scan_receipt,scan_text,tips,receipts",
+                        help="Comma separated: scan_receipt, scan_binary, scan_text, tips, receipts")
+    parser.add_argument("--image", help="Receipt image to upload (defaults to a synthetic one)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as image_file:
+            image = image_file.read()
+    else:
+        image = make_receipt_image()
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        scenario = Scenario(session, args.base_url, image)
+        results = []
+        for name in [name.strip() for name in args.scenarios.split(",") if name.strip()]:
+            call = getattr(scenario, name, None)
+            if call is None:
+                raise SystemExit(f"Unknown scenario: {name}")
+            results.append(await run_scenario(name, call, args.requests, args.concurrency, args.users))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'scenario':<14}{'reqs':>6}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for result in results:
+        print(f"{result['scenario']:<14}{result['requests']:>6}{result['errors']:>8}{result['throughput_rps']:>9}"
+              f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}")
+        if result["first_error"]:
+            print(f"  first error: {result['first_error']}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
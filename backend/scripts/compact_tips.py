@@ -0,0 +1,40 @@
+"""
+Collapse near-duplicate tips that were stored before duplicate suppression
+existed, and backfill their MinHash signatures.
+
+Uses the same MONGODB_URI / MONGODB_DB_NAME settings as the API:
+
+    cd backend
+    python scripts/compact_tips.py --dry-run
+    python scripts/compact_tips.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.mongodb import close_mongo_connection, connect_to_mongo
+from app.services.tip_dedup_service import compact_tips
+from app.services.tip_ranking_service import reindex_tip_vectors
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        result = await compact_tips(dry_run=args.dry_run)
+        print(f"Scanned {result['scanned']} tips: {result['backfilled']} signatures backfilled, "
+              f"{result['removed']} near-duplicates {'would be ' if args.dry_run else ''}removed")
+        if result["removed"] and not args.dry_run:
+            # IDF weights depend on the pool contents
+            indexed = await reindex_tip_vectors()
+            print(f"Reindexed {indexed} general tips")
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
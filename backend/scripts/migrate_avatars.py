@@ -0,0 +1,37 @@
+"""
+Move avatars stored inline on user profiles as base64 data URLs into the
+content-addressed avatar store under static/avatars, keeping only their URLs
+on the profile.
+
+Uses the same MONGODB_URI / MONGODB_DB_NAME settings as the API. Run it from
+the directory the API serves /static from:
+
+    cd backend
+    python scripts/migrate_avatars.py --dry-run
+    python scripts/migrate_avatars.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.mongodb import close_mongo_connection, connect_to_mongo
+from app.services.avatar_service import migrate_inline_avatars
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    await connect_to_mongo()
+    try:
+        result = await migrate_inline_avatars(dry_run=args.dry_run)
+        print(f"Scanned {result['scanned']} inline avatars: {result['migrated']} "
+              f"{'would be ' if args.dry_run else ''}migrated, {result['failed']} unreadable")
+    finally:
+        await close_mongo_connection()
+
+if __name__ == "__main__":
+    asyncio.run(main())
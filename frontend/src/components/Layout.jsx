@@ -168,8 +168,12 @@ const Layout = () => {
                   className="flex items-center space-x-2 focus:outline-none"
                 >
                   {(() => {
-                    const avatarUrl = userProfile?.avatar
-                      ? getAvatarUrl(userProfile.avatar)
+                    // The small thumbnail is enough for the 32px header avatar
+                    const avatarPath =
+                      userProfile?.avatar_thumbnails?.["64"] ||
+                      userProfile?.avatar;
+                    const avatarUrl = avatarPath
+                      ? getAvatarUrl(avatarPath)
                       : null;
                     return avatarUrl ? (
                       <img
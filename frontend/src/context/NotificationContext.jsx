@@ -2,6 +2,8 @@ import React, { createContext, useState, useEffect, useContext } from "react";
 import { useAuth } from "./AuthContext";
 import apiService from "../services/apiService";
 
+const API_URL = import.meta.env.VITE_API_URL || "http://localhost:8000/api";
+
 const NotificationContext = createContext();
 
 export function NotificationProvider({ children }) {
@@ -97,18 +99,77 @@ export function NotificationProvider({ children }) {
     }
   };
 
+  // Listen for new notifications over Server-Sent Events
+  const streamNotifications = async (signal) => {
+    let retryMs = 3000;
+    while (!signal.aborted) {
+      try {
+        const token = await currentUser.getIdToken();
+        const response = await fetch(`${API_URL}/notifications/stream`, {
+          headers: { Authorization: `Bearer ${token}` },
+          signal,
+        });
+        if (!response.ok) throw new Error(`Stream failed: ${response.status}`);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+          const { done, value } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true });
+
+          // Events are separated by a blank line
+          let boundary;
+          while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = "message";
+            let data = "";
+            for (const line of block.split("\n")) {
+              if (line.startsWith("event: ")) event = line.slice(7);
+              else if (line.startsWith("data: ")) data += line.slice(6);
+              else if (line.startsWith("retry: ")) retryMs = Number(line.slice(7)) || retryMs;
+            }
+            if (!data) continue;
+            const payload = JSON.parse(data);
+
+            if (event === "notification") {
+              setNotifications((prev) => [payload, ...prev]);
+              if (!payload.is_read) setUnreadCount((prev) => prev + 1);
+            } else if (event === "notification_updated") {
+              // A digest absorbed another notification; it's still one unread item
+              setNotifications((prev) => [payload, ...prev.filter((n) => n.id !== payload.id)]);
+            } else if (event === "unread_count") {
+              setUnreadCount(payload.count);
+            } else if (event === "resync") {
+              // Some events were dropped; reload the list
+              setUnreadCount(payload.count);
+              fetchNotifications();
+            }
+          }
+        }
+      } catch (error) {
+        if (signal.aborted) return;
+        console.error("Notification stream error:", error);
+        // Keep the count fresh while the stream is unavailable
+        fetchUnreadCount();
+      }
+      await new Promise((resolve) => setTimeout(resolve, retryMs));
+    }
+  };
+
   // Refresh notifications on user change
   useEffect(() => {
     if (currentUser) {
       fetchNotifications();
-      fetchUnreadCount();
 
-      // Set up polling for new notifications
-      const interval = setInterval(() => {
-        fetchUnreadCount();
-      }, 30000); // Check every 30 seconds
+      // New notifications are pushed by the server instead of polled
+      const controller = new AbortController();
+      streamNotifications(controller.signal);
 
-      return () => clearInterval(interval);
+      return () => controller.abort();
     } else {
       setNotifications([]);
       setUnreadCount(0);
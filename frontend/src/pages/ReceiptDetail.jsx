@@ -149,6 +149,11 @@ const ReceiptDetail = () => {
     );
   }
 
+  // Stored images come back as a signed "/api/..." path; resolve it against the API host
+  const receiptImageUrl = receipt.image_url?.startsWith("/api/")
+    ? `${import.meta.env.VITE_API_URL.replace(/\/api$/, "")}${receipt.image_url}`
+    : receipt.image_url;
+
   return (
     <div className="container mx-auto px-4 py-6">
       {/* Header with back button */}
@@ -292,14 +297,14 @@ const ReceiptDetail = () => {
           </div>
         </div>
 
-        {receipt.imageUrl && (
+        {receiptImageUrl && (
           <div className="p-6 bg-gray-50 border-t border-gray-200">
             <h2 className="text-lg font-semibold text-gray-700 mb-4">
               Receipt Image
             </h2>
             <div className="bg-white p-2 rounded-lg shadow-sm border border-gray-200 inline-block">
               <img
-                src={receipt.imageUrl}
+                src={receiptImageUrl}
                 alt="Receipt"
                 className="max-h-64 object-contain"
               />